@@ -0,0 +1,207 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Optional
+
+from fastapi.responses import JSONResponse
+
+from .metrics import registry
+from .password_utils import HASH_WORKERS
+from .shared_counters import shared_counters
+
+# Правила классификации по префиксу пути, проверяются по порядку.
+# None - без контроля: потоки живых обновлений держат соединение часами, а /metrics
+# должен отвечать именно под нагрузкой
+ADMISSION_RULES = (
+    ("/metrics", None),
+    ("/api/live", None),
+    # Обновление и отзыв refresh-токена - без bcrypt; в класс входа попадает только сам вход
+    ("/api/token/", "interactive"),
+    ("/api/token", "auth"),
+    # Массовый импорт - секунды bcrypt; не должен занимать места интерактивных запросов
+    ("/api/users/bulk", "analytics"),
+    ("/api/stats", "analytics"),
+    ("/api/top", "analytics"),
+    ("/api/visits", "analytics"),
+    ("/api/collect", "analytics"),
+    # Файлы видео: поток держит место все время отдачи, поэтому у них свой небольшой лимит,
+    # чтобы просмотры не занимали места статики; список каталога - интерактивный
+    ("/api/videos/", "video"),
+    ("/api/", "interactive"),
+    ("/", "static"),
+)
+
+
+def _setting(name: str, option: str, default):
+    return type(default)(os.getenv(f"KKO_ADMISSION_{name.upper()}_{option}", str(default)))
+
+
+class AdmissionRejected(Exception):
+    """
+    Запрос отклонен без выполнения: очередь класса полна или истек срок ожидания.
+    """
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class AdmissionClass:
+    """
+    Класс приоритета: не больше limit запросов одновременно, не больше queue_size в очереди,
+    в очереди - не дольше deadline секунд. Освободившееся место передается первому
+    в очереди напрямую, поэтому новые запросы не обгоняют ждущих.
+    """
+
+    def __init__(self, name: str, limit: int, queue_size: int, deadline: float, status_code: int = 503):
+        self.name = name
+        self.limit = _setting(name, "LIMIT", limit)
+        self.queue_size = _setting(name, "QUEUE", queue_size)
+        self.deadline = _setting(name, "DEADLINE", deadline)
+        self.status_code = status_code
+        self.retry_after = max(1, math.ceil(self.deadline))
+        self.active = 0
+        self._waiters = deque()
+
+        # Метрики
+        self.admitted = 0
+        self.shed = {"queue_full": 0, "deadline": 0}
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _expire(self, waiter: asyncio.Future):
+        if not waiter.done():
+            self._waiters.remove(waiter)
+            waiter.set_result(False)
+
+    async def acquire(self) -> float:
+        """
+        Занимает место в классе, при необходимости дожидаясь его в очереди.
+        Returns:
+            float: Время ожидания в очереди, секунды
+        Raises:
+            AdmissionRejected: Очередь полна или место не освободилось за deadline
+        """
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return 0.0
+        if len(self._waiters) >= self.queue_size:
+            self._reject("queue_full")
+
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        timer = loop.call_later(self.deadline, self._expire, waiter)
+        try:
+            granted = await waiter
+        except asyncio.CancelledError:
+            # Клиент ушел: место, которое успели передать, возвращаем следующему
+            if waiter.done() and not waiter.cancelled() and waiter.result():
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+        finally:
+            timer.cancel()
+        if not granted:
+            self._reject("deadline")
+        self.admitted += 1
+        return time.perf_counter() - started
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # Место переходит к ждущему, счетчик active не меняется
+                waiter.set_result(True)
+                return
+        self.active -= 1
+
+    def _reject(self, reason: str):
+        self.shed[reason] += 1
+        registry.inc("kko_admission_shed_total", (self.name, reason))
+        shared_counters.add("requests_shed")
+        raise AdmissionRejected(reason)
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "queue_size": self.queue_size,
+            "deadline": self.deadline,
+            "active": self.active,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+        }
+
+
+class AdmissionController:
+    """
+    Классы приоритета с раздельными лимитами: всплеск входов (bcrypt) или тяжелой
+    аналитики упирается в лимит своего класса и не задерживает /api/users/me и статику.
+    Лимиты действуют в пределах воркера.
+    """
+
+    def __init__(self, classes: list, rules: tuple = ADMISSION_RULES):
+        self.classes = {admission_class.name: admission_class for admission_class in classes}
+        self.rules = rules
+
+    def classify(self, path: str) -> Optional[AdmissionClass]:
+        for prefix, name in self.rules:
+            if path.startswith(prefix):
+                return self.classes[name] if name is not None else None
+        return None
+
+    def stats(self) -> dict:
+        return {name: admission_class.stats() for name, admission_class in self.classes.items()}
+
+
+admission = AdmissionController([
+    # Вход упирается в пул bcrypt; 429 - сигнал клиенту повторить позже, а не ошибка сервера
+    AdmissionClass("auth", limit=HASH_WORKERS * 2, queue_size=32, deadline=3.0, status_code=429),
+    # Короткий срок ожидания держит хвост задержек интерактивных запросов
+    AdmissionClass("interactive", limit=64, queue_size=128, deadline=0.5),
+    AdmissionClass("analytics", limit=8, queue_size=32, deadline=2.0),
+    AdmissionClass("static", limit=256, queue_size=512, deadline=1.0),
+    AdmissionClass("video", limit=16, queue_size=16, deadline=2.0),
+])
+
+
+class AdmissionMiddleware:
+    """
+    ASGI-middleware контроля допуска: перегруженный класс отвечает сразу 429/503
+    с Retry-After, а не копит запросы до таймаута клиента.
+    """
+
+    def __init__(self, app, controller: AdmissionController = admission):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        admission_class = self.controller.classify(scope["path"])
+        if admission_class is None:
+            return await self.app(scope, receive, send)
+
+        try:
+            waited = await admission_class.acquire()
+        except AdmissionRejected:
+            response = JSONResponse(
+                status_code=admission_class.status_code,
+                content={"detail": "Server is busy, try again later"},
+                headers={"Retry-After": str(admission_class.retry_after)},
+            )
+            return await response(scope, receive, send)
+
+        registry.observe("kko_admission_wait_seconds", (admission_class.name,), waited)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission_class.release()
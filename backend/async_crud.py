@@ -0,0 +1,172 @@
+import os
+from datetime import datetime, timezone
+from typing import Optional
+from sqlalchemy import delete, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import db_models, schemas
+from .async_database import async_write_transaction
+from .password_utils import get_password_hash_async, get_password_hashes_async
+from .logger import logger, log_error
+from .crud import statistics_queries, statistics_result
+
+# Сколько пользователей принимает один запрос импорта
+USER_IMPORT_MAX = int(os.getenv("KKO_USER_IMPORT_MAX", "5000"))
+
+
+async def get_user(db: AsyncSession, username: str):
+    try:
+        result = await db.execute(
+            select(db_models.User).where(db_models.User.username == username).limit(1)
+        )
+        return result.scalars().first()
+    except Exception as e:
+        log_error(e, "Error getting user by username: %s" % username)
+        raise
+
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    try:
+        result = await db.execute(
+            select(db_models.User).where(db_models.User.email == email).limit(1)
+        )
+        return result.scalars().first()
+    except Exception as e:
+        log_error(e, "Error getting user by email: %s" % email)
+        raise
+
+
+async def get_users(db: AsyncSession, cursor: Optional[int] = None, limit: int = 100):
+    """
+    Асинхронный вариант crud.get_users (keyset-пагинация по id).
+    """
+    try:
+        stmt = select(db_models.User)
+        if cursor is not None:
+            stmt = stmt.where(db_models.User.id > cursor)
+        users = (await db.execute(stmt.order_by(db_models.User.id).limit(limit + 1))).scalars().all()
+        next_cursor = users[limit - 1].id if len(users) > limit else None
+        return users[:limit], next_cursor
+    except Exception as e:
+        log_error(e, "Error getting users list")
+        raise
+
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    try:
+        hashed_password = await get_password_hash_async(user.password)
+        db_user = db_models.User(
+            username=user.username,
+            email=user.email,
+            hashed_password=hashed_password,
+            role=user.role,
+        )
+        # Хеширование - до блокировки: писатели других воркеров не ждут bcrypt
+        async with async_write_transaction(db):
+            db.add(db_user)
+            await db.commit()
+        await db.refresh(db_user)
+        logger.info("Created new user: %s", user.username)
+        return db_user
+    except Exception as e:
+        await db.rollback()
+        log_error(e, "Error creating user: %s" % user.username)
+        raise
+
+
+async def import_users(db: AsyncSession, users: list) -> tuple:
+    """
+    Массовое создание пользователей: одна проверка занятых имен и email,
+    параллельное хеширование паролей и вставка одной транзакцией.
+    Args:
+        users: Пары (номер записи в запросе, schemas.UserCreate)
+    Returns:
+        tuple: Созданные пользователи и ошибки по записям [{"index", "username", "error"}]
+    """
+    try:
+        taken = (await db.execute(
+            select(db_models.User.username, db_models.User.email).where(or_(
+                db_models.User.username.in_({user.username for _, user in users}),
+                db_models.User.email.in_({user.email for _, user in users}),
+            ))
+        )).all()
+        taken_usernames = {row.username for row in taken}
+        taken_emails = {row.email for row in taken}
+
+        accepted, errors = [], []
+        for index, user in users:
+            # Дубликаты внутри пачки ловятся тем же множеством
+            if user.username in taken_usernames:
+                errors.append({"index": index, "username": user.username, "error": "Username already registered"})
+            elif user.email in taken_emails:
+                errors.append({"index": index, "username": user.username, "error": "Email already registered"})
+            else:
+                taken_usernames.add(user.username)
+                taken_emails.add(user.email)
+                accepted.append(user)
+
+        hashes = await get_password_hashes_async([user.password for user in accepted])
+        db_users = [
+            db_models.User(username=user.username, email=user.email, hashed_password=hashed, role=user.role)
+            for user, hashed in zip(accepted, hashes)
+        ]
+        async with async_write_transaction(db):
+            db.add_all(db_users)
+            await db.commit()
+        logger.info("Imported %s users, %s rejected", len(db_users), len(errors))
+        return db_users, errors
+    except Exception as e:
+        await db.rollback()
+        log_error(e, "Error importing users")
+        raise
+
+
+async def revoke_token(db: AsyncSession, token_id: str, expires_at: float) -> bool:
+    """
+    Записывает отзыв id токена; заодно удаляет отзывы уже истекших токенов.
+    Returns:
+        bool: False, если id уже был отозван (refresh-токен использован повторно)
+    """
+    now = datetime.now(timezone.utc)
+    try:
+        async with async_write_transaction(db):
+            await db.execute(delete(db_models.RevokedToken).where(db_models.RevokedToken.expires_at < now))
+            db.add(db_models.RevokedToken(
+                token_id=token_id,
+                expires_at=datetime.fromtimestamp(expires_at, timezone.utc),
+                revoked_at=now,
+            ))
+            await db.commit()
+        return True
+    except IntegrityError:
+        await db.rollback()
+        return False
+    except Exception as e:
+        await db.rollback()
+        log_error(e, "Error revoking token")
+        raise
+
+
+async def get_visit_statistics(
+    db: AsyncSession,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    granularity: str = "day",
+    page: Optional[str] = None,
+):
+    """
+    Асинхронный вариант crud.get_visit_statistics.
+    """
+    try:
+        queries = statistics_queries(date_from, date_to, granularity, page)
+        return statistics_result(
+            by_date=(await db.execute(queries["by_date"])).all(),
+            visitor_sketches=(await db.execute(queries["visitor_sketches"])).all(),
+            unique_pages=await db.scalar(queries["unique_pages"]),
+            by_device=(await db.execute(queries["by_device"])).all(),
+            by_browser=(await db.execute(queries["by_browser"])).all(),
+            granularity=granularity,
+        )
+    except Exception as e:
+        log_error(e, "Error getting visit statistics")
+        raise
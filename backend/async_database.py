@@ -0,0 +1,72 @@
+from contextlib import asynccontextmanager
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from .database import DB_PATH, DB_PROFILE, READ_POOL_SIZE, connection_pragmas, write_lock
+
+ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{DB_PATH}"
+
+
+def _create_async_engine(read_only: bool):
+    if DB_PROFILE != "production":
+        return create_async_engine(ASYNC_DATABASE_URL)
+
+    # Тот же профиль, что и у синхронного движка: один писатель и пул читателей
+    engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=READ_POOL_SIZE if read_only else 1,
+        max_overflow=0,
+    )
+    pragmas = connection_pragmas(read_only)
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_pragmas(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return engine
+
+
+ASYNC_ENGINE = _create_async_engine(read_only=False)
+ASYNC_READ_ENGINE = _create_async_engine(read_only=True) if DB_PROFILE == "production" else ASYNC_ENGINE
+
+ASYNC_SESSIONLOCAL = async_sessionmaker(
+    bind=ASYNC_ENGINE, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+ASYNC_READ_SESSIONLOCAL = async_sessionmaker(
+    bind=ASYNC_READ_ENGINE, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+# Dependency: асинхронная сессия на запись
+async def get_async_db():
+    async with ASYNC_SESSIONLOCAL() as db:
+        yield db
+
+# Dependency: асинхронная сессия только для чтения
+async def get_async_read_db():
+    async with ASYNC_READ_SESSIONLOCAL() as db:
+        yield db
+
+
+@asynccontextmanager
+async def async_write_transaction(db: AsyncSession):
+    """
+    Асинхронный вариант database.write_transaction: транзакция чтения сессии
+    закрывается до ожидания write_lock, ожидание не блокирует цикл событий
+    и безопасно при отмене задачи.
+    """
+    if db.in_transaction():
+        await db.commit()
+    async with write_lock.hold():
+        yield db
+
+
+async def dispose_async_engines():
+    await ASYNC_ENGINE.dispose()
+    if ASYNC_READ_ENGINE is not ASYNC_ENGINE:
+        await ASYNC_READ_ENGINE.dispose()
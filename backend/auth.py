@@ -1,42 +1,41 @@
+import os
+import secrets
 from datetime import datetime, timedelta, UTC
 from typing import Optional
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from . import crud, schemas
-from .database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import async_crud, schemas
+from .async_database import ASYNC_READ_SESSIONLOCAL, get_async_read_db
 from .logger import logger
-from .password_utils import verify_password
+from .password_utils import verify_password_async
+from .revocation import revocations
+from .user_cache import token_cache
 
 # Настройки безопасности
 SECRET_KEY = "your-secret-key"  # В продакшене использовать переменные окружения
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Короткий access-токен: отзыв семейства все равно проверяется на каждом запросе,
+# но клиент ходит за новым через refresh-токен
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("KKO_ACCESS_TOKEN_MINUTES", "15"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("KKO_REFRESH_TOKEN_DAYS", "14"))
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def authenticate_user(db: Session, username: str, password: str):
-    logger.info(f"Starting authentication for user: {username}")
-    
-    user = crud.get_user(db, username)
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await async_crud.get_user(db, username)
     if not user:
-        logger.warning(f"User not found in database: {username}")
+        logger.warning("User not found in database: %s", username)
         return False
-    
-    logger.info(f"User found: {user.username}, role: {user.role}")
-    logger.info(f"Attempting to verify password for user: {username}")
-    
-    # Добавляем отладку для проверки пароля
-    is_valid = verify_password(password, user.hashed_password)
-    logger.info(f"Password verification result: {is_valid}")
-    logger.info(f"Stored hash: {user.hashed_password}")
-    
+
+    # Хеш пароля и результат проверки в лог не пишем
+    is_valid = await verify_password_async(password, user.hashed_password)
     if not is_valid:
-        logger.warning(f"Invalid password for user: {username}")
+        logger.warning("Invalid password for user: %s", username)
         return False
-    
-    logger.info(f"Authentication successful for user: {username}")
+
+    logger.debug("Authentication successful for user: %s, role: %s", username, user.role)
     return user
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -49,25 +48,105 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-):
+def create_token_pair(username: str, family: Optional[str] = None) -> dict:
+    """
+    Выдает access- и refresh-токен одного семейства (fam).
+    Семейство заводится при входе и сохраняется при каждой ротации refresh-токена,
+    поэтому выход или повторное использование refresh-токена отзывает всю цепочку.
+    Args:
+        username: Имя пользователя
+        family: Семейство токенов; None - новый вход
+    Returns:
+        dict: Ответ в формате schemas.Token
+    """
+    family = family or secrets.token_urlsafe(16)
+    access_token = create_access_token(
+        data={"sub": username, "type": "access", "fam": family},
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+    )
+    refresh_token = create_access_token(
+        data={"sub": username, "type": "refresh", "fam": family, "jti": secrets.token_urlsafe(16)},
+        expires_delta=timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    )
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
+def decode_refresh_token(token: str) -> Optional[dict]:
+    """
+    Проверяет подпись и срок refresh-токена.
+    Returns:
+        Optional[dict]: Полезная нагрузка или None, если токен недействителен или отозван
+    """
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("type") != "refresh" or not payload.get("sub") or not payload.get("jti"):
+        return None
+    if revocations.is_revoked(payload.get("fam")):
+        return None
+    return payload
+
+async def user_from_token(db: AsyncSession, token: str):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    # Токен уже проверялся и пользователь не менялся - обходимся без запроса к базе.
+    # Отзыв семейства проверяется и здесь: он не меняет поколение кэша
+    cached = token_cache.get(token)
+    if cached is not None:
+        cached_user, family = cached
+        if not revocations.is_revoked(family):
+            return cached_user
+    generation = token_cache.generation
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
+        # Токены без type выданы до появления refresh-токенов и считаются access
+        if payload.get("type", "access") != "access":
+            raise credentials_exception
+        # Отзыв проверяется в памяти, без запроса к базе
+        if revocations.is_revoked(payload.get("fam")):
+            raise credentials_exception
         token_data = schemas.TokenData(username=username)
     except JWTError as exc:
         raise credentials_exception from exc
 
-    user = crud.get_user(db, username=token_data.username)
+    user = await async_crud.get_user(db, username=token_data.username)
     if user is None:
         raise credentials_exception
-    return user
+
+    snapshot = schemas.User.model_validate(user)
+    token_cache.put(token, snapshot, payload["exp"], payload.get("fam"), generation)
+    return snapshot
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    return await user_from_token(db, token)
+
+async def authenticate_stream_token(token: Optional[str]):
+    """
+    Пользователь по access-токену из query-параметра для WebSocket и Server-Sent Events:
+    браузерные WebSocket и EventSource не умеют передавать заголовок Authorization.
+    Сессия открывается только на время проверки, а не на все время потока.
+    Returns:
+        schemas.User или None, если токен отсутствует или недействителен
+    """
+    if not token:
+        return None
+    try:
+        async with ASYNC_READ_SESSIONLOCAL() as db:
+            return await user_from_token(db, token)
+    except HTTPException:
+        return None
@@ -0,0 +1,77 @@
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from pydantic import ValidationError
+
+from .schemas import CollectEvent
+
+# Ограничения /api/collect (переопределяются переменными окружения)
+COLLECT_MAX_EVENTS = int(os.getenv("KKO_COLLECT_MAX_EVENTS", "500"))
+COLLECT_MAX_BYTES = int(os.getenv("KKO_COLLECT_MAX_BYTES", str(1024 * 1024)))
+# Service worker копит события офлайн; более старые не принимаем
+COLLECT_MAX_AGE_HOURS = int(os.getenv("KKO_COLLECT_MAX_AGE_HOURS", "168"))
+# Часы клиента могут спешить
+COLLECT_CLOCK_SKEW_SECONDS = int(os.getenv("KKO_COLLECT_CLOCK_SKEW_SECONDS", "300"))
+# Сколько помнить id принятых событий (не меньше COLLECT_MAX_AGE_HOURS)
+COLLECT_DEDUPE_HOURS = max(int(os.getenv("KKO_COLLECT_DEDUPE_HOURS", "192")), COLLECT_MAX_AGE_HOURS)
+
+
+class CollectPayloadError(ValueError):
+    """
+    Тело запроса нельзя разобрать как пачку событий.
+    """
+
+
+def parse_events(
+    body: bytes,
+    user_agent: Optional[str],
+    visitor: Optional[str],
+    now: Optional[datetime] = None,
+) -> tuple:
+    """
+    Разбирает и проверяет пачку событий: {"events": [...]} или просто список.
+    Некорректные события отклоняются по отдельности, чтобы одна ошибка
+    не заставляла клиента бесконечно переотправлять всю пачку.
+    Returns:
+        tuple: (строки посещений для вставки, отклоненные события [{"index", "error"}])
+    """
+    try:
+        payload = json.loads(body)
+    except ValueError as e:
+        raise CollectPayloadError(f"Invalid JSON: {e}")
+    events = payload.get("events") if isinstance(payload, dict) else payload
+    if not isinstance(events, list):
+        raise CollectPayloadError("Expected a list of events")
+    if len(events) > COLLECT_MAX_EVENTS:
+        raise CollectPayloadError(f"Too many events: {len(events)} > {COLLECT_MAX_EVENTS}")
+
+    now = now or datetime.now(timezone.utc)
+    oldest = now - timedelta(hours=COLLECT_MAX_AGE_HOURS)
+    newest = now + timedelta(seconds=COLLECT_CLOCK_SKEW_SECONDS)
+    rows, rejected, seen = [], [], set()
+    for index, item in enumerate(events):
+        try:
+            event = CollectEvent.model_validate(item)
+        except ValidationError as e:
+            error = e.errors()[0]
+            rejected.append({"index": index, "error": f"{'.'.join(map(str, error['loc']))}: {error['msg']}"})
+            continue
+        moment = event.ts if event.ts.tzinfo is not None else event.ts.replace(tzinfo=timezone.utc)
+        if not oldest <= moment <= newest:
+            rejected.append({"index": index, "error": "ts: out of accepted range"})
+            continue
+        # Повтор внутри пачки просто пропускаем; повторы между пачками отсекает база
+        if event.id in seen:
+            continue
+        seen.add(event.id)
+        rows.append({
+            "event_id": event.id,
+            "page_url": event.page_url,
+            "referrer": event.referrer,
+            "user_agent": user_agent,
+            "visit_time": moment.astimezone(timezone.utc),
+            "visitor": visitor,
+        })
+    return rows, rejected
@@ -1,9 +1,24 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-from . import db_models, schemas
+from sqlalchemy import delete, func, insert, select
+from . import db_models, partitions, rollups, schemas, visit_dimensions
 from .password_utils import get_password_hash
 from .logger import logger, log_error
-from .db_models import Visit
+from .db_models import (
+    CollectedEvent, PageUrl, Referrer, UserAgent, Visit,
+    VisitDailyAgentRollup, VisitDailyRollup, VisitDailySketch, VisitHourlyRollup,
+    VisitPageDailyRollup, VisitPageDailySketch,
+)
+from .hll import HyperLogLog
+from .stats_cache import stats_cache
+
+STATS_GRANULARITIES = ("hour", "day", "week")
+
+# Серверный учет посещений в middleware: pages - только страницы, all - также вызовы /api/,
+# off - ничего (страницы считает сам PWA через /api/collect). Статика не считается никогда.
+SERVER_VISIT_LOGGING = os.getenv("KKO_SERVER_VISIT_LOGGING", "pages")
 
 
 def get_user(db: Session, username: str):
@@ -24,9 +39,21 @@ def get_user_by_email(db: Session, email: str):
         raise
 
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
+def get_users(db: Session, cursor: Optional[int] = None, limit: int = 100):
+    """
+    Страница пользователей по возрастанию id (keyset-пагинация).
+    Args:
+        cursor: id последнего пользователя предыдущей страницы
+    Returns:
+        tuple: Список пользователей и курсор следующей страницы (None, если страниц больше нет)
+    """
     try:
-        return db.query(db_models.User).offset(skip).limit(limit).all()
+        query = db.query(db_models.User)
+        if cursor is not None:
+            query = query.filter(db_models.User.id > cursor)
+        users = query.order_by(db_models.User.id).limit(limit + 1).all()
+        next_cursor = users[limit - 1].id if len(users) > limit else None
+        return users[:limit], next_cursor
     except Exception as e:
         log_error(e, "Error getting users list")
         raise
@@ -52,44 +79,337 @@ def create_user(db: Session, user: schemas.UserCreate):
         raise
 
 
+def should_log_visit(page_url: str, mode: str = SERVER_VISIT_LOGGING) -> bool:
+    if mode == "off" or page_url.startswith('/static/') or page_url == '/metrics':
+        return False
+    return mode == "all" or not page_url.startswith('/api/')
+
+
+def insert_visits(db: Session, rows: list):
+    """
+    Записывает посещения через справочники и обновляет агрегаты, без коммита.
+    Args:
+        rows: Список словарей с page_url, referrer, user_agent, visit_time
+    """
+    db.execute(insert(Visit), visit_dimensions.intern_rows(db, rows))
+    rollups.apply_visits(db, rows)
+
+
+def insert_collected(db: Session, rows: list, dedupe_hours: int) -> tuple:
+    """
+    Записывает события /api/collect, пропуская id, уже принятые раньше, без коммита.
+    Вызывающий держит блокировку записи, поэтому проверка и вставка id не гоняются.
+    Args:
+        rows: Строки из collect.parse_events (с event_id)
+        dedupe_hours: Сколько хранить id принятых событий
+    Returns:
+        tuple: (принято, повторы)
+    """
+    now = datetime.now(timezone.utc)
+    db.execute(delete(CollectedEvent).where(CollectedEvent.received_at < now - timedelta(hours=dedupe_hours)))
+    if not rows:
+        return 0, 0
+    seen = set(db.scalars(
+        select(CollectedEvent.id).where(CollectedEvent.id.in_([row["event_id"] for row in rows]))
+    ))
+    fresh = [row for row in rows if row["event_id"] not in seen]
+    if fresh:
+        db.execute(insert(CollectedEvent), [{"id": row["event_id"], "received_at": now} for row in fresh])
+        insert_visits(db, fresh)
+    return len(fresh), len(rows) - len(fresh)
+
+
+def collect_visits(db: Session, rows: list, dedupe_hours: int) -> tuple:
+    """
+    Записывает пачку событий /api/collect одной транзакцией (см. insert_collected).
+    Вызывается через database.run_write, под блокировкой записи.
+    """
+    try:
+        accepted, duplicates = insert_collected(db, rows, dedupe_hours)
+        db.commit()
+        if accepted:
+            stats_cache.advance()
+        return accepted, duplicates
+    except Exception as e:
+        db.rollback()
+        visit_dimensions.clear_caches()
+        log_error(e, "Error collecting client page views")
+        raise
+
+
 def log_visit(db: Session, page_url: str, referrer: str, user_agent: str):
+    if should_log_visit(page_url):
+        row = {
+            "page_url": page_url,
+            "referrer": referrer,
+            "user_agent": user_agent,
+            "visit_time": datetime.now(timezone.utc),
+        }
+        return log_visits_bulk(db, [row])
+    return 0
+
+
+def log_visits_bulk(db: Session, rows: list):
+    """
+    Вставляет пачку посещений одной транзакцией.
+    Args:
+        rows: Список словарей с page_url, referrer, user_agent, visit_time
+    """
+    if not rows:
+        return 0
     try:
-        if not page_url.startswith('/static/'):
-            visit = Visit(page_url=page_url, referrer=referrer, user_agent=user_agent)
-            db.add(visit)
-            db.commit()
-            db.refresh(visit)
-            return visit
+        insert_visits(db, rows)
+        db.commit()
+        stats_cache.advance()
+        return len(rows)
     except Exception as e:
-        log_error(e, "Error log visits")
+        db.rollback()
+        visit_dimensions.clear_caches()
+        log_error(e, "Error bulk log visits")
         raise
 
-"""
-def get_visits(db: Session, skip: int = 0, limit: int = 10):
-    return db.query(Visit).offset(skip).limit(limit).all()
-"""
 
+def _visit_filters(
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    page_prefix: Optional[str] = None,
+):
+    filters = []
+    if date_from is not None:
+        filters.append(Visit.visit_time >= date_from)
+    if date_to is not None:
+        filters.append(Visit.visit_time < date_to)
+    if page_prefix:
+        filters.append(PageUrl.value.startswith(page_prefix, autoescape=True))
+    return filters
+
+
+def _visit_rows():
+    # Посещение вместе со строками из справочников, в прежнем виде для API и выгрузки
+    return (
+        select(
+            Visit.id,
+            PageUrl.value.label("page_url"),
+            Referrer.value.label("referrer"),
+            UserAgent.value.label("user_agent"),
+            Visit.visit_time,
+        )
+        .select_from(Visit)
+        .outerjoin(PageUrl, PageUrl.id == Visit.page_url_id)
+        .outerjoin(Referrer, Referrer.id == Visit.referrer_id)
+        .outerjoin(UserAgent, UserAgent.id == Visit.user_agent_id)
+    )
 
-def get_visit_statistics(db: Session):
+
+def get_visits(
+    db: Session,
+    cursor: Optional[int] = None,
+    limit: int = 100,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    page_prefix: Optional[str] = None,
+):
     """
-    Возвращает агрегированные данные по посещениям.
+    Возвращает страницу посещений от новых к старым (keyset-пагинация по id).
+    Когда горячие посещения заканчиваются, страница дочитывается из архивных секций.
+    Args:
+        cursor: id последнего посещения предыдущей страницы
+    Returns:
+        tuple: Список посещений и курсор следующей страницы (None, если страниц больше нет)
     """
     try:
-        total = db.query(Visit).count()
-        pages = db.query(Visit.page_url).distinct().count()
+        stmt = _visit_rows().where(*_visit_filters(date_from, date_to, page_prefix))
+        if cursor is not None:
+            stmt = stmt.where(Visit.id < cursor)
+        visits = db.execute(stmt.order_by(Visit.id.desc()).limit(limit + 1)).all()
+        if len(visits) <= limit:
+            # Архивные id всегда меньше горячих, поэтому порядок по id сохраняется
+            archived_cursor = visits[-1].id if visits else cursor
+            visits += partitions.archived_page(
+                db, archived_cursor, limit + 1 - len(visits), date_from, date_to, page_prefix
+            )
+        next_cursor = visits[limit - 1].id if len(visits) > limit else None
+        return visits[:limit], next_cursor
+    except Exception as e:
+        log_error(e, "Error getting visits page")
+        raise
 
+
+def iter_visits(
+    db: Session,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    page_prefix: Optional[str] = None,
+    chunk_size: int = 1000,
+):
+    """
+    Построчно отдает посещения из курсора базы, не загружая выборку в память целиком.
+    Архивные секции читаются первыми, по одной.
+    """
+    yield from partitions.iter_archived_visits(db, date_from, date_to, page_prefix)
+    stmt = (
+        _visit_rows()
+        .where(*_visit_filters(date_from, date_to, page_prefix))
+        .order_by(Visit.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    for partition in db.execute(stmt).partitions():
+        yield from partition
+
+
+def _day_bounds(date_from: Optional[datetime], date_to: Optional[datetime]):
+    # Суточные агрегаты: день попадает в период, если период его задевает
+    date_from, date_to = partitions.naive_utc(date_from), partitions.naive_utc(date_to)
+    first = date_from.date() if date_from is not None else None
+    last = None
+    if date_to is not None:
+        last = date_to.date() if date_to.time() != datetime.min.time() else date_to.date() - timedelta(days=1)
+    return first, last
+
+
+def statistics_queries(
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    granularity: str = "day",
+    page: Optional[str] = None,
+) -> dict:
+    """
+    Запросы к агрегатам для get_visit_statistics (общие для синхронного и асинхронного слоя).
+    Разбивки по страницам и устройствам считаются по суткам, ряд по времени - с точностью granularity.
+    Уникальные посетители - по суточным скетчам всего сайта или страницы page.
+    """
+    first, last = _day_bounds(date_from, date_to)
+
+    def in_range(column):
+        filters = []
+        if first is not None:
+            filters.append(column >= first)
+        if last is not None:
+            filters.append(column <= last)
+        return filters
+
+    def breakdown(column):
+        total = func.sum(VisitDailyAgentRollup.visits)
+        return (
+            select(column, total)
+            .where(*in_range(VisitDailyAgentRollup.day))
+            .group_by(column)
+            .order_by(total.desc())
+        )
+
+    if granularity == "hour":
+        hour_filters = []
+        if date_from is not None:
+            hour_filters.append(VisitHourlyRollup.hour >= partitions.naive_utc(date_from))
+        if date_to is not None:
+            hour_filters.append(VisitHourlyRollup.hour < partitions.naive_utc(date_to))
         by_date = (
-            db.query(text("DATE(visits.visit_time) as date"), text("COUNT(*) as count"))
-            .select_from(Visit)
-            .group_by(text("DATE(visits.visit_time)"))
-            .all()
+            select(VisitHourlyRollup.hour, VisitHourlyRollup.visits)
+            .where(*hour_filters)
+            .order_by(VisitHourlyRollup.hour)
+        )
+    else:
+        by_date = (
+            select(VisitDailyRollup.day, VisitDailyRollup.visits)
+            .where(*in_range(VisitDailyRollup.day))
+            .order_by(VisitDailyRollup.day)
         )
 
-        return {
-            "total_visits": total,
-            "unique_pages": pages,
-            "visits_by_date": [{"date": d[0], "count": d[1]} for d in by_date],
-        }
+    if page is not None:
+        visitor_sketches = select(VisitPageDailySketch.day, VisitPageDailySketch.registers).where(
+            VisitPageDailySketch.page_url == page, *in_range(VisitPageDailySketch.day)
+        )
+    else:
+        visitor_sketches = select(VisitDailySketch.day, VisitDailySketch.registers).where(
+            *in_range(VisitDailySketch.day)
+        )
+
+    return {
+        "by_date": by_date,
+        "visitor_sketches": visitor_sketches,
+        "unique_pages": select(func.count(VisitPageDailyRollup.page_url.distinct()))
+        .where(*in_range(VisitPageDailyRollup.day)),
+        "by_device": breakdown(VisitDailyAgentRollup.device),
+        "by_browser": breakdown(VisitDailyAgentRollup.browser),
+    }
+
+
+def _week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def statistics_result(
+    by_date, unique_pages, by_device, by_browser, granularity: str = "day", visitor_sketches=(),
+) -> dict:
+    """
+    Собирает ответ статистики. Уникальные посетители за период и за каждый день или неделю
+    считаются объединением суточных скетчей HyperLogLog; для ряда по часам - только за период.
+    """
+    if granularity == "week":
+        weeks = {}
+        for day, count in by_date:
+            week = _week_start(day)
+            weeks[week] = weeks.get(week, 0) + count
+        by_date = list(weeks.items())
+
+    bucket = _week_start if granularity == "week" else (lambda day: day)
+    total_sketch = HyperLogLog()
+    bucket_sketches = {}
+    for day, registers in visitor_sketches:
+        sketch = HyperLogLog(registers)
+        total_sketch.merge(sketch)
+        if granularity != "hour":
+            key = bucket(day)
+            if key in bucket_sketches:
+                bucket_sketches[key].merge(sketch)
+            else:
+                bucket_sketches[key] = sketch
+    visitors_by_bucket = {key: sketch.count() for key, sketch in bucket_sketches.items()}
+
+    visits_by_date = []
+    for moment, count in by_date:
+        entry = {"date": moment.isoformat(), "count": count}
+        if granularity != "hour":
+            entry["visitors"] = visitors_by_bucket.get(moment, 0)
+        visits_by_date.append(entry)
+
+    return {
+        "total_visits": sum(count for _, count in by_date),
+        "unique_pages": unique_pages,
+        "unique_visitors": {
+            "count": total_sketch.count(),
+            "relative_error": round(total_sketch.relative_error, 4),
+        },
+        "granularity": granularity,
+        "visits_by_date": visits_by_date,
+        "visits_by_device": [{"device": d[0], "count": d[1]} for d in by_device],
+        "visits_by_browser": [{"browser": b[0], "count": b[1]} for b in by_browser],
+    }
+
+
+def get_visit_statistics(
+    db: Session,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    granularity: str = "day",
+    page: Optional[str] = None,
+):
+    """
+    Возвращает агрегированные данные по посещениям.
+    Читает только предрассчитанные агрегаты, а не сырую таблицу visits.
+    Args:
+        page: Считать уникальных посетителей только этой страницы
+    """
+    try:
+        queries = statistics_queries(date_from, date_to, granularity, page)
+        return statistics_result(
+            by_date=db.execute(queries["by_date"]).all(),
+            visitor_sketches=db.execute(queries["visitor_sketches"]).all(),
+            unique_pages=db.execute(queries["unique_pages"]).scalar(),
+            by_device=db.execute(queries["by_device"]).all(),
+            by_browser=db.execute(queries["by_browser"]).all(),
+            granularity=granularity,
+        )
     except Exception as e:
         log_error(e, "Error getting visit statistics")
         raise
@@ -1,26 +1,122 @@
 import os
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 
+from .process_lock import FileLock
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, ".."))
-DB_PATH = os.path.join(PROJECT_ROOT, "kko_site.db")
+DB_PATH = os.getenv("KKO_DB_PATH", os.path.join(PROJECT_ROOT, "kko_site.db"))
 
 SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_PATH}"
 
-ENGINE = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Профиль движка: "production" - WAL и настроенные pragma, "default" - настройки SQLite по умолчанию
+DB_PROFILE = os.getenv("KKO_DB_PROFILE", "production")
+SQLITE_SYNCHRONOUS = os.getenv("KKO_SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_SIZE_KB = int(os.getenv("KKO_SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("KKO_SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("KKO_SQLITE_BUSY_TIMEOUT_MS", "5000"))
+READ_POOL_SIZE = int(os.getenv("KKO_DB_READ_POOL_SIZE", "8"))
+
+
+def connection_pragmas(read_only: bool) -> list:
+    pragmas = [
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+        f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}",
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only=ON")
+    else:
+        pragmas += ["PRAGMA journal_mode=WAL", f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}"]
+    return pragmas
+
+
+def _create_engine(read_only: bool):
+    if DB_PROFILE != "production":
+        return create_engine(
+            SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+        )
+
+    # Писатель один: SQLite все равно сериализует запись, а очередь на пуле
+    # дешевле, чем ожидание блокировки внутри базы. Читатели в WAL не мешают писателю.
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        pool_size=READ_POOL_SIZE if read_only else 1,
+        max_overflow=0,
+    )
+    pragmas = connection_pragmas(read_only)
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return engine
+
+
+ENGINE = _create_engine(read_only=False)
+READ_ENGINE = _create_engine(read_only=True) if DB_PROFILE == "production" else ENGINE
+
 SESSIONLOCAL = sessionmaker(autocommit=False, autoflush=False, bind=ENGINE)
+READ_SESSIONLOCAL = sessionmaker(autocommit=False, autoflush=False, bind=READ_ENGINE)
+
+# Воркеры пишут по очереди: SQLite допускает одного писателя,
+# а ожидание на файловой блокировке дешевле, чем busy_timeout внутри базы
+write_lock = FileLock(DB_PATH + ".write.lock")
+
+
+def run_write(func, *args):
+    """
+    Выполняет func(db, *args) в новой сессии записи под write_lock; коммит делает func.
+    Захват, транзакция и освобождение идут в одном потоке: если задачу, ждущую
+    asyncio.to_thread(run_write, ...), отменят, поток все равно освободит блокировку.
+    Returns:
+        Результат func
+    """
+    with write_lock:
+        db = SESSIONLOCAL()
+        try:
+            return func(db, *args)
+        finally:
+            db.close()
+
+
+@contextmanager
+def write_transaction(db: Session):
+    """
+    with write_transaction(db): ... - транзакция записи в уже открытой сессии под write_lock.
+    Незавершенная транзакция чтения сессии закрывается до ожидания блокировки:
+    иначе сессия держала бы единственное соединение писателя, которого, возможно,
+    ждет владелец блокировки, - взаимная блокировка до таймаута пула.
+    Незакоммиченных изменений к этому моменту в сессии быть не должно.
+    """
+    if db.in_transaction():
+        db.commit()
+    with write_lock:
+        yield db
 
 Base = declarative_base()
 
-# Dependency
+# Dependency: сессия на запись (единственное соединение-писатель)
 def get_db():
     db = SESSIONLOCAL()
     try:
         yield db
     finally:
         db.close()
+
+# Dependency: сессия только для чтения из отдельного пула
+def get_read_db():
+    db = READ_SESSIONLOCAL()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -1,6 +1,6 @@
 import enum
 from datetime import datetime, timezone
-from sqlalchemy import Boolean, Column, Integer, String, Enum, DateTime
+from sqlalchemy import Boolean, Column, Integer, String, Enum, DateTime, Date, ForeignKey, LargeBinary
 from .database import Base
 
 class UserRole(str, enum.Enum):
@@ -17,11 +17,109 @@ class User(Base):
     role = Column(Enum(UserRole))
     is_active = Column(Boolean, default=True)
 
+# Справочники повторяющихся строк посещений: в visits хранятся только их id
+class PageUrl(Base):
+    __tablename__ = "page_urls"
+
+    id = Column(Integer, primary_key=True)
+    value = Column(String, unique=True, nullable=False)
+
+class Referrer(Base):
+    __tablename__ = "referrers"
+
+    id = Column(Integer, primary_key=True)
+    value = Column(String, unique=True, nullable=False)
+
+class UserAgent(Base):
+    __tablename__ = "user_agents"
+
+    id = Column(Integer, primary_key=True)
+    value = Column(String, unique=True, nullable=False)
+    # Результат классификации user_agents.classify
+    browser = Column(String)
+    os = Column(String)
+    device = Column(String)
+    is_bot = Column(Boolean)
+
 class Visit(Base):
     __tablename__ = "visits"
 
     id = Column(Integer, primary_key=True, index=True)
-    page_url = Column(String, index=True)
-    referrer = Column(String, nullable=True)
-    user_agent = Column(String)
-    visit_time = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    page_url_id = Column(Integer, ForeignKey("page_urls.id"), index=True)
+    referrer_id = Column(Integer, ForeignKey("referrers.id"), nullable=True)
+    user_agent_id = Column(Integer, ForeignKey("user_agents.id"))
+    visit_time = Column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)
+
+class VisitDailyRollup(Base):
+    __tablename__ = "visit_daily_rollups"
+
+    day = Column(Date, primary_key=True)
+    visits = Column(Integer, nullable=False, default=0)
+
+class VisitHourlyRollup(Base):
+    __tablename__ = "visit_hourly_rollups"
+
+    hour = Column(DateTime, primary_key=True)
+    visits = Column(Integer, nullable=False, default=0)
+
+class VisitPageDailyRollup(Base):
+    __tablename__ = "visit_page_daily_rollups"
+
+    day = Column(Date, primary_key=True)
+    page_url = Column(String, primary_key=True, index=True)
+    visits = Column(Integer, nullable=False, default=0)
+
+class VisitDailySketch(Base):
+    # Регистры HyperLogLog уникальных посетителей за день (backend.hll)
+    __tablename__ = "visit_daily_sketches"
+
+    day = Column(Date, primary_key=True)
+    registers = Column(LargeBinary, nullable=False)
+
+class VisitPageDailySketch(Base):
+    __tablename__ = "visit_page_daily_sketches"
+
+    day = Column(Date, primary_key=True)
+    page_url = Column(String, primary_key=True, index=True)
+    registers = Column(LargeBinary, nullable=False)
+
+class VisitDailyAgentRollup(Base):
+    __tablename__ = "visit_daily_agent_rollups"
+
+    day = Column(Date, primary_key=True)
+    device = Column(String, primary_key=True)
+    browser = Column(String, primary_key=True)
+    visits = Column(Integer, nullable=False, default=0)
+
+class VisitPartition(Base):
+    # Каталог секций посещений, вынесенных из visits в архивные файлы
+    __tablename__ = "visit_partitions"
+
+    key = Column(String, primary_key=True)
+    start = Column(DateTime, nullable=False)
+    end = Column(DateTime, nullable=False)
+    state = Column(String, nullable=False)  # archived | expired
+    rows = Column(Integer, nullable=False, default=0)
+    # Границы id в архиве: страница /api/visits читает только секцию, в которую попал курсор
+    min_id = Column(Integer)
+    max_id = Column(Integer)
+    archive_path = Column(String)
+    archived_at = Column(DateTime)
+
+class CollectedEvent(Base):
+    # Id принятых событий /api/collect: повторная отправка той же пачки не удваивает посещения
+    __tablename__ = "collected_events"
+
+    id = Column(String, primary_key=True)
+    received_at = Column(DateTime, nullable=False, index=True)
+
+class RevokedToken(Base):
+    # Отозванные jti refresh-токенов и семейства токенов; в памяти их держит backend.revocation
+    __tablename__ = "revoked_tokens"
+    # AUTOINCREMENT: воркеры дочитывают таблицу по id, и id удаленных строк не должны повторяться
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = Column(Integer, primary_key=True)
+    token_id = Column(String, unique=True, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    revoked_at = Column(DateTime, nullable=False)
@@ -0,0 +1,181 @@
+import asyncio
+import os
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional
+
+from . import crud, user_agents
+from .database import run_write
+from .logger import logger
+from .shared_counters import shared_counters
+from .top_n import top_tracker
+
+# Настройки очереди посещений (переопределяются переменными окружения)
+VISIT_QUEUE_MAXSIZE = int(os.getenv("KKO_VISIT_QUEUE_MAXSIZE", "10000"))
+VISIT_BATCH_SIZE = int(os.getenv("KKO_VISIT_BATCH_SIZE", "500"))
+VISIT_FLUSH_INTERVAL = float(os.getenv("KKO_VISIT_FLUSH_INTERVAL", "1.0"))
+VISIT_OVERFLOW_POLICY = os.getenv("KKO_VISIT_OVERFLOW_POLICY", "drop_newest")
+
+OVERFLOW_POLICIES = ("drop_newest", "drop_oldest")
+
+
+class VisitIngestionQueue:
+    """
+    Ограниченный буфер посещений с фоновой пакетной записью в базу.
+
+    Middleware кладет записи через enqueue() без ожидания, а фоновая задача
+    забирает их пачками (по количеству или по таймеру) и вставляет одной
+    транзакцией в потоке (database.run_write), не блокируя цикл событий.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = VISIT_QUEUE_MAXSIZE,
+        batch_size: int = VISIT_BATCH_SIZE,
+        flush_interval: float = VISIT_FLUSH_INTERVAL,
+        overflow_policy: str = VISIT_OVERFLOW_POLICY,
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+
+        self._buffer = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        # Счетчики
+        self.enqueued = 0
+        self.dropped = 0
+        self.bots_skipped = 0
+        self.flushed = 0
+        self.failed = 0
+        self.batches = 0
+
+    def enqueue(self, page_url: str, referrer: str, user_agent: str, visitor: Optional[str] = None) -> bool:
+        """
+        Добавляет посещение в буфер без обращения к базе.
+        Args:
+            visitor: Идентификатор посетителя (backend.visitors) для скетчей уникальных
+        Returns:
+            bool: False, если запись была отброшена из-за переполнения
+        """
+        if not crud.should_log_visit(page_url):
+            return False
+        if not user_agents.admit(user_agent):
+            self.bots_skipped += 1
+            shared_counters.add("bots_skipped")
+            return False
+
+        if len(self._buffer) >= self.maxsize:
+            self.dropped += 1
+            shared_counters.add("visits_dropped")
+            if self.overflow_policy == "drop_newest":
+                return False
+            self._buffer.popleft()
+
+        self._buffer.append({
+            "page_url": page_url,
+            "referrer": referrer,
+            "user_agent": user_agent,
+            "visit_time": datetime.now(timezone.utc),
+            "visitor": visitor,
+        })
+        self.enqueued += 1
+        shared_counters.add("visits_enqueued")
+        shared_counters.set("queue_depth", len(self._buffer))
+        if self._wakeup is not None and len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    @property
+    def depth(self) -> int:
+        return len(self._buffer)
+
+    def stats(self) -> dict:
+        """
+        Возвращает текущее состояние очереди и счетчики.
+        """
+        return {
+            "depth": self.depth,
+            "maxsize": self.maxsize,
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "bots_skipped": self.bots_skipped,
+            "failed": self.failed,
+            "batches": self.batches,
+        }
+
+    async def start(self):
+        """
+        Запускает фоновую задачу записи в текущем цикле событий.
+        """
+        if self._task is not None:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="visit-ingestion")
+        logger.info(
+            "Visit ingestion started: batch_size=%s, flush_interval=%s, maxsize=%s, policy=%s",
+            self.batch_size, self.flush_interval, self.maxsize, self.overflow_policy,
+        )
+
+    async def stop(self):
+        """
+        Останавливает фоновую задачу и сбрасывает в базу все, что осталось в буфере.
+        """
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        self._wakeup = None
+        logger.info("Visit ingestion stopped: %s", self.stats())
+
+    async def flush(self):
+        """
+        Записывает текущее содержимое буфера пачками.
+        """
+        while self._buffer:
+            batch = self._take_batch()
+            await self._write_batch(batch)
+
+    def _take_batch(self) -> list:
+        count = min(self.batch_size, len(self._buffer))
+        return [self._buffer.popleft() for _ in range(count)]
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            # Воркер считается живым, пока работает его цикл записи
+            shared_counters.heartbeat()
+            await self.flush()
+        await self.flush()
+
+    async def _write_batch(self, batch: list):
+        try:
+            # Блокировка записи берется и отпускается внутри потока, см. run_write
+            await asyncio.to_thread(run_write, crud.log_visits_bulk, batch)
+            self.flushed += len(batch)
+            self.batches += 1
+            shared_counters.add("visits_flushed", len(batch))
+            shared_counters.add("visit_batches")
+            top_tracker.wake()
+        except Exception:
+            self.failed += len(batch)
+            shared_counters.add("visits_failed", len(batch))
+            logger.warning("Visit batch of %s rows was not written", len(batch))
+        finally:
+            shared_counters.set("queue_depth", len(self._buffer))
+
+
+visit_queue = VisitIngestionQueue()
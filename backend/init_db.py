@@ -1,26 +1,57 @@
-from kko_pwa_app.backend.database import SESSIONLOCAL, ENGINE
-from kko_pwa_app.backend import db_models
-from kko_pwa_app.backend.schemas import UserCreate
-from kko_pwa_app.backend.crud import create_user
+import argparse
+import getpass
+
+from . import db_models
+from .crud import create_user
+from .database import SESSIONLOCAL, write_lock
+from .migrations import run_migrations
+from .schemas import UserCreate
+
 
 def init_db():
-    db_models.Base.metadata.create_all(bind=ENGINE)
+    """
+    Приводит схему базы к текущей версии (без создания пользователей).
+    """
+    return run_migrations()
 
+
+def create_admin(username: str = "admin", email: str = "admin@example.com", password: str = None) -> bool:
+    """
+    Создает администратора, если пользователя с таким именем еще нет.
+    Returns:
+        bool: True, если пользователь создан
+    """
     db = SESSIONLOCAL()
+    try:
+        # Команда может запускаться при работающем сервере - пишем под его блокировкой записи
+        with write_lock:
+            # Проверяем, существует ли уже админ
+            if db.query(db_models.User).filter(db_models.User.username == username).first():
+                return False
+            create_user(db, UserCreate(username=username, email=email, password=password, role="admin"))
+            return True
+    finally:
+        db.close()
 
-    # Проверяем, существует ли уже админ
-    admin = db.query(db_models.User).filter(db_models.User.username == "admin").first()
-    if not admin:
-        admin_user = UserCreate(
-            username="admin",
-            email="admin@example.com",
-            password="admin123",
-            role="admin"
-        )
-        create_user(db, admin_user)
-        print("Admin user created successfully")
-    
-    db.close()
 
-if __name__ == "__main__":
+def main():
+    parser = argparse.ArgumentParser(description="Инициализация базы данных")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("migrate", help="Применить миграции схемы")
+    admin_parser = subparsers.add_parser("create-admin", help="Создать администратора")
+    admin_parser.add_argument("--username", default="admin")
+    admin_parser.add_argument("--email", default="admin@example.com")
+    admin_parser.add_argument("--password", help="Если не указан, будет запрошен")
+    args = parser.parse_args()
+
     init_db()
+    if args.command == "create-admin":
+        password = args.password or getpass.getpass("Password: ")
+        if create_admin(args.username, args.email, password):
+            print("Admin user created successfully")
+        else:
+            print(f"User {args.username} already exists")
+
+
+if __name__ == "__main__":
+    main()
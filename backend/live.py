@@ -0,0 +1,144 @@
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+from .logger import logger
+
+# Настройки живых обновлений дашбордов (переопределяются переменными окружения)
+LIVE_TICK_INTERVAL = float(os.getenv("KKO_LIVE_TICK_INTERVAL", "1.0"))
+LIVE_HEARTBEAT_INTERVAL = float(os.getenv("KKO_LIVE_HEARTBEAT_INTERVAL", "15"))
+LIVE_QUEUE_SIZE = int(os.getenv("KKO_LIVE_QUEUE_SIZE", "16"))
+
+_RESYNC = json.dumps({"type": "resync"})
+_PING = json.dumps({"type": "ping"})
+
+
+class Subscription:
+    """
+    Очередь сообщений одного подключенного дашборда.
+    Отстающий клиент не задерживает остальных: при переполнении его очередь
+    заменяется одним сообщением resync, и он заново запрашивает /api/stats.
+    """
+
+    def __init__(self, maxsize: int = LIVE_QUEUE_SIZE):
+        self.queue = asyncio.Queue(maxsize)
+        self.resyncs = 0
+
+    def push(self, message: str):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(_RESYNC)
+            self.resyncs += 1
+
+    async def next(self, timeout: float = LIVE_HEARTBEAT_INTERVAL) -> str:
+        """
+        Следующее сообщение или ping, если за timeout ничего не пришло.
+        """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return _PING
+
+
+class LiveBroadcaster:
+    """
+    Рассылка приращений статистики подключенным дашбордам (WebSocket и SSE).
+
+    Новые посещения приходят из хвоста visits (top_n.TopTracker), копятся
+    между тиками и раз в тик сворачиваются в одно сообщение: по количеству
+    посещений за день и по (день, страница). Сообщение сериализуется один раз
+    и раскладывается по очередям подписчиков, поэтому сотни открытых дашбордов
+    стоят одной агрегации, а не сотен запросов /api/stats.
+    """
+
+    def __init__(self, tick_interval: float = LIVE_TICK_INTERVAL):
+        self.tick_interval = tick_interval
+        self._subscribers = set()
+        self._by_date = Counter()
+        self._by_page = Counter()
+        self._last_id: Optional[int] = None
+        self.ticks = 0
+        self.messages = 0
+
+    def feed(self, rows: list):
+        """
+        Args:
+            rows: Кортежи (id, visit_time, page_url, referrer) из хвоста visits
+        """
+        for visit_id, visit_time, page_url, _ in rows:
+            day = visit_time.date() if isinstance(visit_time, datetime) else visit_time
+            self._by_date[day] += 1
+            if page_url is not None:
+                self._by_page[(day, page_url)] += 1
+            self._last_id = visit_id
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription()
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def tick(self) -> Optional[str]:
+        """
+        Сворачивает накопленные посещения в одно сообщение и рассылает его.
+        Returns:
+            Optional[str]: Разосланное сообщение или None, если новых посещений не было
+        """
+        if not self._by_date:
+            return None
+        self.ticks += 1
+        message = json.dumps({
+            "type": "delta",
+            "tick": self.ticks,
+            "last_id": self._last_id,
+            "at": time.time(),
+            "total": sum(self._by_date.values()),
+            "by_date": [
+                {"date": day.isoformat(), "count": count} for day, count in sorted(self._by_date.items())
+            ],
+            "by_page": [
+                {"date": day.isoformat(), "page_url": page_url, "count": count}
+                for (day, page_url), count in self._by_page.most_common()
+            ],
+        }, ensure_ascii=False, separators=(",", ":"))
+        self._by_date.clear()
+        self._by_page.clear()
+        for subscription in self._subscribers:
+            subscription.push(message)
+        self.messages += len(self._subscribers)
+        return message
+
+    async def run(self):
+        """
+        Фоновая рассылка раз в tick_interval.
+        """
+        while True:
+            await asyncio.sleep(self.tick_interval)
+            try:
+                self.tick()
+            except Exception:
+                logger.warning("Live stats tick failed")
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": self.subscribers,
+            "ticks": self.ticks,
+            "messages": self.messages,
+            "resyncs": sum(subscription.resyncs for subscription in self._subscribers),
+        }
+
+
+live_broadcaster = LiveBroadcaster()
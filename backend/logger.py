@@ -1,39 +1,166 @@
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
 import os
-from datetime import datetime
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+
+from .shared_counters import shared_counters
 
 # В начале файла:
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, "..", ".."))  # Переход на два уровня вверх к корню проекта
-log_directory = os.path.join(PROJECT_ROOT, "logs")
+log_directory = os.getenv("KKO_LOG_DIR", os.path.join(PROJECT_ROOT, "logs"))
+
+LOG_LEVEL = os.getenv("KKO_LOG_LEVEL", "INFO").upper()
+LOG_BACKUP_DAYS = int(os.getenv("KKO_LOG_BACKUP_DAYS", "14"))
+LOG_QUEUE_SIZE = int(os.getenv("KKO_LOG_QUEUE_SIZE", "10000"))
+# Формат вывода в консоль: text для разработки, json для сборщиков логов
+LOG_CONSOLE_FORMAT = os.getenv("KKO_LOG_CONSOLE_FORMAT", "text")
+# Строки на каждый запрос: доля сохраняемых записей и предел записей в секунду
+ACCESS_LOG_SAMPLE_RATE = float(os.getenv("KKO_ACCESS_LOG_SAMPLE_RATE", "1.0"))
+ACCESS_LOG_RATE_LIMIT = float(os.getenv("KKO_ACCESS_LOG_RATE_LIMIT", "50"))
 
 if not os.path.exists(log_directory):
     os.makedirs(log_directory)
 
-# Настраиваем форматирование
-formatter = logging.Formatter(
-    '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Стандартные поля LogRecord; все остальное пришло через extra и попадает в JSON
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Одна запись - одна строка JSON; поля из extra= добавляются как есть.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает долю sample_rate записей ниже WARNING и не больше rate_limit записей в секунду
+    (token bucket). Предупреждения и ошибки проходят всегда.
+    """
+
+    def __init__(self, sample_rate: float = 1.0, rate_limit: float = 0.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.rate_limit = rate_limit
+        self._tokens = rate_limit
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self.dropped += 1
+            return False
+        if self.rate_limit > 0:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.rate_limit, self._tokens + (now - self._updated) * self.rate_limit)
+                self._updated = now
+                if self._tokens < 1:
+                    self.dropped += 1
+                    return False
+                self._tokens -= 1
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Кладет запись в очередь без форматирования: сообщение собирается в потоке QueueListener.
+    При переполнении очереди запись отбрасывается, а не блокирует цикл событий.
+    """
+
+    dropped = 0
 
-# Создаем файл лога с датой
-current_date = datetime.now().strftime('%Y-%m-%d')
-file_handler = RotatingFileHandler(
-    os.path.join(log_directory, f'kko_site_{current_date}.log'),
-    maxBytes=10485760,  # 10MB
-    backupCount=5
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            NonBlockingQueueHandler.dropped += 1
+
+
+formatter = JsonFormatter()
+
+# Файл ротируется в полночь: kko_site.log -> kko_site.log.YYYY-MM-DD.
+# Ротацию каждый процесс делает сам, поэтому под backend.server у каждого воркера свой
+# файл kko_site.w<N>.log (N - строка воркера в общих счетчиках): общий файл воркеры
+# переименовывали бы и удаляли друг у друга, продолжая писать в старый inode.
+# Перезапущенный воркер занимает освободившуюся строку и продолжает ее файл.
+LOG_FILE_NAME = f"kko_site.w{shared_counters.row}.log" if shared_counters.path else "kko_site.log"
+file_handler = TimedRotatingFileHandler(
+    os.path.join(log_directory, LOG_FILE_NAME),
+    when="midnight",
+    backupCount=LOG_BACKUP_DAYS,
+    encoding="utf-8",
+    delay=True,
 )
 file_handler.setFormatter(formatter)
 
 # Настраиваем вывод в консоль
 console_handler = logging.StreamHandler()
-console_handler.setFormatter(formatter)
+console_handler.setFormatter(
+    formatter if LOG_CONSOLE_FORMAT == "json"
+    else logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+)
+
+log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+queue_listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+queue_listener.start()
+atexit.register(queue_listener.stop)
 
-# Создаем логгер
+# Создаем логгер: обработчик только один - очередь, запись в файл идет в фоновом потоке
 logger = logging.getLogger('kko_site')
-logger.setLevel(logging.INFO)
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+logger.setLevel(LOG_LEVEL)
+logger.addHandler(NonBlockingQueueHandler(log_queue))
+logger.propagate = False
+
+
+def get_logger(name: str, sample_rate: float = 1.0, rate_limit: float = 0.0) -> logging.Logger:
+    """
+    Дочерний логгер kko_site.<name> со своей выборкой и ограничением частоты.
+    """
+    child = logger.getChild(name)
+    if sample_rate < 1.0 or rate_limit > 0:
+        child.filters = [f for f in child.filters if not isinstance(f, SamplingFilter)]
+        child.addFilter(SamplingFilter(sample_rate, rate_limit))
+    return child
+
+
+# Строки о каждом HTTP-запросе
+access_logger = get_logger("access", ACCESS_LOG_SAMPLE_RATE, ACCESS_LOG_RATE_LIMIT)
+
+
+def log_stats() -> dict:
+    return {
+        "queue_depth": log_queue.qsize(),
+        "queue_dropped": NonBlockingQueueHandler.dropped,
+        "sampled_out": sum(f.dropped for f in access_logger.filters if isinstance(f, SamplingFilter)),
+    }
+
 
 # Функция для логирования ошибок с дополнительной информацией
 def log_error(error: Exception, additional_info: str = None):
@@ -1,25 +1,94 @@
-from datetime import timedelta
-from typing import List
-from fastapi import FastAPI, Depends, HTTPException, status, Request
+import time
+
+IMPORT_STARTED = time.perf_counter()
+
+import asyncio
+from contextlib import asynccontextmanager, suppress
+from datetime import datetime
+from typing import Literal, Optional
+from urllib.parse import quote
+from fastapi import FastAPI, Depends, HTTPException, Query, status, Request, WebSocket
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from .database import get_db, SESSIONLOCAL
-from . import crud, db_models, schemas
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import ENGINE, READ_ENGINE, get_read_db, run_write
+from .async_database import (
+    ASYNC_ENGINE, ASYNC_READ_ENGINE, get_async_db, get_async_read_db, dispose_async_engines,
+)
+from . import async_crud, crud, db_models, schemas, user_agents
 
+from .admission import AdmissionMiddleware, admission
 from .auth import (
-    authenticate_user, create_access_token,
-    get_current_user, ACCESS_TOKEN_EXPIRE_MINUTES
+    authenticate_stream_token, authenticate_user, create_token_pair, decode_refresh_token,
+    get_current_user, REFRESH_TOKEN_EXPIRE_DAYS
 )
-from .logger import logger, log_error
-from .init_db import init_db
+from .logger import access_logger, logger, log_error
+from .password_utils import HashingPoolBusy, bulk_hashing_pool, hashing_pool
+from .metrics import MetricsMiddleware, instrument_engine, registry
+from .user_cache import token_cache
+from .migrations import run_migrations
+from .collect import COLLECT_DEDUPE_HOURS, COLLECT_MAX_BYTES, CollectPayloadError, parse_events
+from .ingestion import visit_queue
+from .partitions import maintenance_loop
+from .stats_cache import stats_cache
+from .shared_counters import FIELDS, shared_counters
+from .visit_export import MEDIA_TYPES, stream_visits
+from .static_assets import STATIC_DIR, PrecompressedStaticFiles
+from .live import live_broadcaster
+from .revocation import revocations
+from .top_n import TOP_CAPACITY, top_tracker
+from .videos import video_catalog, video_response
+from .visitors import VISITOR_COOKIE, VISITOR_COOKIE_MAX_AGE, visitor_id
+
+# Длительность этапов запуска воркера, секунды
+startup_report = {}
+
 
-# Инициализируем базу данных при запуске
-init_db()
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    """
+    Миграции схемы и индекс статики, запуск фоновой записи посещений и архивирования секций,
+    сброс буфера при остановке. Администратор создается отдельно: python -m backend.init_db create-admin
+    """
+    started = time.perf_counter()
+    migrations = await asyncio.to_thread(run_migrations)
+    startup_report["migrations"] = migrations["seconds"]
+    phase_started = time.perf_counter()
+    await asyncio.to_thread(static_files.load_index)
+    startup_report["static_index"] = round(time.perf_counter() - phase_started, 4)
+    await visit_queue.start()
+    # Отозванные токены должны быть в памяти до первого запроса
+    await revocations.refresh()
+    startup_report["lifespan"] = round(time.perf_counter() - started, 4)
+    logger.info(
+        "Startup: import %.3f s, migrations %.3f s (schema v%s, applied %s), static index %.3f s, lifespan %.3f s",
+        startup_report["import"], startup_report["migrations"], migrations["version"],
+        migrations["applied"] or "none", startup_report["static_index"], startup_report["lifespan"],
+    )
+    maintenance = asyncio.create_task(maintenance_loop())
+    top_refresh = asyncio.create_task(top_tracker.run(), name="top-pages")
+    live_ticks = asyncio.create_task(live_broadcaster.run(), name="live-stats")
+    revocation_refresh = asyncio.create_task(revocations.run(), name="token-revocations")
+    try:
+        yield
+    finally:
+        for task in (maintenance, top_refresh, live_ticks, revocation_refresh):
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+        await visit_queue.stop()
+        await dispose_async_engines()
+        shared_counters.detach()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
+
+# Индекс сборки PWA (сжатые варианты, ETag) строится один раз при старте, в lifespan
+static_files = PrecompressedStaticFiles(directory=STATIC_DIR, html=True)
 '''
 # Middleware для логирования запросов
 @app.middleware("http")
@@ -47,25 +116,41 @@ async def log_requests(request: Request, call_next):
     """
     Middleware для логирования запросов и записи посещений в базу данных.
     """
+    # Файлы сборки (js, css, картинки) не логируем и не считаем посещениями
+    if static_files.is_asset(request.url.path):
+        return await call_next(request)
+
     try:
-        # Логирование запроса
-        logger.info("Request: %s %s", request.method, request.url)
+        started = time.perf_counter()
 
         # Сбор данных для аналитики
         page_url = str(request.url.path)
         referrer = request.headers.get("referer", "Unknown")
         user_agent = request.headers.get("user-agent", "Unknown")
 
-        # Сохраняем посещение в базу
-        db = SESSIONLOCAL()
-        crud.log_visit(db, page_url, referrer, user_agent)
-        db.close()
+        visitor_cookie = request.cookies.get(VISITOR_COOKIE)
+        visitor = visitor_id(visitor_cookie, request.client.host if request.client else None, user_agent)
+
+        # Ставим посещение в очередь, запись в базу идет пачками в фоне
+        enqueued = visit_queue.enqueue(page_url, referrer, user_agent, visitor)
 
         # Обработка запроса
         response = await call_next(request)
+        if enqueued and visitor_cookie != visitor:
+            response.set_cookie(
+                VISITOR_COOKIE, visitor, max_age=VISITOR_COOKIE_MAX_AGE, httponly=True, samesite="lax"
+            )
 
-        # Логирование ответа
-        logger.info("Response Status: %s", response.status_code)
+        # Одна строка на запрос; выборка и ограничение частоты настроены у access_logger
+        access_logger.info(
+            "%s %s %s", request.method, page_url, response.status_code,
+            extra={
+                "method": request.method,
+                "path": page_url,
+                "status": response.status_code,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+            },
+        )
         return response
 
     except Exception as e:
@@ -75,6 +160,16 @@ async def log_requests(request: Request, call_next):
             status_code=500,
             content={"detail": "Internal server error"}
         )
+# Пул bcrypt переполнен - отвечаем сразу, а не ждем таймаута
+@app.exception_handler(HashingPoolBusy)
+async def hashing_busy_handler(request: Request, exc: HashingPoolBusy):
+    logger.warning("Rejected %s %s: %s", request.method, request.url.path, exc)
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server is busy, try again later"},
+        headers={"Retry-After": "1"},
+    )
+
 # Обработчик ошибок
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -84,6 +179,9 @@ async def global_exception_handler(request: Request, exc: Exception):
         content={"detail": "Internal server error"}
     )
 
+# Контроль допуска: внутри CORS, чтобы и отказ 429/503 дошел до браузера с заголовками CORS
+app.add_middleware(AdmissionMiddleware)
+
 # Настройка CORS
 app.add_middleware(
     CORSMiddleware,
@@ -93,10 +191,74 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Метрики: внешний слой, чтобы время включало все остальные middleware
+app.add_middleware(MetricsMiddleware, static_files=static_files)
+
+ENGINES = {
+    "writer": ENGINE,
+    "reader": READ_ENGINE,
+    "async_writer": ASYNC_ENGINE.sync_engine,
+    "async_reader": ASYNC_READ_ENGINE.sync_engine,
+}
+for engine_name, engine in ENGINES.items():
+    instrument_engine(engine, engine_name)
+
+
+
+def _pool_gauge(method: str):
+    # У NullPool (профиль default для aiosqlite) нет счетчиков - такие пулы пропускаем
+    return lambda: {
+        (("engine", name),): getattr(engine.pool, method)()
+        for name, engine in ENGINES.items()
+        if hasattr(engine.pool, method)
+    }
+
+
+registry.gauge("kko_db_pool_checked_out", "Connections currently checked out of each pool", _pool_gauge("checkedout"))
+registry.gauge("kko_db_pool_size", "Configured size of each pool", _pool_gauge("size"))
+registry.gauge(
+    "kko_ingestion_queue_depth", "Visits waiting to be written, all workers",
+    lambda: shared_counters.total("queue_depth"),
+)
+registry.gauge(
+    "kko_ingestion_dropped", "Visits dropped on queue overflow, all workers",
+    lambda: shared_counters.total("visits_dropped"),
+)
+registry.gauge("kko_password_in_flight", "bcrypt jobs queued or running", lambda: hashing_pool.stats()["in_flight"])
+registry.gauge("kko_password_rejected", "bcrypt jobs rejected with 503", lambda: hashing_pool.rejected)
+registry.gauge(
+    "kko_password_bulk_in_flight", "User import bcrypt jobs queued or running",
+    lambda: bulk_hashing_pool.stats()["in_flight"],
+)
+registry.gauge("kko_password_bulk_rejected", "User import bcrypt batches rejected with 503", lambda: bulk_hashing_pool.rejected)
+registry.gauge(
+    "kko_admission_active", "Requests running by admission class",
+    lambda: {(("class", name),): stats["active"] for name, stats in admission.stats().items()},
+)
+registry.gauge(
+    "kko_admission_queued", "Requests waiting by admission class",
+    lambda: {(("class", name),): stats["queued"] for name, stats in admission.stats().items()},
+)
+registry.gauge("kko_video_catalog_size", "Video files in the catalog index", lambda: len(video_catalog.videos))
+registry.gauge("kko_token_cache_size", "Cached verified tokens", lambda: token_cache.stats()["size"])
+registry.gauge("kko_revoked_tokens", "Revoked token ids held in memory", lambda: revocations.stats()["revoked"])
+registry.gauge("kko_stats_cache_generation", "Stats cache generation", lambda: stats_cache.generation)
+registry.gauge("kko_live_subscribers", "Dashboards subscribed to live updates", lambda: live_broadcaster.subscribers)
+# Сумма по всем воркерам из общей памяти (при одном процессе совпадает с его счетчиками)
+registry.gauge("kko_cluster_workers", "Live worker processes", shared_counters.workers)
+registry.gauge(
+    "kko_cluster_total", "Counters aggregated across all workers",
+    lambda: {(("counter", name),): shared_counters.total(name) for name in FIELDS},
+)
+registry.gauge(
+    "kko_startup_seconds", "Worker startup time by phase",
+    lambda: {(("phase", phase),): seconds for phase, seconds in startup_report.items()},
+)
+
 @app.post("/api/token", response_model=schemas.Token)
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     Аутентификация пользователя и создание JWT токена.
@@ -104,13 +266,10 @@ async def login_for_access_token(
         form_data: Данные формы с username и password
         db: сессия базы данных
     Returns:
-        dict: Токен доступа и его тип
+        dict: Access- и refresh-токен, тип и срок жизни access-токена
     """
     try:
-        logger.info("Token request received for username: %s", form_data.username)
-        logger.info("Received form data: username=%s", form_data.username)
-
-        user = authenticate_user(db, form_data.username, form_data.password)
+        user = await authenticate_user(db, form_data.username, form_data.password)
         if not user:
             logger.warning("Authentication failed for user: %s", form_data.username)
             raise HTTPException(
@@ -119,22 +278,79 @@ async def login_for_access_token(
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
-        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={"sub": user.username}, expires_delta=access_token_expires
-        )
-
         logger.info("Token generated successfully for user: %s", user.username)
-        return {"access_token": access_token, "token_type": "bearer"}
+        return create_token_pair(user.username)
     except Exception as e:
-        logger.error("Login error: %s", str(e))
         log_error(e, f"Error during login for user: {form_data.username}")
         raise
 
+@app.post("/api/token/refresh", response_model=schemas.Token)
+async def refresh_access_token(
+    request: schemas.RefreshRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Ротация refresh-токена: старый отзывается, выдается новая пара того же семейства.
+    Повторное предъявление уже использованного refresh-токена означает его утечку,
+    поэтому отзывается все семейство, включая выданные по нему access-токены.
+    Args:
+        request: Refresh-токен
+        db: сессия базы данных
+    Returns:
+        dict: Новая пара токенов
+    """
+    invalid_token = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        payload = decode_refresh_token(request.refresh_token)
+        if payload is None:
+            raise invalid_token
+        if not await async_crud.revoke_token(db, payload["jti"], payload["exp"]):
+            logger.warning("Refresh token reuse detected for user: %s, revoking family", payload["sub"])
+            family_expires = time.time() + REFRESH_TOKEN_EXPIRE_DAYS * 86400
+            await async_crud.revoke_token(db, payload["fam"], family_expires)
+            revocations.add(payload["fam"], family_expires)
+            raise invalid_token
+        revocations.add(payload["jti"], payload["exp"])
+
+        user = await async_crud.get_user(db, payload["sub"])
+        if user is None or not user.is_active:
+            raise invalid_token
+        return create_token_pair(user.username, payload["fam"])
+    except Exception as e:
+        log_error(e, "Error refreshing token")
+        raise
+
+@app.post("/api/token/revoke", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_refresh_token(
+    request: schemas.RefreshRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Выход: отзывает семейство refresh-токена вместе с его access-токенами.
+    Args:
+        request: Refresh-токен
+        db: сессия базы данных
+    """
+    try:
+        payload = decode_refresh_token(request.refresh_token)
+        # Недействительный или уже отозванный токен - выходить не из чего
+        if payload is not None:
+            family_expires = time.time() + REFRESH_TOKEN_EXPIRE_DAYS * 86400
+            await async_crud.revoke_token(db, payload["fam"], family_expires)
+            revocations.add(payload["fam"], family_expires)
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+    except Exception as e:
+        log_error(e, "Error revoking token")
+        raise
+
 @app.post("/api/users/", response_model=schemas.User)
-def create_user(
+async def create_user(
     user: schemas.UserCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: db_models.User = Depends(get_current_user)
 ):
     """
@@ -151,12 +367,12 @@ def create_user(
             logger.warning("Unauthorized user creation attempt by: %s", current_user.username)
             raise HTTPException(status_code=403, detail="Not enough permissions")
 
-        db_user = crud.get_user_by_email(db, email=user.email)
-        if db_user:
-            logger.warning("Attempt to create user with existing email: %s", user.email)
-            raise HTTPException(status_code=400, detail="Email already registered")
-
-        new_user = crud.create_user(db=db, user=user)
+        # Занятость имени и email проверяет уникальный индекс, без отдельного SELECT
+        try:
+            new_user = await async_crud.create_user(db=db, user=user)
+        except IntegrityError:
+            logger.warning("Attempt to create user with existing username or email: %s", user.email)
+            raise HTTPException(status_code=400, detail="Username or email already registered")
         logger.info("New user created: %s by admin: %s", new_user.username, current_user.username)
         return new_user
     except Exception as e:
@@ -181,47 +397,335 @@ async def read_users_me(
         log_error(e, f"Error accessing profile for user: {current_user.username}")
         raise
 
-@app.get("/api/users/", response_model=List[schemas.User])
-def read_users(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+@app.post("/api/users/bulk", response_model=schemas.UserImportResult)
+async def import_users(
+    payload: schemas.UserImport,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: db_models.User = Depends(get_current_user)
+):
+    """
+    Массовое создание пользователей (только для администраторов).
+    Пароли хешируются параллельно, все записи вставляются одной транзакцией;
+    записи с ошибками проверки или занятыми именем/email возвращаются в errors.
+    Returns:
+        UserImportResult: Созданные пользователи и ошибки по номерам записей
+    """
+    if current_user.role != "admin":
+        logger.warning("Unauthorized user import attempt by: %s", current_user.username)
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    if len(payload.users) > async_crud.USER_IMPORT_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {async_crud.USER_IMPORT_MAX} users per request",
+        )
+
+    valid, errors = [], []
+    for index, record in enumerate(payload.users):
+        try:
+            valid.append((index, schemas.UserCreate.model_validate(record)))
+        except ValidationError as e:
+            error = e.errors()[0]
+            errors.append({
+                "index": index,
+                "username": record.get("username") if isinstance(record.get("username"), str) else None,
+                "error": f"{'.'.join(map(str, error['loc']))}: {error['msg']}",
+            })
+    try:
+        created, rejected = await async_crud.import_users(db, valid)
+    except IntegrityError:
+        # Параллельный запрос успел занять те же имена между проверкой и вставкой
+        raise HTTPException(status_code=409, detail="Users were created concurrently, retry the import")
+    logger.info("Users imported by admin %s: %s created", current_user.username, len(created))
+    return {"created": created, "errors": sorted(errors + rejected, key=lambda error: error["index"])}
+
+@app.get("/api/users/", response_model=schemas.UserPage)
+async def read_users(
+    cursor: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: db_models.User = Depends(get_current_user)
 ):
     """
     Получение списка всех пользователей (только для администраторов).
     Args:
-        skip: Количество пропускаемых записей
-        limit: Максимальное количество возвращаемых записей
+        cursor: next_cursor из предыдущего ответа
+        limit: Размер страницы
         db: Сессия базы данных
         current_user: Текущий пользователь (должен быть админом)
     Returns:
-        List[User]: Список пользователей
+        UserPage: Пользователи и курсор следующей страницы
     """
     try:
         if current_user.role != "admin":
             logger.warning("Unauthorized users list access attempt by: %s", current_user.username)
             raise HTTPException(status_code=403, detail="Not enough permissions")
 
-        users = crud.get_users(db, skip=skip, limit=limit)
+        users, next_cursor = await async_crud.get_users(db, cursor=cursor, limit=limit)
         logger.info("Users list accessed by admin: %s", current_user.username)
-        return users
+        return {"users": users, "next_cursor": next_cursor}
     except Exception as e:
         log_error(e, f"Error accessing users list by: {current_user.username}")
         raise
 
+@app.post("/api/collect", response_model=schemas.CollectResult)
+async def collect_page_views(request: Request):
+    """
+    Пачка просмотров страниц, собранных на клиенте (service worker PWA копит их офлайн
+    и отправляет одним запросом, в том числе через navigator.sendBeacon).
+    События проверяются по одному, повторы отсекаются по id, пачка пишется одной транзакцией.
+    Returns:
+        CollectResult: Сколько принято, сколько повторов и какие события отклонены
+    """
+    body = await request.body()
+    if len(body) > COLLECT_MAX_BYTES:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Batch is too large")
+    user_agent = request.headers.get("user-agent", "Unknown")
+    visitor_cookie = request.cookies.get(VISITOR_COOKIE)
+    visitor = visitor_id(visitor_cookie, request.client.host if request.client else None, user_agent)
+    try:
+        rows, rejected = parse_events(body, user_agent, visitor)
+    except CollectPayloadError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    if not user_agents.admit(user_agent):
+        rows = []
+
+    # Блокировка записи, транзакция и освобождение - в одном потоке (см. database.run_write),
+    # поэтому обрыв соединения клиента не оставит блокировку захваченной
+    accepted, duplicates = await asyncio.to_thread(run_write, crud.collect_visits, rows, COLLECT_DEDUPE_HOURS)
+    shared_counters.add("visits_collected", accepted)
+    if accepted:
+        top_tracker.wake()
+
+    response = JSONResponse({"accepted": accepted, "duplicates": duplicates, "rejected": rejected})
+    if visitor_cookie != visitor:
+        response.set_cookie(VISITOR_COOKIE, visitor, max_age=VISITOR_COOKIE_MAX_AGE, httponly=True, samesite="lax")
+    return response
+
 @app.get("/api/stats")
-def read_stats(db: Session = Depends(get_db)):
-    return crud.get_visit_statistics(db)
+async def read_stats(
+    request: Request,
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    granularity: Literal["hour", "day", "week"] = "day",
+    page: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Статистика посещений за период с рядом по часам, дням или неделям.
+    unique_visitors - оценка HyperLogLog (всего сайта или страницы page) с относительной ошибкой.
+    Готовый ответ берется из stats_cache, пока не записаны новые посещения;
+    повторный запрос с If-None-Match получает 304 без обращения к базе.
+    """
+    key = (date_from, date_to, granularity, page)
+    cached = stats_cache.get(key)
+    if cached is None:
+        generation = stats_cache.generation
+        payload = await async_crud.get_visit_statistics(db, date_from, date_to, granularity, page)
+        cached = stats_cache.put(key, generation, payload)
+
+    headers = {
+        "ETag": cached.etag,
+        "Last-Modified": cached.last_modified,
+        "Cache-Control": "no-cache",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and cached.etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(cached.body, media_type="application/json", headers=headers)
 
-# Подключение статических файлов
-app.mount("/", StaticFiles(directory="kko_pwa_app/build", html=True), name="static")
+# Живые обновления получают те же новые посещения, что и топ страниц
+top_tracker.listeners.append(live_broadcaster.feed)
 
-@app.get("/api/videos")
-async def get_videos():
+@app.websocket("/api/live")
+async def live_updates(websocket: WebSocket):
     """
-    Получение списка доступных видео.
+    Приращения статистики для дашборда по WebSocket: сообщения delta раз в тик,
+    ping при простое и resync, если клиент отстал и должен перечитать /api/stats.
+    Только для администраторов; access-токен передается параметром ?token=.
+    """
+    current_user = await authenticate_stream_token(websocket.query_params.get("token"))
+    if current_user is None or current_user.role != "admin":
+        # Закрытие до accept - клиент получает отказ (403) уже на рукопожатии
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    subscription = live_broadcaster.subscribe()
+
+    async def send_updates():
+        while True:
+            await websocket.send_text(await subscription.next())
+
+    sender = asyncio.create_task(send_updates())
+    try:
+        # Клиент ничего не присылает; чтение нужно, чтобы сразу заметить закрытие
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    finally:
+        live_broadcaster.unsubscribe(subscription)
+        sender.cancel()
+        with suppress(asyncio.CancelledError, Exception):
+            await sender
+
+@app.get("/api/live/events")
+async def live_events(token: Optional[str] = None):
+    """
+    Те же приращения в виде Server-Sent Events для клиентов без WebSocket.
+    Только для администраторов; access-токен передается параметром ?token=.
+    """
+    current_user = await authenticate_stream_token(token)
+    if current_user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if current_user.role != "admin":
+        logger.warning("Unauthorized live events access attempt by: %s", current_user.username)
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+    async def events():
+        subscription = live_broadcaster.subscribe()
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                yield f"data: {await subscription.next()}\n\n"
+        finally:
+            live_broadcaster.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/top")
+async def read_top(
+    window: Literal["hour", "day", "week"] = "day",
+    dimension: Literal["pages", "referrers"] = "pages",
+    limit: int = Query(10, ge=1, le=TOP_CAPACITY),
+    current_user: db_models.User = Depends(get_current_user)
+):
+    """
+    Популярные страницы или источники переходов за скользящее окно (только для администраторов).
+    Отвечает из памяти (сводки Space-Saving), без запросов к базе.
     Returns:
-        dict: Список видеофайлов
+        dict: Ключи с оценкой count; точное число посещений не меньше count - error
     """
-    return {"videos": ["video1.mp4", "video2.mp4"]}
+    if current_user.role != "admin":
+        logger.warning("Unauthorized top access attempt by: %s", current_user.username)
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return top_tracker.top(window, dimension, limit)
+
+@app.get("/api/visits", response_model=schemas.VisitPage)
+def read_visits(
+    cursor: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    page_prefix: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+    current_user: db_models.User = Depends(get_current_user)
+):
+    """
+    Постраничный список посещений от новых к старым (только для администраторов).
+    Args:
+        cursor: next_cursor из предыдущего ответа
+        limit: Размер страницы
+        date_from: Начало периода (включительно)
+        date_to: Конец периода (не включительно)
+        page_prefix: Префикс URL страницы
+        current_user: Текущий пользователь (должен быть админом)
+    Returns:
+        VisitPage: Посещения и курсор следующей страницы
+    """
+    if current_user.role != "admin":
+        logger.warning("Unauthorized visits access attempt by: %s", current_user.username)
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    visits, next_cursor = crud.get_visits(
+        db, cursor=cursor, limit=limit,
+        date_from=date_from, date_to=date_to, page_prefix=page_prefix,
+    )
+    return {"visits": visits, "next_cursor": next_cursor}
+
+@app.get("/api/visits/export")
+def export_visits(
+    fmt: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    page_prefix: Optional[str] = None,
+    current_user: db_models.User = Depends(get_current_user)
+):
+    """
+    Потоковая выгрузка посещений в NDJSON или CSV (только для администраторов).
+    Returns:
+        StreamingResponse: Файл выгрузки, формируемый по мере чтения из базы
+    """
+    if current_user.role != "admin":
+        logger.warning("Unauthorized visits export attempt by: %s", current_user.username)
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    logger.info("Visits export started by admin: %s", current_user.username)
+    return StreamingResponse(
+        stream_visits(fmt, date_from=date_from, date_to=date_to, page_prefix=page_prefix),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="visits.{fmt}"'},
+    )
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    """
+    Метрики в текстовом формате Prometheus.
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/videos", response_model=schemas.VideoPage)
+async def get_videos(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+):
+    """
+    Получение списка доступных видео из индекса каталога.
+    Args:
+        cursor: next_cursor из предыдущего ответа
+        limit: Размер страницы
+    Returns:
+        VideoPage: Видео (размер, длительность, тип) и курсор следующей страницы
+    """
+    try:
+        videos, next_cursor = await video_catalog.page(cursor=cursor, limit=limit)
+        return {
+            "videos": [
+                {
+                    "name": video.name,
+                    "url": f"/api/videos/{quote(video.name)}",
+                    "size": video.size,
+                    "content_type": video.content_type,
+                    "duration": video.duration,
+                    "modified": video.modified,
+                }
+                for video in videos
+            ],
+            "next_cursor": next_cursor,
+        }
+    except Exception as e:
+        log_error(e, "Error listing videos")
+        raise
+
+@app.api_route("/api/videos/{name:path}", methods=["GET", "HEAD"])
+async def stream_video(name: str, request: Request):
+    """
+    Отдача видеофайла с поддержкой Range (перемотка в плеере) и сильным ETag.
+    Args:
+        name: Имя видео в каталоге (подкаталоги через /)
+        request: HTTP запрос
+    Returns:
+        Response: Файл, его часть (206) или 304
+    """
+    video, stat_result = await video_catalog.get(name)
+    if video is None:
+        raise HTTPException(status_code=404, detail="Video not found")
+    return video_response(video, stat_result, request.headers)
+
+# Подключение статических файлов (после маршрутов: монтирование "/" перехватывает все пути)
+app.mount("/", static_files, name="static")
+
+startup_report["import"] = round(time.perf_counter() - IMPORT_STARTED, 4)
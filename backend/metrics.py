@@ -0,0 +1,237 @@
+import hashlib
+import re
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+
+from sqlalchemy import event
+
+from .shared_counters import shared_counters
+
+# Границы корзин гистограмм, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_ROW = r"\(\s*\?(?:\s*,\s*\?)*\s*\)"
+# Многострочная вставка VALUES (?, ?), (?, ?), ... -> первая строка и ", ..."
+_VALUES_ROWS = re.compile(rf"({_ROW})(?:\s*,\s*{_ROW})+")
+# IN с любым числом параметров, в том числе с одним
+_IN_LISTS = re.compile(rf"\b(IN)\s*{_ROW}", re.IGNORECASE)
+_PARAM_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+# Длина метки запроса; у более длинных отпечатков к обрезанному тексту добавляется хеш
+FINGERPRINT_MAX_LENGTH = 160
+
+
+class MetricsRegistry:
+    """
+    Счетчики и гистограммы в формате Prometheus.
+    Каждый поток пишет в свой шард без блокировок; шарды складываются только при выдаче /metrics.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+        self._meta = {}
+        self._gauges = {}
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def histogram(self, name: str, help_text: str, labels: tuple, buckets: tuple = LATENCY_BUCKETS):
+        self._meta[name] = ("histogram", help_text, labels, buckets)
+
+    def counter(self, name: str, help_text: str, labels: tuple = ()):
+        self._meta[name] = ("counter", help_text, labels, None)
+
+    def gauge(self, name: str, help_text: str, callback):
+        """
+        Gauge вычисляется при выдаче: callback возвращает число или словарь {значения меток: число}.
+        """
+        self._gauges[name] = (help_text, callback)
+
+    def observe(self, name: str, labels: tuple, value: float):
+        shard = self._shard()
+        key = (name, labels)
+        series = shard.get(key)
+        if series is None:
+            buckets = self._meta[name][3]
+            series = shard[key] = [0] * (len(buckets) + 1) + [0.0]
+        series[bisect_left(self._meta[name][3], value)] += 1
+        series[-1] += value
+
+    def inc(self, name: str, labels: tuple = (), value: float = 1):
+        shard = self._shard()
+        key = (name, labels)
+        shard[key] = shard.get(key, 0) + value
+
+    def collect(self) -> dict:
+        with self._lock:
+            shards = list(self._shards)
+        merged = {}
+        for shard in shards:
+            # Копия: шард может расти в своем потоке, пока мы его читаем
+            for key, value in list(shard.items()):
+                if isinstance(value, list):
+                    total = merged.setdefault(key, [0] * len(value))
+                    for i, item in enumerate(list(value)):
+                        total[i] += item
+                else:
+                    merged[key] = merged.get(key, 0) + value
+        return merged
+
+    def render(self) -> str:
+        """
+        Текстовый формат экспозиции Prometheus 0.0.4.
+        """
+        merged = self.collect()
+        lines = []
+        for name, (kind, help_text, label_names, buckets) in self._meta.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for (series_name, labels), value in sorted(merged.items(), key=lambda item: item[0]):
+                if series_name != name:
+                    continue
+                pairs = list(zip(label_names, labels))
+                if kind == "counter":
+                    lines.append(f"{name}{_labels(pairs)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + (float("inf"),), value[:-1]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{_labels(pairs + [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(pairs)} {value[-1]}")
+                lines.append(f"{name}_count{_labels(pairs)} {cumulative}")
+        for name, (help_text, callback) in self._gauges.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            value = callback()
+            if isinstance(value, dict):
+                for labels, item in value.items():
+                    lines.append(f"{name}{_labels(list(labels))} {item}")
+            else:
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs: list) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+registry = MetricsRegistry()
+registry.histogram(
+    "kko_http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+)
+registry.histogram(
+    "kko_db_query_duration_seconds", "SQL statement latency by fingerprint", ("engine", "statement"),
+    QUERY_BUCKETS,
+)
+registry.histogram(
+    "kko_password_duration_seconds", "bcrypt hash/verify latency in the hashing pool", ("operation",)
+)
+registry.histogram(
+    "kko_admission_wait_seconds", "Time admitted requests waited in the admission queue", ("class",)
+)
+registry.counter(
+    "kko_admission_shed_total", "Requests rejected by admission control", ("class", "reason")
+)
+
+
+@lru_cache(maxsize=1024)
+def statement_fingerprint(statement: str) -> str:
+    """
+    Нормализует SQL: литералы -> ?, повторяющиеся строки VALUES -> одна строка и ", ...",
+    списки IN (?, ?, ...) и кортежи параметров -> (?+), пробелы схлопываются.
+    Слишком длинный отпечаток обрезается, а хеш полного текста в конце не дает
+    разным запросам с общим началом попасть в одну метку.
+    """
+    fingerprint = _LITERALS.sub("?", statement)
+    fingerprint = _VALUES_ROWS.sub(r"\1, ...", fingerprint)
+    fingerprint = _IN_LISTS.sub(r"\1 (?+)", fingerprint)
+    fingerprint = _PARAM_LISTS.sub("(?+)", fingerprint)
+    fingerprint = _SPACES.sub(" ", fingerprint).strip()
+    if len(fingerprint) <= FINGERPRINT_MAX_LENGTH:
+        return fingerprint
+    suffix = "... #" + hashlib.blake2b(fingerprint.encode(), digest_size=4).hexdigest()
+    return fingerprint[:FINGERPRINT_MAX_LENGTH - len(suffix)] + suffix
+
+
+def instrument_engine(engine, name: str):
+    """
+    Подключает замер времени запросов к движку SQLAlchemy (для async - к engine.sync_engine).
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("kko_query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["kko_query_started"].pop()
+        registry.observe(
+            "kko_db_query_duration_seconds",
+            (name, statement_fingerprint(statement)),
+            time.perf_counter() - started,
+        )
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        # После ошибки after_cursor_execute не вызывается - убираем отметку времени
+        if context.connection is not None:
+            started = context.connection.info.get("kko_query_started")
+            if started:
+                started.pop()
+
+
+class MetricsMiddleware:
+    """
+    ASGI-middleware: гистограмма времени ответа по методу, шаблону маршрута и статусу.
+    В метку идет шаблон (/api/users/{id}), а не фактический путь, чтобы число рядов было ограничено.
+    """
+
+    def __init__(self, app, static_files=None):
+        self.app = app
+        self.static_files = static_files
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            shared_counters.add("http_requests")
+            registry.observe(
+                "kko_http_request_duration_seconds",
+                (scope["method"], self._route(scope), str(status_code)),
+                time.perf_counter() - started,
+            )
+
+    def _route(self, scope) -> str:
+        route = scope.get("route")
+        if route is not None:
+            return route.path
+        if self.static_files is not None and scope.get("endpoint") is self.static_files:
+            return "static"
+        return "unmatched"
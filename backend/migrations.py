@@ -0,0 +1,239 @@
+import argparse
+import time
+
+from sqlalchemy import text
+
+from .database import DB_PATH, ENGINE, SESSIONLOCAL
+from .logger import logger
+from .partitions import ensure_partition_bounds
+from .process_lock import FileLock
+from .rollups import ensure_rollups
+from .user_agents import ensure_classification
+from .visit_dimensions import migrate_visits, needs_migration
+
+# DDL миграций зафиксирован в том виде, в каком они выпущены, и не строится по текущим
+# моделям: иначе база, прошедшая миграцию в разное время, получала бы разную схему.
+# Изменение модели оформляется новой миграцией в конце списка.
+
+# Схема миграции 1; таблицы и колонки следующих миграций сюда не входят
+BASELINE_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS users (
+        id INTEGER NOT NULL,
+        username VARCHAR,
+        email VARCHAR,
+        hashed_password VARCHAR,
+        role VARCHAR(7),
+        is_active BOOLEAN,
+        PRIMARY KEY (id)
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_users_id ON users (id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email ON users (email)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_username ON users (username)",
+    """CREATE TABLE IF NOT EXISTS page_urls (
+        id INTEGER NOT NULL,
+        value VARCHAR NOT NULL,
+        PRIMARY KEY (id),
+        UNIQUE (value)
+    )""",
+    """CREATE TABLE IF NOT EXISTS referrers (
+        id INTEGER NOT NULL,
+        value VARCHAR NOT NULL,
+        PRIMARY KEY (id),
+        UNIQUE (value)
+    )""",
+    """CREATE TABLE IF NOT EXISTS user_agents (
+        id INTEGER NOT NULL,
+        value VARCHAR NOT NULL,
+        browser VARCHAR,
+        os VARCHAR,
+        device VARCHAR,
+        is_bot BOOLEAN,
+        PRIMARY KEY (id),
+        UNIQUE (value)
+    )""",
+    """CREATE TABLE IF NOT EXISTS visits (
+        id INTEGER NOT NULL,
+        page_url_id INTEGER,
+        referrer_id INTEGER,
+        user_agent_id INTEGER,
+        visit_time DATETIME,
+        PRIMARY KEY (id),
+        FOREIGN KEY(page_url_id) REFERENCES page_urls (id),
+        FOREIGN KEY(referrer_id) REFERENCES referrers (id),
+        FOREIGN KEY(user_agent_id) REFERENCES user_agents (id)
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_visits_id ON visits (id)",
+    "CREATE INDEX IF NOT EXISTS ix_visits_visit_time ON visits (visit_time)",
+    "CREATE INDEX IF NOT EXISTS ix_visits_page_url_id ON visits (page_url_id)",
+    """CREATE TABLE IF NOT EXISTS visit_daily_rollups (
+        day DATE NOT NULL,
+        visits INTEGER NOT NULL,
+        PRIMARY KEY (day)
+    )""",
+    """CREATE TABLE IF NOT EXISTS visit_hourly_rollups (
+        hour DATETIME NOT NULL,
+        visits INTEGER NOT NULL,
+        PRIMARY KEY (hour)
+    )""",
+    """CREATE TABLE IF NOT EXISTS visit_page_daily_rollups (
+        day DATE NOT NULL,
+        page_url VARCHAR NOT NULL,
+        visits INTEGER NOT NULL,
+        PRIMARY KEY (day, page_url)
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_visit_page_daily_rollups_page_url ON visit_page_daily_rollups (page_url)",
+    """CREATE TABLE IF NOT EXISTS visit_daily_agent_rollups (
+        day DATE NOT NULL,
+        device VARCHAR NOT NULL,
+        browser VARCHAR NOT NULL,
+        visits INTEGER NOT NULL,
+        PRIMARY KEY (day, device, browser)
+    )""",
+    """CREATE TABLE IF NOT EXISTS visit_partitions (
+        "key" VARCHAR NOT NULL,
+        start DATETIME NOT NULL,
+        "end" DATETIME NOT NULL,
+        state VARCHAR NOT NULL,
+        rows INTEGER NOT NULL,
+        archive_path VARCHAR,
+        archived_at DATETIME,
+        PRIMARY KEY ("key")
+    )""",
+)
+
+
+def _execute_ddl(engine, statements):
+    with engine.begin() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
+
+
+def _baseline(engine):
+    # Старая схема visits со строками переводится на справочники
+    if needs_migration(engine):
+        migrate_visits(engine, BASELINE_SCHEMA)
+    else:
+        # Уже существующие таблицы не трогаем, недостающие индексы visits добавляем
+        _execute_ddl(engine, BASELINE_SCHEMA)
+    ensure_classification(engine)
+
+
+def _backfill_rollups(engine):
+    # Заполняем агрегаты посещений, если таблицы только что созданы
+    db = SESSIONLOCAL()
+    try:
+        ensure_rollups(db)
+    finally:
+        db.close()
+
+
+def _visitor_sketches(engine):
+    # Скетчи уникальных посетителей копятся с момента установки: отпечатки
+    # прошлых посещений не сохранялись, восстановить их по visits нельзя
+    _execute_ddl(engine, (
+        """CREATE TABLE IF NOT EXISTS visit_daily_sketches (
+            day DATE NOT NULL,
+            registers BLOB NOT NULL,
+            PRIMARY KEY (day)
+        )""",
+        """CREATE TABLE IF NOT EXISTS visit_page_daily_sketches (
+            day DATE NOT NULL,
+            page_url VARCHAR NOT NULL,
+            registers BLOB NOT NULL,
+            PRIMARY KEY (day, page_url)
+        )""",
+        "CREATE INDEX IF NOT EXISTS ix_visit_page_daily_sketches_page_url ON visit_page_daily_sketches (page_url)",
+    ))
+
+
+def _collected_events(engine):
+    _execute_ddl(engine, (
+        """CREATE TABLE IF NOT EXISTS collected_events (
+            id VARCHAR NOT NULL,
+            received_at DATETIME NOT NULL,
+            PRIMARY KEY (id)
+        )""",
+        "CREATE INDEX IF NOT EXISTS ix_collected_events_received_at ON collected_events (received_at)",
+    ))
+
+
+def _revoked_tokens(engine):
+    # AUTOINCREMENT: воркеры дочитывают таблицу по id, и id удаленных строк не должны повторяться
+    _execute_ddl(engine, (
+        """CREATE TABLE IF NOT EXISTS revoked_tokens (
+            id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+            token_id VARCHAR NOT NULL,
+            expires_at DATETIME NOT NULL,
+            revoked_at DATETIME NOT NULL,
+            UNIQUE (token_id)
+        )""",
+        "CREATE INDEX IF NOT EXISTS ix_revoked_tokens_expires_at ON revoked_tokens (expires_at)",
+    ))
+
+
+# Миграции применяются по порядку; номер версии схемы - позиция в списке.
+# Новую миграцию добавляем в конец, уже выпущенные не меняем.
+MIGRATIONS = [
+    ("baseline schema, dimension tables, user agent classification, visit indexes", _baseline),
+    ("backfill visit rollups", _backfill_rollups),
+    ("unique visitor sketches per day and page", _visitor_sketches),
+    ("client-side page view event ids", _collected_events),
+    ("revoked refresh tokens", _revoked_tokens),
+    ("visit partition id bounds", ensure_partition_bounds),
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def current_version(engine=ENGINE) -> int:
+    with engine.connect() as conn:
+        return conn.execute(text("PRAGMA user_version")).scalar()
+
+
+def _set_version(engine, version: int):
+    with engine.begin() as conn:
+        conn.execute(text(f"PRAGMA user_version = {int(version)}"))
+
+
+def run_migrations(engine=ENGINE) -> dict:
+    """
+    Доводит схему до SCHEMA_VERSION. Если версия уже совпадает, стоит одного PRAGMA.
+    Воркеры, стартующие одновременно, выполняют миграции по очереди под файловой блокировкой.
+    Returns:
+        dict: Версия до и после, примененные миграции и время
+    """
+    started = time.perf_counter()
+    version = current_version(engine)
+    applied = []
+    if version < SCHEMA_VERSION:
+        with FileLock(DB_PATH + ".migrate.lock"):
+            # Пока ждали блокировку, миграции мог выполнить другой воркер
+            version = current_version(engine)
+            for number, (description, migration) in enumerate(MIGRATIONS[version:], start=version + 1):
+                step_started = time.perf_counter()
+                migration(engine)
+                _set_version(engine, number)
+                applied.append(number)
+                logger.info(
+                    "Applied migration %s (%s) in %.3f s", number, description, time.perf_counter() - step_started
+                )
+    return {
+        "version": max([version, *applied]),
+        "applied": applied,
+        "seconds": round(time.perf_counter() - started, 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Версионные миграции схемы")
+    parser.add_argument("command", choices=["status", "upgrade"])
+    args = parser.parse_args()
+
+    if args.command == "upgrade":
+        print(run_migrations())
+    version = current_version()
+    for number, (description, _) in enumerate(MIGRATIONS, start=1):
+        print(f"{'x' if number <= version else ' '} {number:>3}  {description}")
+
+
+if __name__ == "__main__":
+    main()
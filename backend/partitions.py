@@ -0,0 +1,563 @@
+import argparse
+import asyncio
+import heapq
+import json
+import lzma
+import os
+import math
+import struct
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate, chain, islice
+from typing import NamedTuple, Optional
+
+from sqlalchemy import delete, func, inspect, select, text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from .database import Base, DB_PATH, ENGINE, SESSIONLOCAL, write_transaction
+from .db_models import PageUrl, Referrer, UserAgent, Visit, VisitPartition
+from .logger import logger, log_error
+from .process_lock import FileLock
+
+# Настройки секционирования посещений
+PARTITION_GRANULARITY = os.getenv("KKO_PARTITION_GRANULARITY", "month")
+# Архивирование включается явно: 0 - посещения остаются в базе, фоновый проход их не трогает
+VISIT_HOT_DAYS = int(os.getenv("KKO_VISIT_HOT_DAYS", "0"))
+ARCHIVE_RETENTION_DAYS = int(os.getenv("KKO_ARCHIVE_RETENTION_DAYS", "0"))  # 0 - хранить всегда
+# Архивы - данные базы, поэтому по умолчанию лежат рядом с ней: kko_site.db -> kko_site_archive/
+ARCHIVE_DIR = os.getenv("KKO_ARCHIVE_DIR", os.path.splitext(DB_PATH)[0] + "_archive")
+MAINTENANCE_INTERVAL = float(os.getenv("KKO_PARTITION_MAINTENANCE_INTERVAL", "3600"))
+# Сколько раскодированных секций держать в памяти для постраничного чтения архива
+ARCHIVE_CACHE_PARTITIONS = int(os.getenv("KKO_ARCHIVE_CACHE_PARTITIONS", "4"))
+# Строк в группе архива: потоковое чтение (выгрузка, сверка агрегатов) и архивирование
+# держат в памяти одну группу, а не всю секцию
+ARCHIVE_GROUP_ROWS = int(os.getenv("KKO_ARCHIVE_GROUP_ROWS", "50000"))
+DELETE_CHUNK_SIZE = 10000
+
+GRANULARITIES = ("month", "week")
+if PARTITION_GRANULARITY not in GRANULARITIES:
+    raise ValueError(f"Unknown partition granularity: {PARTITION_GRANULARITY}")
+
+# Архивирование и пересчет агрегатов (rollups.rebuild_rollups) не идут одновременно:
+# пересчет, прочитавший каталог секций до архивирования, потерял бы перенесенные дни
+maintenance_lock = FileLock(DB_PATH + ".maintenance.lock")
+
+ARCHIVE_MAGIC = b"KKOVISITS2\n"
+# Архив первой версии - одна группа на всю секцию, читается тем же кодом
+LEGACY_ARCHIVE_MAGIC = b"KKOVISITS1\n"
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+class ArchivedVisit(NamedTuple):
+    id: int
+    page_url: Optional[str]
+    referrer: Optional[str]
+    user_agent: Optional[str]
+    visit_time: datetime
+
+
+def naive_utc(moment: Optional[datetime]) -> Optional[datetime]:
+    # visit_time хранится в базе как наивное UTC-время
+    if moment is not None and moment.tzinfo is not None:
+        return moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def partition_bounds(moment: datetime, granularity: str = PARTITION_GRANULARITY):
+    """
+    Возвращает ключ секции и ее границы [start, end) для момента времени.
+    """
+    moment = naive_utc(moment)
+    if granularity == "week":
+        start = datetime(moment.year, moment.month, moment.day) - timedelta(days=moment.weekday())
+        year, week, _ = start.isocalendar()
+        return f"{year}-W{week:02d}", start, start + timedelta(days=7)
+    start = datetime(moment.year, moment.month, 1)
+    end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return f"{start.year}-{start.month:02d}", start, end
+
+
+# Формат архива: колонки хранятся отдельно и сжимаются lzma.
+# Целые (id, время в микросекундах) - разностями, строки - словарем и кодами.
+
+def _pack_ints(values) -> bytes:
+    deltas = array("q", (b - a for a, b in zip([0] + values[:-1], values)))
+    return lzma.compress(deltas.tobytes())
+
+
+def _unpack_ints(blob: bytes) -> list:
+    deltas = array("q")
+    deltas.frombytes(lzma.decompress(blob))
+    return list(accumulate(deltas))
+
+
+def _pack_strings(values) -> tuple:
+    dictionary = {}
+    codes = array("i", (-1 if value is None else dictionary.setdefault(value, len(dictionary)) for value in values))
+    return lzma.compress(json.dumps(list(dictionary), ensure_ascii=False).encode()), lzma.compress(codes.tobytes())
+
+
+def _unpack_strings(dictionary_blob: bytes, codes_blob: bytes) -> list:
+    dictionary = json.loads(lzma.decompress(dictionary_blob))
+    codes = array("i")
+    codes.frombytes(lzma.decompress(codes_blob))
+    return [None if code < 0 else dictionary[code] for code in codes]
+
+
+def _batched(rows, size: int):
+    iterator = iter(rows)
+    while group := list(islice(iterator, size)):
+        yield group
+
+
+def _pack_group(rows: list) -> bytes:
+    blobs = [
+        ("id", _pack_ints([row.id for row in rows])),
+        ("visit_time", _pack_ints([(row.visit_time - EPOCH) // MICROSECOND for row in rows])),
+    ]
+    for column in ("page_url", "referrer", "user_agent"):
+        dictionary_blob, codes_blob = _pack_strings([getattr(row, column) for row in rows])
+        blobs += [(f"{column}.dict", dictionary_blob), (f"{column}.codes", codes_blob)]
+
+    header = json.dumps({
+        "rows": len(rows),
+        "columns": [{"name": name, "length": len(blob)} for name, blob in blobs],
+    }).encode()
+    return struct.pack(">I", len(header)) + header + b"".join(blob for _, blob in blobs)
+
+
+def write_archive(path: str, rows, group_rows: int = ARCHIVE_GROUP_ROWS) -> tuple:
+    """
+    Записывает посещения в колоночный сжатый файл (атомарно, через временный файл).
+    Файл - последовательность независимо сжатых групп по group_rows строк:
+    строки можно передать генератором, в памяти держится одна группа.
+    Args:
+        rows: ArchivedVisit по возрастанию id
+    Returns:
+        tuple: (количество строк, первый id, последний id)
+    """
+    count, first_id, last_id = 0, None, None
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(ARCHIVE_MAGIC)
+        for group in _batched(rows, group_rows):
+            file.write(_pack_group(group))
+            count += len(group)
+            first_id = group[0].id if first_id is None else first_id
+            last_id = group[-1].id
+    os.replace(tmp_path, path)
+    return count, first_id, last_id
+
+
+def _iter_blob_groups(path: str, descending: bool = False):
+    # Сначала проходим по заголовкам групп, сжатые колонки читаем по одной группе
+    with open(path, "rb") as file:
+        if file.read(len(ARCHIVE_MAGIC)) not in (ARCHIVE_MAGIC, LEGACY_ARCHIVE_MAGIC):
+            raise ValueError(f"Not a visit archive: {path}")
+        groups = []
+        while prefix := file.read(4):
+            (header_length,) = struct.unpack(">I", prefix)
+            columns = json.loads(file.read(header_length))["columns"]
+            groups.append((file.tell(), columns))
+            file.seek(sum(column["length"] for column in columns), os.SEEK_CUR)
+        for offset, columns in reversed(groups) if descending else groups:
+            file.seek(offset)
+            yield {column["name"]: file.read(column["length"]) for column in columns}
+
+
+def _decode_group(blobs: dict) -> list:
+    ids = _unpack_ints(blobs["id"])
+    times = [EPOCH + value * MICROSECOND for value in _unpack_ints(blobs["visit_time"])]
+    strings = {
+        column: _unpack_strings(blobs[f"{column}.dict"], blobs[f"{column}.codes"])
+        for column in ("page_url", "referrer", "user_agent")
+    }
+    return [
+        ArchivedVisit(ids[i], strings["page_url"][i], strings["referrer"][i], strings["user_agent"][i], times[i])
+        for i in range(len(ids))
+    ]
+
+
+def iter_archive(path: str, descending: bool = False):
+    """
+    Читает архив секции по группам: в памяти одна раскодированная группа.
+    Returns:
+        Iterator[ArchivedVisit]: Посещения по возрастанию id (или по убыванию)
+    """
+    for blobs in _iter_blob_groups(path, descending):
+        rows = _decode_group(blobs)
+        yield from reversed(rows) if descending else rows
+
+
+def read_archive(path: str) -> list:
+    """
+    Читает архив секции целиком.
+    Returns:
+        list: ArchivedVisit в порядке возрастания id
+    """
+    return list(iter_archive(path))
+
+
+class ArchiveCache:
+    """
+    LRU-кэш раскодированных архивов секций: листание архива страницами
+    не распаковывает секцию заново на каждый запрос.
+    Запись сверяется с размером и mtime файла - перезаписанный архив читается снова.
+    """
+
+    def __init__(self, maxsize: int = ARCHIVE_CACHE_PARTITIONS):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path: str) -> tuple:
+        """
+        Returns:
+            tuple: (ArchivedVisit по возрастанию id, список id для бинарного поиска)
+        """
+        stat_result = os.stat(path)
+        version = (stat_result.st_size, stat_result.st_mtime_ns)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        rows = read_archive(path)
+        decoded = (rows, [row.id for row in rows])
+        with self._lock:
+            self._entries[path] = (version, decoded)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return decoded
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+archive_cache = ArchiveCache()
+
+
+def archived_partitions(db: Session, date_from=None, date_to=None, descending: bool = False, columns=()) -> list:
+    """
+    Архивные секции, пересекающиеся с периодом [date_from, date_to).
+    Args:
+        columns: Колонки VisitPartition - вернуть строки только с ними, а не объекты
+            (так читают каталог миграции, выполняемые до появления новых колонок)
+    """
+    query = db.query(*columns) if columns else db.query(VisitPartition)
+    query = query.filter(VisitPartition.state == "archived")
+    if date_from is not None:
+        query = query.filter(VisitPartition.end > naive_utc(date_from))
+    if date_to is not None:
+        query = query.filter(VisitPartition.start < naive_utc(date_to))
+    order = VisitPartition.start.desc() if descending else VisitPartition.start
+    return query.order_by(order).all()
+
+
+def expired_before(db: Session) -> Optional[datetime]:
+    """
+    Граница, до которой сырые посещения удалены по сроку хранения архивов.
+    """
+    return db.query(func.max(VisitPartition.end)).filter(VisitPartition.state == "expired").scalar()
+
+
+def _matches(row: ArchivedVisit, date_from, date_to, page_prefix) -> bool:
+    if date_from is not None and row.visit_time < date_from:
+        return False
+    if date_to is not None and row.visit_time >= date_to:
+        return False
+    return not page_prefix or (row.page_url or "").startswith(page_prefix)
+
+
+def iter_archived_visits(db: Session, date_from=None, date_to=None, page_prefix=None, descending: bool = False):
+    """
+    Посещения из архивных секций с теми же фильтрами, что и у crud.get_visits.
+    """
+    date_from, date_to = naive_utc(date_from), naive_utc(date_to)
+    for partition in archived_partitions(db, date_from, date_to, descending):
+        for row in iter_archive(partition.archive_path, descending):
+            if _matches(row, date_from, date_to, page_prefix):
+                yield row
+
+
+def archived_page(
+    db: Session, cursor: Optional[int], limit: int, date_from=None, date_to=None, page_prefix=None,
+) -> list:
+    """
+    Страница архивных посещений с id меньше cursor, от новых к старым.
+    Секции отбираются по границам времени и id из каталога, внутри секции
+    начало страницы находится бинарным поиском - обычно читается одна секция,
+    в которую попал курсор, а не весь архив.
+    Returns:
+        list: Не больше limit ArchivedVisit по убыванию id
+    """
+    date_from, date_to = naive_utc(date_from), naive_utc(date_to)
+    candidates = [
+        partition for partition in archived_partitions(db, date_from, date_to)
+        if cursor is None or partition.min_id is None or partition.min_id < cursor
+    ]
+    # Диапазоны id секций почти не пересекаются; секции без границ просматриваем первыми
+    candidates.sort(key=lambda partition: math.inf if partition.max_id is None else partition.max_id, reverse=True)
+    found = []
+    for partition in candidates:
+        # Дальше id только меньше самого старого посещения страницы - страница набрана
+        if len(found) >= limit and partition.max_id is not None and partition.max_id < found[-1].id:
+            break
+        rows, ids = archive_cache.get(partition.archive_path)
+        end = bisect_left(ids, cursor) if cursor is not None else len(ids)
+        taken = 0
+        for index in range(end - 1, -1, -1):
+            row = rows[index]
+            if _matches(row, date_from, date_to, page_prefix):
+                found.append(row)
+                taken += 1
+                if taken >= limit:
+                    break
+        found.sort(key=lambda row: row.id, reverse=True)
+        del found[limit:]
+    return found
+
+
+def _partition_rows(db: Session, start: datetime, end: datetime):
+    # Строки секции порциями по id; между порциями транзакция закрыта -
+    # файл пишется без нее, соединение писателя нужно приему посещений
+    last_id = 0
+    while True:
+        rows = [
+            ArchivedVisit(*row)
+            for row in db.execute(
+                select(Visit.id, PageUrl.value, Referrer.value, UserAgent.value, Visit.visit_time)
+                .select_from(Visit)
+                .outerjoin(PageUrl, PageUrl.id == Visit.page_url_id)
+                .outerjoin(Referrer, Referrer.id == Visit.referrer_id)
+                .outerjoin(UserAgent, UserAgent.id == Visit.user_agent_id)
+                .where(Visit.visit_time >= start, Visit.visit_time < end, Visit.id > last_id)
+                .order_by(Visit.id)
+                .limit(ARCHIVE_GROUP_ROWS)
+            )
+        ]
+        db.commit()
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1].id
+
+
+def _merge_by_id(fresh, archived):
+    # Обе последовательности идут по возрастанию id; при совпадении остается строка из базы
+    previous_id = None
+    for row in heapq.merge(fresh, archived, key=lambda row: row.id):
+        if row.id != previous_id:
+            yield row
+            previous_id = row.id
+
+
+def archive_partition(db: Session, key: str, start: datetime, end: datetime) -> int:
+    """
+    Переносит посещения секции в архивный файл и удаляет их из visits.
+    Строки читаются и пишутся группами, поэтому память не зависит от размера секции.
+    Файл пишется до удаления строк, поэтому сбой посередине не теряет данные:
+    при повторном запуске строки объединяются с архивом без дублей.
+    Returns:
+        int: Количество строк в архиве секции
+    """
+    rows = _partition_rows(db, start, end)
+    first = next(rows, None)
+    if first is None:
+        return 0
+    rows = chain([first], rows)
+
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(ARCHIVE_DIR, f"visits_{key}.kkov")
+    if os.path.exists(path):
+        rows = _merge_by_id(rows, iter_archive(path))
+    count, min_id, max_id = write_archive(path, rows)
+
+    # Удаляем порциями, чтобы не держать блокировку записи и не тормозить прием посещений
+    while True:
+        # Каждая порция - короткая транзакция под общей блокировкой записи
+        with write_transaction(db):
+            ids = db.execute(
+                select(Visit.id)
+                .where(Visit.visit_time >= start, Visit.visit_time < end, Visit.id <= max_id)
+                .limit(DELETE_CHUNK_SIZE)
+            ).scalars().all()
+            if ids:
+                db.execute(delete(Visit).where(Visit.id.in_(ids)))
+            db.commit()
+        if not ids:
+            break
+
+    stmt = insert(VisitPartition).values(
+        key=key, start=start, end=end, state="archived", rows=count, min_id=min_id, max_id=max_id,
+        archive_path=path, archived_at=datetime.now(timezone.utc),
+    )
+    updated = ("state", "rows", "min_id", "max_id", "archive_path", "archived_at")
+    with write_transaction(db):
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["key"],
+            set_={name: stmt.excluded[name] for name in updated},
+        ))
+        db.commit()
+    logger.info("Archived visit partition %s: %s rows -> %s", key, count, path)
+    return count
+
+
+def expire_archives(db: Session, now: datetime) -> list:
+    """
+    Удаляет архивы старше срока хранения. Агрегаты за эти дни сохраняются.
+    """
+    if ARCHIVE_RETENTION_DAYS <= 0:
+        return []
+    cutoff = naive_utc(now) - timedelta(days=ARCHIVE_RETENTION_DAYS)
+    expired = []
+    with write_transaction(db):
+        for partition in archived_partitions(db, date_to=cutoff):
+            if partition.end > cutoff:
+                continue
+            if os.path.exists(partition.archive_path):
+                os.remove(partition.archive_path)
+            partition.state = "expired"
+            expired.append(partition.key)
+        db.commit()
+    return expired
+
+
+def ensure_partition_bounds(engine):
+    """
+    Добавляет в каталог секций границы id и заполняет их по уже записанным архивам.
+    """
+    columns = {column["name"] for column in inspect(engine).get_columns("visit_partitions")}
+    with engine.begin() as conn:
+        for name in ("min_id", "max_id"):
+            if name not in columns:
+                conn.execute(text(f"ALTER TABLE visit_partitions ADD COLUMN {name} INTEGER"))
+        partitions = conn.execute(text(
+            "SELECT key, archive_path FROM visit_partitions WHERE state = 'archived' AND min_id IS NULL"
+        )).all()
+        for key, path in partitions:
+            if not path or not os.path.exists(path):
+                continue
+            # Распаковывается только колонка id, по одной группе
+            min_id = max_id = None
+            for blobs in _iter_blob_groups(path):
+                ids = _unpack_ints(blobs["id"])
+                if ids:
+                    min_id = ids[0] if min_id is None else min_id
+                    max_id = ids[-1]
+            if min_id is not None:
+                conn.execute(
+                    text("UPDATE visit_partitions SET min_id = :min_id, max_id = :max_id WHERE key = :key"),
+                    {"min_id": min_id, "max_id": max_id, "key": key},
+                )
+
+
+def run_maintenance(now: Optional[datetime] = None, hot_days: int = VISIT_HOT_DAYS) -> dict:
+    """
+    Архивирует секции, вышедшие из горячего окна, и применяет срок хранения архивов.
+    Вызывающий держит maintenance_lock (так делают maintenance_loop и команда archive).
+    Args:
+        now: Текущий момент (для тестов)
+        hot_days: Горячее окно в днях; 0 - не архивировать
+    """
+    now = naive_utc(now or datetime.now(timezone.utc))
+    cutoff = now - timedelta(days=hot_days)
+    archived = []
+    db = SESSIONLOCAL()
+    try:
+        oldest = db.query(func.min(Visit.visit_time)).scalar() if hot_days > 0 else None
+        while oldest is not None:
+            key, start, end = partition_bounds(oldest)
+            if end > cutoff:
+                break
+            if archive_partition(db, key, start, end):
+                archived.append(key)
+            oldest = db.query(func.min(Visit.visit_time)).filter(Visit.visit_time >= end).scalar()
+        expired = expire_archives(db, now)
+        return {"archived": archived, "expired": expired}
+    except Exception as e:
+        db.rollback()
+        log_error(e, "Error archiving visit partitions")
+        raise
+    finally:
+        db.close()
+
+
+async def maintenance_loop(interval: float = MAINTENANCE_INTERVAL):
+    """
+    Фоновое обслуживание секций; работает в потоке, чтобы не блокировать цикл событий.
+    Из нескольких воркеров проход в каждый момент делает только один.
+    """
+    if VISIT_HOT_DAYS <= 0 and ARCHIVE_RETENTION_DAYS <= 0:
+        logger.info("Visit partition archiving is disabled (KKO_VISIT_HOT_DAYS=0)")
+        return
+    while True:
+        if maintenance_lock.acquire(blocking=False):
+            try:
+                await asyncio.to_thread(run_maintenance)
+            except Exception:
+                logger.warning("Visit partition maintenance failed, will retry in %s s", interval)
+            finally:
+                maintenance_lock.release()
+        await asyncio.sleep(interval)
+
+
+def partition_status(db: Session) -> list:
+    """
+    Секции в базе (горячие) и в архиве с количеством строк.
+    """
+    status = {}
+    for moment, count in db.execute(
+        select(Visit.visit_time, func.count()).group_by(func.strftime("%Y-%m-%d", Visit.visit_time))
+    ):
+        key, start, end = partition_bounds(moment)
+        entry = status.setdefault(key, {"key": key, "start": start, "end": end, "state": "active", "rows": 0})
+        entry["rows"] += count
+    for partition in db.query(VisitPartition).all():
+        entry = status.setdefault(partition.key, {
+            "key": partition.key, "start": partition.start, "end": partition.end, "rows": 0,
+        })
+        entry["state"] = partition.state if entry.get("state") != "active" else "active+" + partition.state
+        entry["archived_rows"] = partition.rows
+    return sorted(status.values(), key=lambda entry: entry["start"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Секционирование и архивирование посещений")
+    parser.add_argument("command", choices=["status", "archive"])
+    parser.add_argument(
+        "--hot-days", type=int, default=VISIT_HOT_DAYS,
+        help="Архивировать посещения старше этого числа дней (по умолчанию KKO_VISIT_HOT_DAYS)",
+    )
+    args = parser.parse_args()
+    if args.command == "archive" and args.hot_days <= 0:
+        parser.error("archiving is disabled: set --hot-days or KKO_VISIT_HOT_DAYS")
+
+    Base.metadata.create_all(bind=ENGINE)
+    if args.command == "archive":
+        with maintenance_lock:
+            print(run_maintenance(hot_days=args.hot_days))
+    db = SESSIONLOCAL()
+    try:
+        for entry in partition_status(db):
+            print(
+                f"{entry['key']:>10}  {entry['state']:<16} rows={entry['rows']:<8} "
+                f"archived={entry.get('archived_rows', 0)}"
+            )
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
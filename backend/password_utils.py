@@ -1,9 +1,133 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
 
+from .metrics import registry
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Пул для bcrypt: библиотека отпускает GIL, поэтому потоков достаточно
+HASH_WORKERS = int(os.getenv("KKO_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_QUEUE_LIMIT = int(os.getenv("KKO_HASH_QUEUE_LIMIT", "32"))
+# Массовый импорт пользователей хеширует в отдельном пуле, чтобы не занимать очередь входов
+BULK_HASH_WORKERS = int(os.getenv("KKO_BULK_HASH_WORKERS", str(os.cpu_count() or 1)))
+# Сверх потоков импорта в очереди ждет не больше одной пачки: второй параллельный импорт
+# ждет, третий сразу получает 503
+BULK_HASH_QUEUE_LIMIT = int(os.getenv("KKO_BULK_HASH_QUEUE_LIMIT", str(BULK_HASH_WORKERS)))
+
+
+class HashingPoolBusy(Exception):
+    """
+    Пул хеширования переполнен, запрос нужно отклонить сразу (503).
+    """
+
+
+class HashingPool:
+    """
+    Ограниченный пул для хеширования и проверки паролей.
+    Не дает bcrypt блокировать цикл событий и отклоняет задачи сверх лимита очереди.
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, queue_limit: int = HASH_QUEUE_LIMIT, name: str = "bcrypt"):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+        # Метрики
+        self.rejected = 0
+        self.latency = {
+            "hash": {"count": 0, "total": 0.0, "max": 0.0},
+            "verify": {"count": 0, "total": 0.0, "max": 0.0},
+            "bulk_hash": {"count": 0, "total": 0.0, "max": 0.0},
+        }
+
+    def _timed(self, operation: str, func, *args):
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            registry.observe("kko_password_duration_seconds", (operation,), elapsed)
+            with self._lock:
+                stats = self.latency[operation]
+                stats["count"] += 1
+                stats["total"] += elapsed
+                stats["max"] = max(stats["max"], elapsed)
+
+    def _reserve(self, count: int):
+        with self._lock:
+            if self._in_flight + count > self.workers + self.queue_limit:
+                self.rejected += 1
+                raise HashingPoolBusy(f"Password hashing pool is saturated ({self._in_flight} in flight)")
+            self._in_flight += count
+
+    def _release(self, _future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _submit(self, operation: str, func, *args):
+        future = self._executor.submit(self._timed, operation, func, *args)
+        # Место освобождается и для отмененной задачи: клиент ушел, пока она ждала в очереди,
+        # и _timed для нее уже не выполнится
+        future.add_done_callback(self._release)
+        return future
+
+    def submit(self, operation: str, func, *args):
+        self._reserve(1)
+        return self._submit(operation, func, *args)
+
+    def submit_batch(self, operation: str, func, items: list) -> list:
+        """
+        Ставит пачку задач целиком или не ставит ни одной (HashingPoolBusy):
+        отклоненная пачка не оставляет в пуле задач, результат которых никому не нужен.
+        """
+        self._reserve(len(items))
+        return [self._submit(operation, func, item) for item in items]
+
+    def stats(self) -> dict:
+        return {
+            "scheme": pwd_context.default_scheme(),
+            "rounds": pwd_context.handler().default_rounds,
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "in_flight": self._in_flight,
+            "rejected": self.rejected,
+            "latency": {operation: dict(stats) for operation, stats in self.latency.items()},
+        }
+
+
+hashing_pool = HashingPool()
+bulk_hashing_pool = HashingPool(BULK_HASH_WORKERS, BULK_HASH_QUEUE_LIMIT, name="bcrypt-bulk")
+
+
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return hashing_pool.submit("verify", pwd_context.verify, plain_password, hashed_password).result()
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return hashing_pool.submit("hash", pwd_context.hash, password).result()
+
+async def verify_password_async(plain_password, hashed_password):
+    future = hashing_pool.submit("verify", pwd_context.verify, plain_password, hashed_password)
+    return await asyncio.wrap_future(future)
+
+async def get_password_hash_async(password):
+    return await asyncio.wrap_future(hashing_pool.submit("hash", pwd_context.hash, password))
+
+async def get_password_hashes_async(passwords: list) -> list:
+    """
+    Хеширует пароли импорта в пуле bulk_hashing_pool пачками по числу его потоков:
+    в пуле и в gather одновременно не больше одной пачки этого импорта.
+    Raises:
+        HashingPoolBusy: Пул занят другими импортами
+    """
+    chunk_size = bulk_hashing_pool.workers
+    hashes = []
+    for start in range(0, len(passwords), chunk_size):
+        futures = bulk_hashing_pool.submit_batch("bulk_hash", pwd_context.hash, passwords[start:start + chunk_size])
+        hashes += await asyncio.gather(*map(asyncio.wrap_future, futures))
+    return hashes
@@ -0,0 +1,92 @@
+import asyncio
+import os
+import threading
+from contextlib import asynccontextmanager
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+
+class FileLock:
+    """
+    Межпроцессная блокировка на файле (flock в Unix, msvcrt.locking в Windows).
+    Нужна, когда несколько воркеров одного сервера должны выполнять действие по очереди:
+    миграции при старте, запись в SQLite.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+        self._thread_lock = threading.Lock()
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self._thread_lock.acquire(blocking):
+            return False
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if os.name == "nt":
+                    msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                else:
+                    fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                if blocking:
+                    raise
+                self._thread_lock.release()
+                return False
+            self._fd = fd
+            return True
+        except Exception:
+            if self._fd is None and self._thread_lock.locked():
+                self._thread_lock.release()
+            raise
+
+    def release(self):
+        fd, self._fd = self._fd, None
+        try:
+            if os.name == "nt":
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+            self._thread_lock.release()
+
+    async def acquire_async(self):
+        """
+        Захват из асинхронного кода: ожидание идет в потоке, цикл событий не блокируется.
+        Если ожидающую задачу отменят, блокировку, которую поток захватит позже,
+        освободит обработчик завершения - иначе она осталась бы занятой навсегда.
+        """
+        waiter = asyncio.ensure_future(asyncio.to_thread(self.acquire))
+        try:
+            await asyncio.shield(waiter)
+        except asyncio.CancelledError:
+            waiter.add_done_callback(self._release_abandoned)
+            raise
+
+    def _release_abandoned(self, waiter: asyncio.Future):
+        if not waiter.cancelled() and waiter.exception() is None:
+            self.release()
+
+    @asynccontextmanager
+    async def hold(self):
+        """
+        async with lock.hold(): ... - асинхронный аналог with lock: ...
+        """
+        await self.acquire_async()
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
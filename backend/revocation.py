@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import math
+import os
+import time
+from datetime import timezone
+from typing import Optional
+
+from sqlalchemy import select
+
+from .database import READ_ENGINE
+from .db_models import RevokedToken
+from .logger import logger
+from .user_cache import token_cache
+
+# Настройки списка отозванных токенов (переопределяются переменными окружения)
+REVOCATION_CAPACITY = int(os.getenv("KKO_REVOCATION_CAPACITY", "100000"))
+REVOCATION_ERROR_RATE = float(os.getenv("KKO_REVOCATION_ERROR_RATE", "0.01"))
+REVOCATION_REFRESH_INTERVAL = float(os.getenv("KKO_REVOCATION_REFRESH_INTERVAL", "1.0"))
+REVOCATION_PRUNE_INTERVAL = int(os.getenv("KKO_REVOCATION_PRUNE_INTERVAL", "3600"))
+
+
+class BloomFilter:
+    """
+    Фильтр Блума: ответ "нет" точный, "да" ошибочен с вероятностью error_rate
+    при заполнении до capacity. Около 10 бит на элемент при 1%.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = REVOCATION_ERROR_RATE):
+        self.capacity = capacity
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        # Две половины одного хэша дают k позиций (схема Кирша-Митценмахера)
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "big")
+        step = int.from_bytes(digest[8:], "big") | 1
+        return ((first + i * step) % self.size for i in range(self.hashes))
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationList:
+    """
+    Отозванные id токенов: jti использованных refresh-токенов и семейства (fam) целиком.
+
+    Проверка идет только в памяти: фильтр Блума отсекает почти все неотозванные id,
+    попадание подтверждается точным словарем. Источник истины - таблица revoked_tokens;
+    каждый воркер загружает ее при старте и дочитывает новые строки по id,
+    поэтому отзыв в одном воркере доходит до остальных за REVOCATION_REFRESH_INTERVAL.
+    """
+
+    def __init__(self, capacity: int = REVOCATION_CAPACITY, error_rate: float = REVOCATION_ERROR_RATE):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._expires = {}
+        self.last_id = 0
+        self._pruned_at = time.time()
+        self.false_positives = 0
+
+    def add(self, token_id: str, expires_at: float):
+        """
+        Отмечает id отозванным до expires_at (после этого токен истекает сам).
+        """
+        self._expires[token_id] = max(expires_at, self._expires.get(token_id, 0))
+        if len(self._expires) > self._bloom.capacity:
+            self._rebuild()
+        else:
+            self._bloom.add(token_id)
+        # Доступ по уже проверенным токенам семейства закрывается сразу
+        token_cache.invalidate_family(token_id)
+
+    def is_revoked(self, token_id: Optional[str]) -> bool:
+        if token_id is None or token_id not in self._bloom:
+            return False
+        if token_id not in self._expires:
+            self.false_positives += 1
+            return False
+        return True
+
+    def _rebuild(self):
+        self._bloom = BloomFilter(max(self.capacity, 2 * len(self._expires)), self.error_rate)
+        for token_id in self._expires:
+            self._bloom.add(token_id)
+
+    def prune(self, now: Optional[float] = None):
+        """
+        Забывает id истекших токенов и пересобирает фильтр (из него удалять нельзя).
+        """
+        now = time.time() if now is None else now
+        self._expires = {token_id: expires for token_id, expires in self._expires.items() if expires > now}
+        self._rebuild()
+        self._pruned_at = now
+
+    def _tail(self) -> list:
+        with READ_ENGINE.connect() as conn:
+            return conn.execute(
+                select(RevokedToken.id, RevokedToken.token_id, RevokedToken.expires_at)
+                .where(RevokedToken.id > self.last_id)
+                .order_by(RevokedToken.id)
+            ).all()
+
+    async def refresh(self) -> int:
+        """
+        Дочитывает новые отзывы из базы (при первом вызове - все).
+        Returns:
+            int: Количество прочитанных строк
+        """
+        rows = await asyncio.to_thread(self._tail)
+        for row_id, token_id, expires_at in rows:
+            self.add(token_id, expires_at.replace(tzinfo=timezone.utc).timestamp())
+            self.last_id = row_id
+        if time.time() - self._pruned_at >= REVOCATION_PRUNE_INTERVAL:
+            self.prune()
+        return len(rows)
+
+    async def run(self, interval: float = REVOCATION_REFRESH_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh()
+            except Exception:
+                logger.warning("Token revocation refresh failed, will retry in %s s", interval)
+
+    def stats(self) -> dict:
+        return {
+            "revoked": len(self._expires),
+            "bloom_bits": self._bloom.size,
+            "bloom_hashes": self._bloom.hashes,
+            "false_positives": self.false_positives,
+            "last_id": self.last_id,
+        }
+
+
+revocations = RevocationList()
@@ -0,0 +1,308 @@
+import argparse
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from .database import Base, ENGINE, SESSIONLOCAL, write_transaction
+from .db_models import (
+    PageUrl, UserAgent, Visit, VisitDailyAgentRollup, VisitDailyRollup, VisitDailySketch, VisitHourlyRollup,
+    VisitPageDailyRollup, VisitPageDailySketch, VisitPartition,
+)
+from .hll import HyperLogLog, hash64
+from .logger import logger, log_error
+from .partitions import archived_partitions, expired_before, iter_archive, iter_archived_visits, maintenance_lock
+from .stats_cache import stats_cache
+from .user_agents import classify
+
+
+def _as_day(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _as_hour(value) -> datetime:
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value)[:19])
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+class _RollupDelta:
+    """
+    Приращения всех агрегатов для одной пачки посещений.
+    """
+
+    def __init__(self):
+        self.daily = Counter()
+        self.hourly = Counter()
+        self.page_daily = Counter()
+        self.agent_daily = Counter()
+        self.daily_sketches = {}
+        self.page_sketches = {}
+
+    def add(self, moment, page_url: str, user_agent: str, count: int = 1, visitor: Optional[str] = None):
+        info = classify(user_agent)
+        hour = _as_hour(moment)
+        day = hour.date()
+        self.daily[day] += count
+        self.hourly[hour] += count
+        self.page_daily[(day, page_url)] += count
+        self.agent_daily[(day, info.device, info.browser)] += count
+        if visitor:
+            hashed = hash64(visitor)
+            for sketches, key in ((self.daily_sketches, (day,)), (self.page_sketches, (day, page_url))):
+                if key not in sketches:
+                    sketches[key] = HyperLogLog()
+                sketches[key].add_hash(hashed)
+
+    def upsert(self, db: Session):
+        _upsert(db, VisitDailyRollup, ["day"], [
+            {"day": day, "visits": count} for day, count in self.daily.items()
+        ])
+        _upsert(db, VisitHourlyRollup, ["hour"], [
+            {"hour": hour, "visits": count} for hour, count in self.hourly.items()
+        ])
+        _upsert(db, VisitPageDailyRollup, ["day", "page_url"], [
+            {"day": day, "page_url": page_url, "visits": count}
+            for (day, page_url), count in self.page_daily.items()
+        ])
+        _upsert(db, VisitDailyAgentRollup, ["day", "device", "browser"], [
+            {"day": day, "device": device, "browser": browser, "visits": count}
+            for (day, device, browser), count in self.agent_daily.items()
+        ])
+        _merge_sketches(db, VisitDailySketch, ["day"], self.daily_sketches)
+        _merge_sketches(db, VisitPageDailySketch, ["day", "page_url"], self.page_sketches)
+
+
+def _upsert(db: Session, model, keys: list, rows: list):
+    if rows:
+        stmt = insert(model)
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=keys,
+                set_={"visits": model.visits + stmt.excluded.visits},
+            ),
+            rows,
+        )
+
+
+def _merge_sketches(db: Session, model, keys: list, sketches: dict):
+    """
+    Объединяет скетчи пачки с сохраненными: чтение, слияние регистров и запись.
+    Безопасно без отдельной блокировки: пачки пишутся по одной (database.write_lock),
+    а чтение и запись идут в одной транзакции.
+    """
+    if not sketches:
+        return
+    columns = [getattr(model, key) for key in keys]
+    stored = db.execute(
+        select(*columns, model.registers).where(
+            *(column.in_({key[i] for key in sketches}) for i, column in enumerate(columns))
+        )
+    ).all()
+    for *key, registers in stored:
+        sketch = sketches.get(tuple(key))
+        if sketch is not None:
+            sketch.merge(HyperLogLog(registers))
+    stmt = insert(model)
+    db.execute(
+        stmt.on_conflict_do_update(index_elements=keys, set_={"registers": stmt.excluded.registers}),
+        [{**dict(zip(keys, key)), "registers": sketch.to_bytes()} for key, sketch in sketches.items()],
+    )
+
+
+def apply_visits(db: Session, rows: list):
+    """
+    Инкрементально добавляет пачку посещений в агрегаты.
+    Вызывается в той же транзакции, что и вставка в visits; коммит делает вызывающий.
+    Args:
+        rows: Список словарей с page_url, user_agent, visit_time и необязательным visitor
+    """
+    delta = _RollupDelta()
+    for row in rows:
+        delta.add(row["visit_time"], row["page_url"], row.get("user_agent"), visitor=row.get("visitor"))
+    delta.upsert(db)
+
+
+def _stored_days(db: Session) -> set:
+    # Дни, по которым есть горячие посещения или уже посчитанные агрегаты
+    days = set()
+    for query in (
+        "SELECT DISTINCT DATE(visit_time) FROM visits",
+        "SELECT DISTINCT day FROM visit_daily_rollups",
+        "SELECT DISTINCT DATE(hour) FROM visit_hourly_rollups",
+        "SELECT DISTINCT day FROM visit_page_daily_rollups",
+        "SELECT DISTINCT day FROM visit_daily_agent_rollups",
+    ):
+        days.update(_as_day(value) for (value,) in db.execute(text(query)) if value is not None)
+    return days
+
+
+def _archive_deltas(path: str) -> dict:
+    # Приращения по дням из одной архивной секции; архив читается по группам строк
+    deltas = {}
+    for row in iter_archive(path):
+        if row.page_url is not None:
+            day = row.visit_time.date()
+            if day not in deltas:
+                deltas[day] = _RollupDelta()
+            deltas[day].add(row.visit_time, row.page_url, row.user_agent, 1)
+    return deltas
+
+
+def _rebuild_day(db: Session, day: date, delta: Optional[_RollupDelta]) -> int:
+    """
+    Пересчитывает агрегаты одного дня в отдельной короткой транзакции.
+    Под блокировкой записи пачка посещений за этот день попадает либо в пересчет,
+    либо в агрегаты после него, но не теряется и не учитывается дважды.
+    """
+    start = datetime.combine(day, datetime.min.time())
+    end = start + timedelta(days=1)
+    delta = delta or _RollupDelta()
+    hour = func.strftime("%Y-%m-%d %H:00:00", Visit.visit_time)
+    with write_transaction(db):
+        for moment, page_url, user_agent, count in db.execute(
+            select(hour, PageUrl.value, UserAgent.value, func.count())
+            .select_from(Visit)
+            .join(PageUrl, PageUrl.id == Visit.page_url_id)
+            .outerjoin(UserAgent, UserAgent.id == Visit.user_agent_id)
+            .where(Visit.visit_time >= start, Visit.visit_time < end)
+            .group_by(hour, Visit.page_url_id, Visit.user_agent_id)
+        ):
+            delta.add(moment, page_url, user_agent, count)
+        for model in (VisitDailyRollup, VisitPageDailyRollup, VisitDailyAgentRollup):
+            db.query(model).filter(model.day == day).delete(synchronize_session=False)
+        db.query(VisitHourlyRollup).filter(
+            VisitHourlyRollup.hour >= start, VisitHourlyRollup.hour < end
+        ).delete(synchronize_session=False)
+        delta.upsert(db)
+        db.commit()
+    stats_cache.advance()
+    return sum(delta.daily.values())
+
+
+def rebuild_rollups(db: Session) -> int:
+    """
+    Пересчитывает агрегаты с нуля по сырым посещениям (архивные секции и visits).
+    Каждый день - отдельная короткая транзакция под database.write_lock, поэтому
+    прием посещений во время пересчета ждет не дольше одного дня, а не всего пересчета.
+    Архивирование секций на время пересчета приостанавливается (partitions.maintenance_lock).
+    Дни удаленных по сроку хранения архивов не трогаются - сырых данных за них больше нет.
+    Скетчи уникальных посетителей не пересчитываются: отпечатки в visits не хранятся.
+    Returns:
+        int: Количество обработанных посещений
+    """
+    try:
+        with maintenance_lock:
+            kept_until = expired_before(db)
+            days = {day for day in _stored_days(db) if kept_until is None or day >= kept_until.date()}
+            # Значения, а не объекты: коммиты по дням сбрасывают загруженные объекты сессии
+            archived = [
+                (start.date(), end.date(), path)
+                for start, end, path in archived_partitions(
+                    db, columns=(VisitPartition.start, VisitPartition.end, VisitPartition.archive_path)
+                )
+            ]
+            processed = 0
+            for start, end, path in archived:
+                deltas = _archive_deltas(path)
+                for day in sorted(deltas.keys() | {day for day in days if start <= day < end}):
+                    processed += _rebuild_day(db, day, deltas.get(day))
+                    days.discard(day)
+            for day in sorted(days):
+                processed += _rebuild_day(db, day, None)
+            logger.info("Visit rollups rebuilt from %s visits", processed)
+            return processed
+    except Exception as e:
+        db.rollback()
+        log_error(e, "Error rebuilding visit rollups")
+        raise
+
+
+def ensure_rollups(db: Session):
+    """
+    Заполняет пустые агрегаты, если в базе уже есть посещения (первый запуск после обновления).
+    """
+    if db.query(Visit).first() is None:
+        return
+    models = (VisitDailyRollup, VisitHourlyRollup, VisitDailyAgentRollup)
+    if any(db.query(model).first() is None for model in models):
+        rebuild_rollups(db)
+
+
+def check_rollups(db: Session) -> list:
+    """
+    Сверяет агрегаты с сырыми посещениями (visits и архивы) по дням.
+    Returns:
+        list: Расхождения в виде словарей day/raw/daily/hourly/pages/agents; пустой список, если все сходится
+    """
+    # Считаются те же посещения, что попадают в агрегаты: без страницы их пропускают
+    # и прием, и rebuild_rollups (в visits и в архивах одинаково)
+    raw = Counter({
+        _as_day(day): count
+        for day, count in db.execute(text(
+            "SELECT DATE(visit_time), COUNT(*) FROM visits "
+            "WHERE page_url_id IS NOT NULL AND visit_time IS NOT NULL GROUP BY DATE(visit_time)"
+        )).all()
+    })
+    raw.update(row.visit_time.date() for row in iter_archived_visits(db) if row.page_url is not None)
+    kept_until = expired_before(db)
+    daily = dict(db.query(VisitDailyRollup.day, VisitDailyRollup.visits).all())
+    hourly = Counter()
+    for hour, count in db.query(VisitHourlyRollup.hour, VisitHourlyRollup.visits):
+        hourly[hour.date()] += count
+    pages = dict(
+        db.query(VisitPageDailyRollup.day, func.sum(VisitPageDailyRollup.visits))
+        .group_by(VisitPageDailyRollup.day)
+        .all()
+    )
+    agents = dict(
+        db.query(VisitDailyAgentRollup.day, func.sum(VisitDailyAgentRollup.visits))
+        .group_by(VisitDailyAgentRollup.day)
+        .all()
+    )
+
+    mismatches = []
+    for day in sorted(set(raw) | set(daily) | set(hourly) | set(pages) | set(agents)):
+        if kept_until is not None and day < kept_until.date():
+            continue
+        counts = (
+            raw.get(day, 0), daily.get(day, 0), hourly.get(day, 0), pages.get(day, 0), agents.get(day, 0),
+        )
+        if len(set(counts)) > 1:
+            mismatches.append({
+                "day": day.isoformat(), "raw": counts[0], "daily": counts[1],
+                "hourly": counts[2], "pages": counts[3], "agents": counts[4],
+            })
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обслуживание агрегатов посещений")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=ENGINE)
+    db = SESSIONLOCAL()
+    try:
+        if args.command == "rebuild":
+            processed = rebuild_rollups(db)
+            print(f"Rebuilt rollups from {processed} visits")
+        mismatches = check_rollups(db)
+        for mismatch in mismatches:
+            print(f"Mismatch: {mismatch}")
+        print("Rollups are consistent" if not mismatches else f"{len(mismatches)} day(s) differ")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
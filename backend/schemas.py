@@ -1,5 +1,6 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from pydantic import BaseModel, EmailStr, Field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
 from .db_models import UserRole
 
 class UserBase(BaseModel):
@@ -17,9 +18,73 @@ class User(UserBase):
     class Config:
         from_attributes = True
 
+class UserPage(BaseModel):
+    users: List[User]
+    next_cursor: Optional[int] = None
+
+class UserImport(BaseModel):
+    # Записи проверяются по одной, чтобы ошибка в одной не отклоняла весь импорт
+    users: List[Dict[str, Any]]
+
+class UserImportError(BaseModel):
+    index: int
+    username: Optional[str] = None
+    error: str
+
+class UserImportResult(BaseModel):
+    created: List[User]
+    errors: List[UserImportError]
+
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
     username: Optional[str] = None
+
+class Visit(BaseModel):
+    id: int
+    page_url: str
+    referrer: Optional[str] = None
+    user_agent: Optional[str] = None
+    visit_time: datetime
+
+    class Config:
+        from_attributes = True
+
+class VisitPage(BaseModel):
+    visits: List[Visit]
+    next_cursor: Optional[int] = None
+
+class CollectEvent(BaseModel):
+    # Просмотр страницы, собранный на клиенте; id генерирует клиент для дедупликации повторов
+    id: str = Field(min_length=8, max_length=64)
+    page_url: str = Field(min_length=1, max_length=2048, pattern=r"^/")
+    referrer: Optional[str] = Field(None, max_length=2048)
+    ts: datetime
+
+class CollectRejected(BaseModel):
+    index: int
+    error: str
+
+class CollectResult(BaseModel):
+    accepted: int
+    duplicates: int
+    rejected: List[CollectRejected]
+
+class Video(BaseModel):
+    name: str
+    url: str
+    size: int
+    content_type: str
+    duration: Optional[float] = None
+    modified: datetime
+
+class VideoPage(BaseModel):
+    videos: List[Video]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,60 @@
+import argparse
+import os
+import tempfile
+
+import uvicorn
+
+from .shared_counters import create_region
+
+# Настройки продакшен-сервера
+SERVER_HOST = os.getenv("KKO_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("KKO_PORT", "8000"))
+SERVER_WORKERS = int(os.getenv("KKO_WORKERS", str(os.cpu_count() or 1)))
+GRACEFUL_TIMEOUT = int(os.getenv("KKO_GRACEFUL_TIMEOUT", "30"))
+APP_PATH = os.getenv("KKO_APP", "backend.main:app")
+
+
+def main():
+    """
+    Продакшен-запуск: N процессов uvicorn под супервизором.
+    - упавший воркер перезапускается, SIGHUP перезапускает всех по очереди;
+    - при остановке воркер дописывает буфер посещений (до --graceful-timeout секунд);
+    - счетчики воркеров сводятся через общий mmap-файл (backend.shared_counters);
+    - миграции выполняются один раз здесь, до запуска воркеров.
+    Запуск из корня проекта: python -m backend.server --workers 4
+    """
+    parser = argparse.ArgumentParser(description="Продакшен-сервер с несколькими воркерами")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS)
+    parser.add_argument("--graceful-timeout", type=int, default=GRACEFUL_TIMEOUT)
+    parser.add_argument("--app", default=APP_PATH)
+    args = parser.parse_args()
+
+    counters_path = os.path.join(tempfile.gettempdir(), f"kko_counters_{os.getpid()}.bin")
+    create_region(counters_path)
+    # Воркеры наследуют окружение супервизора
+    os.environ["KKO_SHARED_COUNTERS"] = counters_path
+    os.environ["KKO_WORKERS"] = str(args.workers)
+
+    from .migrations import run_migrations
+    run_migrations()
+
+    try:
+        uvicorn.run(
+            args.app,
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            timeout_graceful_shutdown=args.graceful_timeout,
+            proxy_headers=True,
+            access_log=False,
+        )
+    finally:
+        for path in (counters_path, counters_path + ".lock"):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import mmap
+import os
+import time
+from typing import Optional
+
+from .process_lock import FileLock
+
+# Файл общей памяти создает backend.server и передает воркерам через окружение.
+# Без него (один процесс, разработка) счетчики живут в анонимной памяти процесса.
+SHARED_COUNTERS_PATH = os.getenv("KKO_SHARED_COUNTERS")
+MAX_WORKERS = 64
+HEARTBEAT_TIMEOUT = 30
+
+# sum - копится за все время, в том числе от завершившихся воркеров;
+# live - текущее значение, суммируется только по живым воркерам; max - максимум по всем
+FIELDS = {
+    "visits_enqueued": "sum",
+    "visits_flushed": "sum",
+    "visits_dropped": "sum",
+    "visits_failed": "sum",
+    "visits_collected": "sum",
+    "bots_skipped": "sum",
+    "visit_batches": "sum",
+    "http_requests": "sum",
+    "requests_shed": "sum",
+    "stats_generation": "sum",
+    "auth_generation": "sum",
+    "stats_updated_at": "max",
+    "queue_depth": "live",
+}
+# Служебные колонки строки воркера: pid и время последнего сигнала жизни
+_HEADER = ("pid", "heartbeat")
+_COLUMNS = {name: index for index, name in enumerate(_HEADER + tuple(FIELDS))}
+ROW_SIZE = len(_COLUMNS)
+REGION_SIZE = MAX_WORKERS * ROW_SIZE * 8
+
+
+def create_region(path: str):
+    """
+    Создает (обнуляет) файл общей памяти для счетчиков воркеров.
+    """
+    with open(path, "wb") as file:
+        file.write(b"\0" * REGION_SIZE)
+
+
+class SharedCounters:
+    """
+    Счетчики воркеров в общей памяти (mmap): у каждого процесса своя строка,
+    поэтому запись идет без межпроцессных блокировок, а чтение суммирует строки.
+    Строку завершившегося воркера занимает следующий, продолжая ее накопленные суммы.
+    """
+
+    def __init__(self, path: Optional[str] = SHARED_COUNTERS_PATH):
+        self.path = path
+        if path:
+            self._file = open(path, "r+b")
+            self._mmap = mmap.mmap(self._file.fileno(), REGION_SIZE)
+        else:
+            self._file = None
+            self._mmap = mmap.mmap(-1, REGION_SIZE)
+        self._values = memoryview(self._mmap).cast("q")
+        # Номер строки - номер воркера: живой процесс владеет строкой единолично
+        self.row = self._claim_row()
+        self._base = self.row * ROW_SIZE
+
+    def _claim_row(self) -> int:
+        if not self.path:
+            self._fill_header(0)
+            return 0
+        with FileLock(self.path + ".lock"):
+            now = int(time.time())
+            for row in range(MAX_WORKERS):
+                base = row * ROW_SIZE
+                pid, heartbeat = self._values[base], self._values[base + 1]
+                if pid == 0 or now - heartbeat > HEARTBEAT_TIMEOUT:
+                    for name, kind in FIELDS.items():
+                        if kind == "live":
+                            self._values[base + _COLUMNS[name]] = 0
+                    self._fill_header(base)
+                    return row
+        raise RuntimeError(f"No free shared counter rows (max {MAX_WORKERS} workers)")
+
+    def _fill_header(self, base: int):
+        self._values[base] = os.getpid()
+        self._values[base + 1] = int(time.time())
+
+    def heartbeat(self):
+        self._values[self._base + 1] = int(time.time())
+
+    def add(self, name: str, value: int = 1):
+        self._values[self._base + _COLUMNS[name]] += value
+
+    def set(self, name: str, value: int):
+        self._values[self._base + _COLUMNS[name]] = value
+
+    def total(self, name: str) -> int:
+        column = _COLUMNS[name]
+        kind = FIELDS[name]
+        values = [
+            self._values[row * ROW_SIZE + column]
+            for row in range(MAX_WORKERS)
+            if kind != "live" or self._values[row * ROW_SIZE] != 0
+        ]
+        if kind == "max":
+            return max(values, default=0)
+        return sum(values)
+
+    def totals(self) -> dict:
+        return {name: self.total(name) for name in FIELDS}
+
+    def workers(self) -> int:
+        now = int(time.time())
+        return sum(
+            1 for row in range(MAX_WORKERS)
+            if self._values[row * ROW_SIZE] != 0 and now - self._values[row * ROW_SIZE + 1] <= HEARTBEAT_TIMEOUT
+        )
+
+    def detach(self):
+        """
+        Освобождает строку при штатной остановке воркера; накопленные суммы остаются.
+        """
+        for name, kind in FIELDS.items():
+            if kind == "live":
+                self.set(name, 0)
+        self._values[self._base] = 0
+
+
+shared_counters = SharedCounters()
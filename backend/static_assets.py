@@ -0,0 +1,295 @@
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import tempfile
+from email.utils import formatdate
+from typing import NamedTuple, Optional
+
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from .logger import logger
+from .responses import RangeFileResponse
+
+try:
+    import brotli
+except ImportError:  # brotli не обязателен: без него отдаем только gzip
+    brotli = None
+
+# Настройки раздачи сборки PWA
+STATIC_DIR = os.getenv("KKO_STATIC_DIR", "kko_pwa_app/build")
+STATIC_CACHE_DIR = os.getenv(
+    "KKO_STATIC_CACHE_DIR", os.path.join(tempfile.gettempdir(), "kko_static_cache")
+)
+STATIC_MEMORY_LIMIT = int(os.getenv("KKO_STATIC_MEMORY_LIMIT", str(64 * 1024)))
+COMPRESS_MIN_SIZE = 1024
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# Хеш содержимого в имени файла сборки: main.aa09223f.js, 488.f17328e0.chunk.js
+HASHED_NAME = re.compile(r"\.([0-9a-f]{8,})\.")
+COMPRESSIBLE_TYPES = (
+    "text/", "application/javascript", "application/json", "application/manifest+json",
+    "image/svg+xml", "image/x-icon", "image/vnd.microsoft.icon",
+)
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+# Типы, которых нет в mimetypes по умолчанию
+EXTRA_CONTENT_TYPES = {".map": "application/json", ".webmanifest": "application/manifest+json"}
+
+
+class Variant(NamedTuple):
+    encoding: str
+    path: str
+    size: int
+    etag: str
+    body: Optional[bytes]
+
+
+class Asset(NamedTuple):
+    content_type: str
+    cache_control: str
+    last_modified: str
+    variants: dict
+
+
+def _guess_type(path: str) -> str:
+    extra = EXTRA_CONTENT_TYPES.get(os.path.splitext(path)[1])
+    return extra or mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+def _is_compressible(content_type: str) -> bool:
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def _compress(encoding: str, data: bytes) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _encodings() -> list:
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def _load_manifest(directory: str) -> set:
+    try:
+        with open(os.path.join(directory, "asset-manifest.json"), encoding="utf-8") as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return set()
+    return {path.lstrip("/") for path in manifest.get("files", {}).values()}
+
+
+def precompress(directory: str) -> int:
+    """
+    Создает .gz/.br варианты рядом со сжимаемыми файлами сборки (шаг после npm run build).
+    Args:
+        directory: Каталог сборки
+    Returns:
+        int: Количество созданных файлов
+    """
+    created = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith(tuple(ENCODING_SUFFIXES.values())):
+                continue
+            source = os.path.join(root, name)
+            content_type = _guess_type(name)
+            if not _is_compressible(content_type) or os.path.getsize(source) < COMPRESS_MIN_SIZE:
+                continue
+            with open(source, "rb") as file:
+                data = file.read()
+            for encoding in _encodings():
+                target = _variant_path(source, encoding, data)
+                if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source):
+                    continue
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, "wb") as file:
+                    file.write(_compress(encoding, data))
+                created += 1
+    return created
+
+
+def _variant_path(source: str, encoding: str, data: bytes, cache_dir: Optional[str] = None) -> str:
+    suffix = ENCODING_SUFFIXES[encoding]
+    if cache_dir is None:
+        return source + suffix
+    # В общем кэше варианты адресуются по содержимому, чтобы разные сборки не пересекались
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    return os.path.join(cache_dir, digest + suffix)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    Раздача сборки PWA из индекса, построенного при старте:
+    - gzip/br варианты выбираются по Accept-Encoding;
+    - файлы с хешем в имени получают Cache-Control: immutable;
+    - сильные ETag: хеш из имени файла сборки (asset-manifest.json) или хеш содержимого;
+    - маленькие файлы держатся в памяти, большие читаются с диска блоками.
+    Файлы, которых нет в индексе, обслуживает обычный StaticFiles.
+    """
+
+    def __init__(self, *, directory: str, html: bool = False, cache_dir: str = STATIC_CACHE_DIR, **kwargs):
+        super().__init__(directory=directory, html=html, **kwargs)
+        self.cache_dir = cache_dir
+        self.assets = {}
+
+    def load_index(self) -> int:
+        """
+        Строит индекс сборки (чтение файлов, сжатие недостающих вариантов).
+        Вызывается при старте приложения, а не при импорте; до этого файлы отдает StaticFiles.
+        Returns:
+            int: Количество файлов в индексе
+        """
+        if os.path.isdir(self.directory):
+            self.assets = self._build_index(self.directory)
+            logger.info("Static index built: %s files from %s", len(self.assets), self.directory)
+        return len(self.assets)
+
+    def _build_index(self, directory: str) -> dict:
+        manifest = _load_manifest(directory)
+        assets = {}
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name.endswith(tuple(ENCODING_SUFFIXES.values())):
+                    continue
+                source = os.path.join(root, name)
+                key = os.path.relpath(source, directory).replace(os.sep, "/")
+                assets[key] = self._build_asset(key, source, manifest)
+        return assets
+
+    def _build_asset(self, key: str, source: str, manifest: set) -> Asset:
+        stat_result = os.stat(source)
+        content_type = _guess_type(source)
+        with open(source, "rb") as file:
+            data = file.read()
+
+        hashed = HASHED_NAME.search(os.path.basename(key))
+        immutable = hashed is not None and (key in manifest or key.startswith("static/"))
+        etag_base = hashed.group(1) if immutable else hashlib.sha256(data).hexdigest()[:20]
+        in_memory = stat_result.st_size <= STATIC_MEMORY_LIMIT
+
+        variants = {
+            "identity": Variant(
+                "identity", source, stat_result.st_size, f'"{etag_base}"', data if in_memory else None
+            )
+        }
+        if _is_compressible(content_type) and stat_result.st_size >= COMPRESS_MIN_SIZE:
+            for encoding in _encodings():
+                variant = self._load_variant(source, encoding, data, etag_base, in_memory)
+                if variant is not None and variant.size < stat_result.st_size:
+                    variants[encoding] = variant
+
+        return Asset(
+            content_type=content_type,
+            cache_control=IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL,
+            last_modified=formatdate(stat_result.st_mtime, usegmt=True),
+            variants=variants,
+        )
+
+    def _load_variant(self, source, encoding, data, etag_base, in_memory) -> Optional[Variant]:
+        # Сначала ищем вариант, подготовленный при сборке, затем в кэше, иначе сжимаем сейчас
+        path = _variant_path(source, encoding, data)
+        if not (os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source)):
+            path = _variant_path(source, encoding, data, self.cache_dir)
+            if not os.path.exists(path):
+                try:
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                    with open(path, "wb") as file:
+                        file.write(_compress(encoding, data))
+                except OSError as e:
+                    logger.warning("Cannot precompress %s (%s): %s", source, encoding, e)
+                    return None
+        size = os.path.getsize(path)
+        body = None
+        if in_memory:
+            with open(path, "rb") as file:
+                body = file.read()
+        suffix = "-br" if encoding == "br" else "-gz"
+        return Variant(encoding, path, size, f'"{etag_base}{suffix}"', body)
+
+    def lookup_asset(self, path: str, directory_url: bool = False) -> Optional[Asset]:
+        key = "index.html" if path == "." else path.replace(os.sep, "/")
+        asset = self.assets.get(key)
+        if asset is None and self.html and directory_url:
+            asset = self.assets.get(f"{key}/index.html")
+        return asset
+
+    def is_asset(self, url_path: str) -> bool:
+        """
+        True для файлов сборки, кроме HTML-страниц: такие запросы не считаются посещениями.
+        """
+        asset = self.assets.get(url_path.lstrip("/"))
+        return asset is not None and asset.content_type != "text/html"
+
+    async def get_response(self, path: str, scope) -> Response:
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405)
+        asset = self.lookup_asset(path, directory_url=scope["path"].endswith("/"))
+        if asset is None:
+            return await super().get_response(path, scope)
+        return self.asset_response(asset, Headers(scope=scope))
+
+    def asset_response(self, asset: Asset, request_headers: Headers) -> Response:
+        variant = asset.variants[self._pick_encoding(asset, request_headers.get("accept-encoding", ""))]
+        headers = {
+            "etag": variant.etag,
+            "cache-control": asset.cache_control,
+            "last-modified": asset.last_modified,
+        }
+        if len(asset.variants) > 1:
+            headers["vary"] = "Accept-Encoding"
+        if variant.encoding != "identity":
+            headers["content-encoding"] = variant.encoding
+
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match and (
+            if_none_match.strip() == "*"
+            or variant.etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        ):
+            return NotModifiedResponse(Headers(headers))
+
+        if variant.body is not None:
+            return Response(variant.body, media_type=asset.content_type, headers=headers)
+        return RangeFileResponse(
+            variant.path,
+            media_type=asset.content_type,
+            headers=headers,
+            stat_result=os.stat(variant.path),
+        )
+
+    @staticmethod
+    def _pick_encoding(asset: Asset, accept_encoding: str) -> str:
+        accepted = {}
+        for item in accept_encoding.lower().split(","):
+            name, _, params = item.strip().partition(";")
+            quality = 1.0
+            if params.strip().startswith("q="):
+                try:
+                    quality = float(params.strip()[2:])
+                except ValueError:
+                    quality = 0.0
+            accepted[name.strip()] = quality
+        for encoding in ("br", "gzip"):
+            quality = accepted.get(encoding, accepted.get("*", 0.0))
+            if encoding in asset.variants and quality > 0:
+                return encoding
+        return "identity"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Подготовка сжатых вариантов сборки PWA")
+    parser.add_argument("directory", nargs="?", default=STATIC_DIR)
+    args = parser.parse_args()
+    print(f"Created {precompress(args.directory)} compressed files in {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
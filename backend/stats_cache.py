@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate
+from typing import NamedTuple, Optional
+
+from .shared_counters import shared_counters
+
+STATS_CACHE_SIZE = int(os.getenv("KKO_STATS_CACHE_SIZE", "256"))
+
+
+class CachedStats(NamedTuple):
+    body: bytes
+    etag: str
+    last_modified: str
+    generation: int
+
+
+class StatsCache:
+    """
+    Кэш готовых ответов /api/stats: параметры запроса -> сериализованный JSON и ETag.
+    Каждая запись посещений продвигает номер поколения; записи прошлых поколений
+    больше не выдаются, поэтому кэш не нужно сбрасывать по ключам.
+    Поколение хранится в общей памяти воркеров: запись в одном процессе
+    делает устаревшими кэши всех остальных.
+    """
+
+    def __init__(self, maxsize: int = STATS_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def generation(self) -> int:
+        return shared_counters.total("stats_generation")
+
+    @property
+    def updated_at(self) -> float:
+        return shared_counters.total("stats_updated_at") or time.time()
+
+    def advance(self):
+        """
+        Отмечает, что агрегаты изменились (после коммита пачки посещений или пересчета).
+        """
+        shared_counters.set("stats_updated_at", int(time.time()))
+        shared_counters.add("stats_generation")
+
+    def get(self, key: tuple) -> Optional[CachedStats]:
+        generation = self.generation
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.generation != generation:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: tuple, generation: int, payload: dict) -> CachedStats:
+        """
+        Сериализует ответ и сохраняет его, если за время расчета агрегаты не менялись.
+        Args:
+            generation: Поколение, прочитанное до запроса к базе
+        """
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+        entry = CachedStats(
+            body=body,
+            etag=f'"{hashlib.sha256(body).hexdigest()[:20]}"',
+            last_modified=formatdate(self.updated_at, usegmt=True),
+            generation=generation,
+        )
+        with self._lock:
+            if generation == self.generation:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+            return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "generation": self.generation,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+stats_cache = StatsCache()
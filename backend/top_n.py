@@ -0,0 +1,302 @@
+import asyncio
+import heapq
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import func, select
+
+from .database import READ_ENGINE
+from .db_models import PageUrl, Referrer, Visit
+from .logger import logger
+
+# Настройки популярных страниц и источников (переопределяются переменными окружения)
+TOP_CAPACITY = int(os.getenv("KKO_TOP_CAPACITY", "100"))
+TOP_REFRESH_INTERVAL = float(os.getenv("KKO_TOP_REFRESH_INTERVAL", "1.0"))
+TOP_TAIL_BATCH = int(os.getenv("KKO_TOP_TAIL_BATCH", "5000"))
+
+# Кольца слотов: длина слота в секундах и число слотов
+RINGS = {"minute": (60, 60), "hour": (3600, 168)}
+# Окно -> кольцо и число последних слотов в нем
+WINDOWS = {"hour": ("minute", 60), "day": ("hour", 24), "week": ("hour", 168)}
+DIMENSIONS = ("pages", "referrers")
+
+# Заглушки middleware и пустые значения не считаются источниками
+_NO_REFERRER = (None, "", "Unknown")
+
+
+class SpaceSaving:
+    """
+    Сводка Space-Saving: не больше capacity счетчиков. Новый ключ при заполненной сводке
+    вытесняет самый редкий и наследует его счет как ошибку, поэтому любой ключ с частотой
+    выше total / capacity гарантированно в сводке, а счет завышен не больше чем на error.
+    """
+
+    __slots__ = ("capacity", "counts", "errors", "total")
+
+    def __init__(self, capacity: int = TOP_CAPACITY):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+
+    def offer(self, key: str, count: int = 1):
+        self.total += count
+        if key in self.counts:
+            self.counts[key] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = count
+            self.errors[key] = 0
+        else:
+            victim = min(self.counts, key=self.counts.__getitem__)
+            floor = self.counts.pop(victim)
+            del self.errors[victim]
+            self.counts[key] = floor + count
+            self.errors[key] = floor
+
+    @property
+    def floor(self) -> int:
+        """
+        Верхняя граница частоты ключа, которого нет в сводке.
+        """
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(self.counts.values())
+
+
+def _merge_partial(summaries: list) -> tuple:
+    """
+    Сумма сводок без общего слагаемого floor_total: верхняя оценка ключа равна
+    floor_total + excess[key], поэтому частичные суммы слотов складываются.
+    Returns:
+        tuple: (floor_total, excess, lower, total)
+    """
+    floor_total = 0
+    excess = {}
+    lower = {}
+    total = 0
+    for summary in summaries:
+        floor = summary.floor
+        floor_total += floor
+        total += summary.total
+        for key, count in summary.counts.items():
+            # Без этого слота ключ уже учтен по верхней границе floor
+            excess[key] = excess.get(key, 0) + count - floor
+            lower[key] = lower.get(key, 0) + count - summary.errors[key]
+    return floor_total, excess, lower, total
+
+
+def merge_summaries(summaries: list) -> list:
+    """
+    Объединяет сводки слотов окна.
+    Returns:
+        list: (ключ, верхняя оценка, нижняя граница) по убыванию оценки
+    """
+    floor_total, excess, lower, _ = _merge_partial(summaries)
+    return sorted(
+        ((key, floor_total + value, lower[key]) for key, value in excess.items()),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+
+
+class TopTracker:
+    """
+    Популярные страницы и источники переходов за скользящие час, сутки и неделю.
+
+    Посещения читаются из visits по возрастанию id (хвост таблицы), поэтому каждый
+    воркер видит записи всех воркеров. Ингест будит чтение после записи пачки.
+    Каждое измерение хранится в кольцах сводок Space-Saving по минутам (час) и по часам
+    (сутки и неделя): память ограничена числом слотов и capacity независимо от трафика.
+    Слияние закрытых слотов окна кэшируется до смены слота; новые посещения попадают
+    в текущий слот, и запрос доливает к кэшу только его сводку.
+    """
+
+    def __init__(self, capacity: int = TOP_CAPACITY, tail_batch: int = TOP_TAIL_BATCH):
+        self.capacity = capacity
+        self.tail_batch = tail_batch
+        self._rings = {(dimension, ring): {} for dimension in DIMENSIONS for ring in RINGS}
+        # Меняется при записи в уже закрытый слот (поздние события из /api/collect)
+        self._closed_versions = {key: 0 for key in self._rings}
+        self._cache = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        # Получатели новых посещений из хвоста (например, live.LiveBroadcaster.feed)
+        self.listeners = []
+        self.last_id: Optional[int] = None
+        self.version = 0
+        self.processed = 0
+
+    def add(self, moment: datetime, dimension: str, key: str, count: int = 1, now: Optional[float] = None):
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        timestamp = moment.timestamp()
+        now = time.time() if now is None else now
+        for ring, (slot_seconds, slots) in RINGS.items():
+            slot = int(timestamp // slot_seconds)
+            current = int(now // slot_seconds)
+            if slot <= current - slots:
+                continue
+            if slot < current:
+                self._closed_versions[(dimension, ring)] += 1
+            summaries = self._rings[(dimension, ring)]
+            if slot not in summaries:
+                summaries[slot] = SpaceSaving(self.capacity)
+            summaries[slot].offer(key, count)
+
+    def feed(self, rows: list, backfill: bool = False):
+        """
+        Args:
+            rows: Кортежи (id, visit_time, page_url, referrer)
+            backfill: Начальная загрузка истории, слушателям не передается
+        """
+        now = time.time()
+        for visit_id, visit_time, page_url, referrer in rows:
+            if page_url is not None:
+                self.add(visit_time, "pages", page_url, now=now)
+            if referrer not in _NO_REFERRER:
+                self.add(visit_time, "referrers", referrer, now=now)
+            self.last_id = visit_id
+        if rows:
+            self.processed += len(rows)
+            self.version += 1
+            if not backfill:
+                for listener in self.listeners:
+                    listener(rows)
+
+    def _prune(self, now: float):
+        for (_, ring), summaries in self._rings.items():
+            slot_seconds, slots = RINGS[ring]
+            oldest = int(now // slot_seconds) - slots + 1
+            for slot in [slot for slot in summaries if slot < oldest]:
+                del summaries[slot]
+
+    def _closed(self, window: str, dimension: str, newest: int, now: float) -> tuple:
+        """
+        Слияние закрытых слотов окна (все, кроме текущего).
+        Пересчитывается при смене слота или записи в закрытый слот, а не на каждую пачку.
+        Returns:
+            tuple: (floor_total, excess, lower, total, ключи по убыванию excess)
+        """
+        ring, slots = WINDOWS[window]
+        cache_key = (window, dimension)
+        version = (self._closed_versions[(dimension, ring)], newest)
+        cached = self._cache.get(cache_key)
+        if cached is None or cached[0] != version:
+            self._prune(now)
+            floor_total, excess, lower, total = _merge_partial([
+                summary for slot, summary in self._rings[(dimension, ring)].items()
+                if newest - slots < slot < newest
+            ])
+            ranked = sorted(excess, key=excess.__getitem__, reverse=True)
+            cached = (version, (floor_total, excess, lower, total, ranked))
+            self._cache[cache_key] = cached
+        return cached[1]
+
+    def top(self, window: str, dimension: str, limit: int = 10, now: Optional[float] = None) -> dict:
+        """
+        Топ ключей за окно: кэш закрытых слотов плюс сводка текущего слота.
+        Запрос стоит O(capacity + limit) независимо от длины окна и частоты записи.
+        """
+        now = time.time() if now is None else now
+        ring, slots = WINDOWS[window]
+        slot_seconds = RINGS[ring][0]
+        newest = int(now // slot_seconds)
+        floor_total, excess, lower, total, ranked = self._closed(window, dimension, newest, now)
+
+        current = self._rings[(dimension, ring)].get(newest)
+        if current is not None:
+            floor_total += current.floor
+            total += current.total
+            current_counts = current.counts
+        else:
+            current_counts = {}
+        # Ключ без записей в текущем слоте сохраняет порядок из кэша, поэтому кандидатов
+        # не больше limit из кэша сверх ключей текущего слота
+        candidates = set(current_counts).union(ranked[:limit + len(current_counts)])
+
+        def estimate(key: str) -> tuple:
+            upper, floor = floor_total + excess.get(key, 0), lower.get(key, 0)
+            if key in current_counts:
+                upper += current_counts[key] - current.floor
+                floor += current_counts[key] - current.errors[key]
+            return key, upper, floor
+
+        merged = heapq.nlargest(limit, map(estimate, candidates), key=lambda item: item[1])
+        since = datetime.fromtimestamp((newest - slots + 1) * slot_seconds, tz=timezone.utc)
+        return {
+            "window": window,
+            "dimension": dimension,
+            "since": since.isoformat(),
+            "total": total,
+            "items": [
+                {"key": key, "count": estimate, "error": estimate - floor}
+                for key, estimate, floor in merged
+            ],
+        }
+
+    def _tail(self) -> list:
+        with READ_ENGINE.connect() as conn:
+            max_id = conn.execute(select(func.max(Visit.id))).scalar() or 0
+            # Первый запуск или таблицу опустошило архивирование и id пошли заново:
+            # начинаем с посещений за последнюю неделю
+            if self.last_id is None or self.last_id > max_id:
+                week_ago = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=RINGS["hour"][1])
+                first = conn.execute(select(func.min(Visit.id)).where(Visit.visit_time >= week_ago)).scalar()
+                self.last_id = (first if first is not None else max_id + 1) - 1
+            return conn.execute(
+                select(Visit.id, Visit.visit_time, PageUrl.value, Referrer.value)
+                .join(PageUrl, PageUrl.id == Visit.page_url_id, isouter=True)
+                .join(Referrer, Referrer.id == Visit.referrer_id, isouter=True)
+                .where(Visit.id > self.last_id)
+                .order_by(Visit.id)
+                .limit(self.tail_batch)
+            ).all()
+
+    async def refresh(self) -> int:
+        """
+        Дочитывает новые посещения из базы.
+        Returns:
+            int: Количество прочитанных посещений
+        """
+        read = 0
+        backfill = self.last_id is None
+        while True:
+            rows = await asyncio.to_thread(self._tail)
+            self.feed(rows, backfill)
+            read += len(rows)
+            if len(rows) < self.tail_batch:
+                return read
+
+    def wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def run(self, interval: float = TOP_REFRESH_INTERVAL):
+        """
+        Фоновое чтение хвоста visits: по таймеру или сразу после записи пачки.
+        """
+        self._wakeup = asyncio.Event()
+        try:
+            while True:
+                try:
+                    await self.refresh()
+                except Exception:
+                    logger.warning("Top pages refresh failed, will retry in %s s", interval)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+        finally:
+            self._wakeup = None
+
+    def stats(self) -> dict:
+        return {
+            "last_id": self.last_id,
+            "processed": self.processed,
+            "slots": sum(len(summaries) for summaries in self._rings.values()),
+        }
+
+
+top_tracker = TopTracker()
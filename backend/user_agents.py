@@ -0,0 +1,122 @@
+import os
+import random
+import re
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+from sqlalchemy import inspect, text
+
+from .logger import logger
+
+UA_CACHE_SIZE = int(os.getenv("KKO_UA_CACHE_SIZE", "4096"))
+# Что делать с ботами на этапе приема: tag - сохранять с пометкой, drop - отбрасывать,
+# sample - сохранять долю KKO_BOT_SAMPLE_RATE
+BOT_POLICY = os.getenv("KKO_BOT_POLICY", "tag")
+BOT_SAMPLE_RATE = float(os.getenv("KKO_BOT_SAMPLE_RATE", "0.1"))
+
+BOT_POLICIES = ("tag", "drop", "sample")
+if BOT_POLICY not in BOT_POLICIES:
+    raise ValueError(f"Unknown bot policy: {BOT_POLICY}")
+
+BOT_PATTERN = re.compile(
+    r"bot\b|bot/|crawl|spider|slurp|bingpreview|facebookexternalhit|preview|"
+    r"curl/|wget/|python-requests|python-urllib|httpx|aiohttp|go-http-client|okhttp|java/|"
+    r"headless|lighthouse|pingdom|uptimerobot|kube-probe|healthcheck|monitor|scanner",
+    re.IGNORECASE,
+)
+# Порядок важен: Edge и Opera содержат "Chrome/", Chrome содержит "Safari/"
+BROWSERS = (
+    ("Edge", re.compile(r"Edg(e|A|iOS)?/")),
+    ("Opera", re.compile(r"OPR/|Opera")),
+    ("Yandex", re.compile(r"YaBrowser/")),
+    ("Samsung Internet", re.compile(r"SamsungBrowser/")),
+    ("Firefox", re.compile(r"Firefox/|FxiOS/")),
+    ("Chrome", re.compile(r"Chrome/|CriOS/")),
+    ("Safari", re.compile(r"Version/.*Safari/")),
+    ("Internet Explorer", re.compile(r"MSIE |Trident/")),
+)
+OPERATING_SYSTEMS = (
+    ("Android", re.compile(r"Android")),
+    ("iOS", re.compile(r"iPhone|iPad|iPod")),
+    ("Windows", re.compile(r"Windows")),
+    ("macOS", re.compile(r"Mac OS X|Macintosh")),
+    ("ChromeOS", re.compile(r"CrOS")),
+    ("Linux", re.compile(r"Linux|X11")),
+)
+TABLET_PATTERN = re.compile(r"iPad|Tablet|Android(?!.*Mobile)")
+MOBILE_PATTERN = re.compile(r"Mobi|iPhone|iPod")
+DESKTOP_SYSTEMS = ("Windows", "macOS", "ChromeOS", "Linux")
+
+
+class UserAgentInfo(NamedTuple):
+    browser: str
+    os: str
+    device: str
+    is_bot: bool
+
+
+def _match(rules, user_agent: str) -> str:
+    for name, pattern in rules:
+        if pattern.search(user_agent):
+            return name
+    return "Other"
+
+
+@lru_cache(maxsize=UA_CACHE_SIZE)
+def classify(user_agent: Optional[str]) -> UserAgentInfo:
+    """
+    Определяет браузер, ОС, класс устройства и признак бота по строке User-Agent.
+    Результат кэшируется: повторяющиеся строки стоят одного обращения к словарю.
+    """
+    if not user_agent or user_agent == "Unknown":
+        # Без User-Agent ходят проверки доступности и скрипты, а не браузеры
+        return UserAgentInfo("Other", "Other", "bot", True)
+
+    is_bot = BOT_PATTERN.search(user_agent) is not None
+    browser = _match(BROWSERS, user_agent)
+    os_name = _match(OPERATING_SYSTEMS, user_agent)
+    if is_bot:
+        device = "bot"
+    elif TABLET_PATTERN.search(user_agent):
+        device = "tablet"
+    elif MOBILE_PATTERN.search(user_agent):
+        device = "mobile"
+    elif os_name in DESKTOP_SYSTEMS:
+        device = "desktop"
+    else:
+        device = "other"
+    return UserAgentInfo(browser, os_name, device, is_bot)
+
+
+def admit(user_agent: Optional[str], policy: str = BOT_POLICY, sample_rate: float = BOT_SAMPLE_RATE) -> bool:
+    """
+    Решает по политике для ботов, сохранять ли посещение.
+    """
+    if policy == "tag" or not classify(user_agent).is_bot:
+        return True
+    if policy == "sample":
+        return random.random() < sample_rate
+    return False
+
+
+def ensure_classification(engine):
+    """
+    Добавляет колонки классификации в существующую таблицу user_agents
+    и заполняет их для строк, сохраненных до появления классификатора.
+    """
+    columns = {column["name"] for column in inspect(engine).get_columns("user_agents")}
+    with engine.begin() as conn:
+        for name, ddl in (
+            ("browser", "VARCHAR"), ("os", "VARCHAR"), ("device", "VARCHAR"), ("is_bot", "BOOLEAN"),
+        ):
+            if name not in columns:
+                conn.execute(text(f"ALTER TABLE user_agents ADD COLUMN {name} {ddl}"))
+
+        rows = conn.execute(text("SELECT id, value FROM user_agents WHERE device IS NULL")).all()
+        if rows:
+            conn.execute(
+                text("UPDATE user_agents SET browser = :browser, os = :os, device = :device, "
+                     "is_bot = :is_bot WHERE id = :id"),
+                [{"id": ua_id, **classify(value)._asdict()} for ua_id, value in rows],
+            )
+            logger.info("Classified %s stored user agents", len(rows))
@@ -0,0 +1,128 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from . import db_models, schemas
+from .shared_counters import shared_counters
+
+TOKEN_CACHE_SIZE = int(os.getenv("KKO_TOKEN_CACHE_SIZE", "1024"))
+
+
+class TokenUserCache:
+    """
+    Ограниченный LRU-кэш проверенных токенов: токен -> (снимок пользователя, семейство).
+    Запись живет до exp токена и помнит поколение, при котором пользователь был прочитан.
+    Поколение хранится в общей памяти воркеров и растет только после коммита изменения
+    пользователей (роль, активность, пароль): запись в одном процессе делает устаревшими
+    кэши всех остальных. Отзыв токенов поколение не трогает - семейство проверяется
+    по списку отзывов при каждом попадании (см. auth.user_from_token).
+    """
+
+    def __init__(self, maxsize: int = TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def generation(self) -> int:
+        return shared_counters.total("auth_generation")
+
+    def advance(self):
+        """
+        Отмечает, что пользователи изменились (после коммита).
+        """
+        shared_counters.add("auth_generation")
+
+    def get(self, token: str) -> Optional[tuple]:
+        """
+        Returns:
+            Optional[tuple]: (снимок пользователя, семейство токена) или None
+        """
+        generation = self.generation
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            user, expires_at, family, entry_generation = entry
+            if expires_at <= time.time() or entry_generation != generation:
+                del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return user, family
+
+    def put(
+        self,
+        token: str,
+        user: schemas.User,
+        expires_at: float,
+        family: Optional[str] = None,
+        generation: Optional[int] = None,
+    ):
+        """
+        Args:
+            generation: Поколение, прочитанное до запроса пользователя из базы:
+                изменение, закоммиченное во время запроса, сделает запись устаревшей
+        """
+        if generation is None:
+            generation = self.generation
+        with self._lock:
+            self._entries[token] = (user, expires_at, family, generation)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate_family(self, family: str):
+        """
+        Удаляет токены отозванного семейства (выход или повторное использование refresh-токена).
+        """
+        with self._lock:
+            stale = [token for token, (_, _, token_family, _) in self._entries.items() if token_family == family]
+            for token in stale:
+                del self._entries[token]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "generation": self.generation,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+token_cache = TokenUserCache()
+
+
+@event.listens_for(db_models.User, "after_insert")
+@event.listens_for(db_models.User, "after_update")
+@event.listens_for(db_models.User, "after_delete")
+def _mark_changed_users(_mapper, _connection, target):
+    # Поколение продвигается после коммита: до него другие воркеры прочитали бы старые данные
+    session = object_session(target)
+    if session is not None:
+        session.info["users_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _advance_after_commit(session):
+    if session.info.pop("users_changed", False):
+        token_cache.advance()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session):
+    session.info.pop("users_changed", None)
@@ -0,0 +1,314 @@
+import asyncio
+import hashlib
+import os
+import struct
+import time
+from bisect import bisect_right
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import NotModifiedResponse
+
+from .database import PROJECT_ROOT
+from .logger import logger
+from .responses import RangeFileResponse
+from .static_assets import REVALIDATE_CACHE_CONTROL
+
+# Настройки каталога видео (переопределяются переменными окружения).
+# Путь по умолчанию - от корня проекта, как у базы, а не от текущего каталога процесса
+VIDEO_DIR = os.getenv("KKO_VIDEO_DIR", os.path.join(PROJECT_ROOT, "media", "videos"))
+# Не чаще этого каталог обходится заново; файлы перечитываются, только если изменились
+VIDEO_RESCAN_INTERVAL = float(os.getenv("KKO_VIDEO_RESCAN_INTERVAL", "5.0"))
+
+VIDEO_EXTENSIONS = {
+    ".mp4": "video/mp4",
+    ".m4v": "video/mp4",
+    ".mov": "video/quicktime",
+    ".webm": "video/webm",
+    ".mkv": "video/x-matroska",
+    ".ogv": "video/ogg",
+}
+
+# Элементы EBML (WebM/Matroska), нужные для длительности
+_EBML_HEADER = 0x1A45DFA3
+_EBML_DOCTYPE = 0x4282
+_MKV_SEGMENT = 0x18538067
+_MKV_INFO = 0x1549A966
+_MKV_CLUSTER = 0x1F43B675
+_MKV_TIMECODE_SCALE = 0x2AD7B1
+_MKV_DURATION = 0x4489
+
+
+class Video(NamedTuple):
+    name: str
+    path: str
+    size: int
+    mtime_ns: int
+    content_type: str
+    duration: Optional[float]
+    etag: str
+
+    @property
+    def modified(self) -> datetime:
+        return datetime.fromtimestamp(self.mtime_ns / 1e9, timezone.utc)
+
+
+def _mp4_boxes(file, start: int, end: int):
+    position = start
+    while position + 8 <= end:
+        file.seek(position)
+        header = file.read(16)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack(">I4s", header[:8])
+        header_size = 8
+        if size == 1 and len(header) == 16:
+            size, header_size = struct.unpack(">Q", header[8:16])[0], 16
+        elif size == 0:
+            size = end - position
+        if size < header_size:
+            return
+        yield box_type, position + header_size, position + size
+        position += size
+
+
+def _probe_mp4(file, size: int) -> tuple:
+    """
+    MP4/QuickTime: тип по бренду ftyp, длительность из moov/mvhd.
+    moov часто лежит в конце файла - атомы обходятся по заголовкам, данные mdat не читаются.
+    """
+    content_type, duration = "video/mp4", None
+    for box_type, start, end in _mp4_boxes(file, 0, size):
+        if box_type == b"ftyp":
+            file.seek(start)
+            if file.read(4) == b"qt  ":
+                content_type = "video/quicktime"
+        elif box_type == b"moov":
+            for child_type, child_start, _ in _mp4_boxes(file, start, end):
+                if child_type != b"mvhd":
+                    continue
+                file.seek(child_start)
+                data = file.read(32)
+                if data[:1] == b"\x01":
+                    timescale, length = struct.unpack(">IQ", data[20:32])
+                else:
+                    timescale, length = struct.unpack(">II", data[12:20])
+                if timescale:
+                    duration = length / timescale
+                break
+            break
+    return content_type, duration
+
+
+def _read_vint(file, keep_marker: bool) -> tuple:
+    first = file.read(1)
+    if not first:
+        raise EOFError
+    length, mask = 1, 0x80
+    while length <= 8 and not first[0] & mask:
+        length, mask = length + 1, mask >> 1
+    if length > 8:
+        raise ValueError("Invalid EBML variable-length integer")
+    value = first[0] if keep_marker else first[0] & (mask - 1)
+    for byte in file.read(length - 1):
+        value = (value << 8) | byte
+    # Все единицы в размере - "неизвестный размер" (потоковая запись)
+    unknown = not keep_marker and value == (1 << (7 * length)) - 1
+    return value, unknown
+
+
+def _ebml_elements(file, start: int, end: int):
+    file.seek(start)
+    while file.tell() < end:
+        element_id, _ = _read_vint(file, keep_marker=True)
+        size, unknown = _read_vint(file, keep_marker=False)
+        data_start = file.tell()
+        data_end = end if unknown else data_start + size
+        yield element_id, data_start, data_end
+        file.seek(data_end)
+
+
+def _probe_matroska(file, size: int) -> tuple:
+    """
+    WebM/Matroska: тип по DocType, длительность из Segment/Info (Duration * TimecodeScale).
+    """
+    content_type, duration = "video/x-matroska", None
+    for element_id, start, end in _ebml_elements(file, 0, size):
+        if element_id == _EBML_HEADER:
+            for child_id, child_start, child_end in _ebml_elements(file, start, end):
+                if child_id == _EBML_DOCTYPE:
+                    file.seek(child_start)
+                    if file.read(child_end - child_start).rstrip(b"\x00") == b"webm":
+                        content_type = "video/webm"
+            file.seek(end)
+        elif element_id == _MKV_SEGMENT:
+            for child_id, child_start, child_end in _ebml_elements(file, start, end):
+                # Info идет до кластеров с данными; дальше искать незачем
+                if child_id == _MKV_CLUSTER:
+                    break
+                if child_id != _MKV_INFO:
+                    continue
+                scale, ticks = 1_000_000, None
+                for info_id, info_start, info_end in _ebml_elements(file, child_start, child_end):
+                    file.seek(info_start)
+                    data = file.read(info_end - info_start)
+                    if info_id == _MKV_TIMECODE_SCALE:
+                        scale = int.from_bytes(data, "big")
+                    elif info_id == _MKV_DURATION and len(data) in (4, 8):
+                        ticks = struct.unpack(">f" if len(data) == 4 else ">d", data)[0]
+                if ticks is not None:
+                    duration = ticks * scale / 1e9
+                break
+            break
+    return content_type, duration
+
+
+def probe(path: str, size: int) -> tuple:
+    """
+    Определяет тип и длительность по заголовкам контейнера, без внешних утилит.
+    Читаются только заголовки (единицы килобайт), а не весь файл.
+    Returns:
+        tuple: (content type, длительность в секундах или None)
+    """
+    fallback = VIDEO_EXTENSIONS.get(os.path.splitext(path)[1].lower(), "application/octet-stream")
+    try:
+        with open(path, "rb") as file:
+            magic = file.read(12)
+            if magic[4:8] == b"ftyp":
+                return _probe_mp4(file, size)
+            if magic[:4] == _EBML_HEADER.to_bytes(4, "big"):
+                return _probe_matroska(file, size)
+            if magic[:4] == b"OggS":
+                return "video/ogg", None
+    except (OSError, ValueError, EOFError, struct.error) as e:
+        logger.warning("Cannot probe video %s: %s", path, e)
+    return fallback, None
+
+
+class VideoCatalog:
+    """
+    Индекс видеофайлов каталога в памяти.
+    Каталог обходится не чаще VIDEO_RESCAN_INTERVAL; файл перечитывается (probe),
+    только если изменились его размер или mtime, иначе запись берется из индекса.
+    """
+
+    def __init__(self, directory: str = VIDEO_DIR, rescan_interval: float = VIDEO_RESCAN_INTERVAL):
+        self.directory = directory
+        self.rescan_interval = rescan_interval
+        self.videos = {}
+        self.names = []
+        self.scanned_at = 0.0
+        self.probes = 0
+        self._lock = asyncio.Lock()
+
+    def _entry(self, name: str, path: str, stat_result: os.stat_result) -> Video:
+        known = self.videos.get(name)
+        if known is not None and (known.size, known.mtime_ns) == (stat_result.st_size, stat_result.st_mtime_ns):
+            return known
+        self.probes += 1
+        content_type, duration = probe(path, stat_result.st_size)
+        # Сильный ETag без чтения файла: любая запись меняет mtime_ns или размер
+        etag = hashlib.blake2b(
+            f"{name}:{stat_result.st_size}:{stat_result.st_mtime_ns}:{stat_result.st_ino}".encode(),
+            digest_size=10,
+        ).hexdigest()
+        return Video(
+            name, path, stat_result.st_size, stat_result.st_mtime_ns,
+            content_type, None if duration is None else round(duration, 3), f'"{etag}"',
+        )
+
+    def scan(self) -> int:
+        """
+        Обходит каталог и обновляет индекс.
+        Returns:
+            int: Количество видео в индексе
+        """
+        videos = {}
+        for root, dirs, files in os.walk(self.directory):
+            dirs[:] = [name for name in dirs if not name.startswith(".")]
+            for file_name in files:
+                if file_name.startswith(".") or os.path.splitext(file_name)[1].lower() not in VIDEO_EXTENSIONS:
+                    continue
+                path = os.path.join(root, file_name)
+                name = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                try:
+                    videos[name] = self._entry(name, path, os.stat(path))
+                except OSError:
+                    continue
+        self.videos = videos
+        self.names = sorted(videos)
+        self.scanned_at = time.monotonic()
+        return len(videos)
+
+    async def refresh(self, force: bool = False):
+        if not force and time.monotonic() - self.scanned_at < self.rescan_interval:
+            return
+        async with self._lock:
+            # Пока ждали блокировку, индекс мог обновить другой запрос
+            if force or time.monotonic() - self.scanned_at >= self.rescan_interval:
+                count = await asyncio.to_thread(self.scan)
+                logger.debug("Video catalog scanned: %s files in %s", count, self.directory)
+
+    async def page(self, cursor: Optional[str] = None, limit: int = 50) -> tuple:
+        """
+        Страница каталога по имени файла (keyset-пагинация).
+        Args:
+            cursor: Имя последнего видео предыдущей страницы
+            limit: Размер страницы
+        Returns:
+            tuple: (список Video, курсор следующей страницы или None)
+        """
+        await self.refresh()
+        names = self.names
+        start = bisect_right(names, cursor) if cursor is not None else 0
+        selected = names[start:start + limit]
+        next_cursor = selected[-1] if start + limit < len(names) else None
+        return [self.videos[name] for name in selected], next_cursor
+
+    async def get(self, name: str) -> tuple:
+        """
+        Видео по имени из индекса; файл, измененный после обхода, перечитывается сразу.
+        Путь к файлу берется только из индекса, поэтому имя вида ../x ничего не откроет.
+        Returns:
+            tuple: (Video, os.stat_result) или (None, None), если такого видео нет
+        """
+        await self.refresh()
+        video = self.videos.get(name)
+        if video is None:
+            return None, None
+        try:
+            stat_result = os.stat(video.path)
+        except OSError:
+            return None, None
+        if (video.size, video.mtime_ns) != (stat_result.st_size, stat_result.st_mtime_ns):
+            video = await asyncio.to_thread(self._entry, name, video.path, stat_result)
+            self.videos[name] = video
+        return video, stat_result
+
+    def stats(self) -> dict:
+        return {
+            "directory": self.directory,
+            "videos": len(self.videos),
+            "total_bytes": sum(video.size for video in self.videos.values()),
+            "probes": self.probes,
+        }
+
+
+def video_response(video: Video, stat_result: os.stat_result, request_headers: Headers) -> Response:
+    """
+    Ответ с файлом видео: 304 по If-None-Match, иначе файл или диапазон Range (206),
+    читаемый блоками, без загрузки видео в память процесса.
+    """
+    headers = {"etag": video.etag, "cache-control": REVALIDATE_CACHE_CONTROL}
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match and (
+        if_none_match.strip() == "*"
+        or video.etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    ):
+        return NotModifiedResponse(Headers(headers))
+    return RangeFileResponse(video.path, media_type=video.content_type, headers=headers, stat_result=stat_result)
+
+
+video_catalog = VideoCatalog()
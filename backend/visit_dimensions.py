@@ -0,0 +1,214 @@
+import argparse
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import inspect, select, text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from .database import DB_PATH, ENGINE
+from .db_models import PageUrl, Referrer, UserAgent, Visit
+from .logger import logger
+from .user_agents import classify
+
+DIMENSION_CACHE_SIZE = int(os.getenv("KKO_DIMENSION_CACHE_SIZE", "10000"))
+
+# Поле строки посещения -> (справочник, колонка id в visits)
+DIMENSIONS = {
+    "page_url": (PageUrl, "page_url_id"),
+    "referrer": (Referrer, "referrer_id"),
+    "user_agent": (UserAgent, "user_agent_id"),
+}
+# Дополнительные колонки, которые заполняются при добавлении нового значения
+DIMENSION_ATTRIBUTES = {
+    "user_agent": lambda value: classify(value)._asdict(),
+}
+
+
+class DimensionCache:
+    """
+    LRU-кэш строка -> id для одного справочника, чтобы запись посещений
+    не ходила в базу за уже известными значениями.
+    """
+
+    def __init__(self, maxsize: int = DIMENSION_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, value: str):
+        with self._lock:
+            value_id = self._ids.get(value)
+            if value_id is None:
+                self.misses += 1
+                return None
+            self._ids.move_to_end(value)
+            self.hits += 1
+            return value_id
+
+    def put(self, value: str, value_id: int):
+        with self._lock:
+            self._ids[value] = value_id
+            self._ids.move_to_end(value)
+            while len(self._ids) > self.maxsize:
+                self._ids.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+
+dimension_caches = {field: DimensionCache() for field in DIMENSIONS}
+
+
+def clear_caches():
+    """
+    Сбрасывает кэши: id, выданные в откаченной транзакции, больше не действительны.
+    """
+    for cache in dimension_caches.values():
+        cache.clear()
+
+
+def resolve_ids(db: Session, field: str, values: set) -> dict:
+    """
+    Возвращает id для набора строк справочника, добавляя недостающие значения.
+    """
+    model, _ = DIMENSIONS[field]
+    cache = dimension_caches[field]
+    ids = {}
+    missing = []
+    for value in values:
+        value_id = cache.get(value)
+        if value_id is None:
+            missing.append(value)
+        else:
+            ids[value] = value_id
+
+    if missing:
+        attributes = DIMENSION_ATTRIBUTES.get(field)
+        db.execute(
+            insert(model).on_conflict_do_nothing(index_elements=["value"]),
+            [{"value": value, **(attributes(value) if attributes else {})} for value in missing],
+        )
+        for value_id, value in db.execute(
+            select(model.id, model.value).where(model.value.in_(missing))
+        ):
+            ids[value] = value_id
+            cache.put(value, value_id)
+    return ids
+
+
+def intern_rows(db: Session, rows: list) -> list:
+    """
+    Заменяет строки page_url/referrer/user_agent на id справочников.
+    Args:
+        rows: Словари посещений со строковыми полями и visit_time
+    Returns:
+        list: Словари для вставки в visits
+    """
+    ids = {}
+    for field in DIMENSIONS:
+        values = {row.get(field) for row in rows if row.get(field) is not None}
+        ids[field] = resolve_ids(db, field, values) if values else {}
+
+    interned = []
+    for row in rows:
+        record = {"visit_time": row["visit_time"]}
+        for field, (_, column) in DIMENSIONS.items():
+            value = row.get(field)
+            record[column] = ids[field][value] if value is not None else None
+        interned.append(record)
+    return interned
+
+
+def needs_migration(engine) -> bool:
+    """
+    True, если таблица visits еще хранит строки, а не id справочников.
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table("visits"):
+        return False
+    return "page_url" in {column["name"] for column in inspector.get_columns("visits")}
+
+
+def migrate_visits(engine, schema: Optional[tuple] = None):
+    """
+    Переводит существующую таблицу visits на справочники одной транзакцией:
+    пересоздает visits с колонками id, заполняет справочники и переносит строки.
+    Args:
+        schema: DDL справочников и visits (CREATE ... IF NOT EXISTS); по умолчанию -
+            текущие модели. Миграция 1 передает свою зафиксированную схему
+    """
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE visits RENAME TO visits_legacy"))
+        for index in inspect(conn).get_indexes("visits_legacy"):
+            conn.execute(text(f'DROP INDEX IF EXISTS "{index["name"]}"'))
+        if schema is None:
+            for model in (PageUrl, Referrer, UserAgent, Visit):
+                model.__table__.create(bind=conn, checkfirst=True)
+        else:
+            for statement in schema:
+                conn.execute(text(statement))
+
+        for field, (model, _) in DIMENSIONS.items():
+            conn.execute(text(
+                f"INSERT OR IGNORE INTO {model.__tablename__} (value) "
+                f"SELECT DISTINCT {field} FROM visits_legacy WHERE {field} IS NOT NULL"
+            ))
+        conn.execute(text(
+            "INSERT INTO visits (id, page_url_id, referrer_id, user_agent_id, visit_time) "
+            "SELECT v.id, p.id, r.id, u.id, v.visit_time FROM visits_legacy v "
+            "LEFT JOIN page_urls p ON p.value = v.page_url "
+            "LEFT JOIN referrers r ON r.value = v.referrer "
+            "LEFT JOIN user_agents u ON u.value = v.user_agent"
+        ))
+        conn.execute(text("DROP TABLE visits_legacy"))
+    logger.info("Visits migrated to dimension tables")
+
+
+def _stats_query_time(engine, page_column: str, repeat: int = 5) -> float:
+    # Тот же проход, что и при пересчете агрегатов: по дням и страницам
+    query = text(
+        f"SELECT DATE(visit_time), {page_column}, COUNT(*) FROM visits "
+        f"GROUP BY DATE(visit_time), {page_column}"
+    )
+    with engine.connect() as conn:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(query).all()
+        return (time.perf_counter() - started) / repeat
+
+
+def _vacuum(engine):
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("VACUUM"))
+        conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перевод visits на справочники строк")
+    parser.parse_args()
+
+    if not needs_migration(ENGINE):
+        print("Visits already use dimension tables")
+        return
+
+    _vacuum(ENGINE)
+    size_before = os.path.getsize(DB_PATH)
+    time_before = _stats_query_time(ENGINE, "page_url")
+    migrate_visits(ENGINE)
+    _vacuum(ENGINE)
+    size_after = os.path.getsize(DB_PATH)
+    time_after = _stats_query_time(ENGINE, "page_url_id")
+
+    print(f"Database size: {size_before} -> {size_after} bytes")
+    print(f"Stats scan:    {time_before * 1000:.2f} -> {time_after * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import csv
+import io
+import json
+
+from . import crud
+from .database import READ_SESSIONLOCAL
+from .logger import log_error
+
+EXPORT_FIELDS = ("id", "page_url", "referrer", "user_agent", "visit_time")
+EXPORT_CHUNK_SIZE = 1000
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def _rows(**filters):
+    # Сессия живет вместе с генератором: зависимость get_db закрывается
+    # до того, как StreamingResponse начнет отдавать тело ответа
+    db = READ_SESSIONLOCAL()
+    try:
+        yield from crud.iter_visits(db, chunk_size=EXPORT_CHUNK_SIZE, **filters)
+    except Exception as e:
+        log_error(e, "Error exporting visits")
+        raise
+    finally:
+        db.close()
+
+
+def _ndjson(rows):
+    chunk = []
+    for row in rows:
+        record = dict(zip(EXPORT_FIELDS, row))
+        record["visit_time"] = record["visit_time"].isoformat() if record["visit_time"] else None
+        chunk.append(json.dumps(record, ensure_ascii=False))
+        if len(chunk) >= EXPORT_CHUNK_SIZE:
+            yield "\n".join(chunk) + "\n"
+            chunk = []
+    if chunk:
+        yield "\n".join(chunk) + "\n"
+
+
+def _csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_visits(fmt: str, **filters):
+    """
+    Генератор выгрузки посещений в NDJSON или CSV с постоянным потреблением памяти.
+    Args:
+        fmt: "ndjson" или "csv"
+        filters: date_from, date_to, page_prefix для crud.iter_visits
+    """
+    rows = _rows(**filters)
+    if fmt == "csv":
+        return _csv(rows)
+    return _ndjson(rows)
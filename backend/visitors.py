@@ -0,0 +1,54 @@
+import hashlib
+import os
+import re
+import secrets
+from typing import Optional
+
+from .database import DB_PATH
+from .process_lock import FileLock
+
+# Отпечаток посетителя для подсчета уникальных (скетчи HyperLogLog в rollups)
+VISITOR_COOKIE = os.getenv("KKO_VISITOR_COOKIE", "kko_vid")
+VISITOR_COOKIE_MAX_AGE = int(os.getenv("KKO_VISITOR_COOKIE_MAX_AGE", str(365 * 24 * 3600)))
+# Соль не дает восстановить IP перебором по отпечатку. Без KKO_VISITOR_SALT она создается
+# при первом запуске и хранится рядом с базой: одна на все воркеры и перезапуски,
+# иначе отпечатки одного посетителя расходились бы между ними
+VISITOR_SALT_FILE = os.getenv("KKO_VISITOR_SALT_FILE", os.path.splitext(DB_PATH)[0] + ".visitor_salt")
+
+
+def load_salt(path: str) -> bytes:
+    """
+    Читает соль из файла; если файла нет, создает случайную (доступ только владельцу).
+    Воркеры, стартующие одновременно, создают файл по очереди под файловой блокировкой.
+    """
+    with FileLock(path + ".lock"):
+        if not os.path.exists(path):
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "w") as file:
+                file.write(secrets.token_hex(32))
+        with open(path) as file:
+            return file.read().strip().encode()
+
+
+VISITOR_SALT = os.getenv("KKO_VISITOR_SALT", "").encode() or load_salt(VISITOR_SALT_FILE)
+
+_VISITOR_ID = re.compile(r"^[0-9a-f]{16}$")
+
+
+def fingerprint(client_ip: Optional[str], user_agent: Optional[str]) -> str:
+    """
+    Соленый хэш IP клиента и User-Agent: 16 hex-символов, сам IP не сохраняется.
+    """
+    source = f"{client_ip or ''}\n{user_agent or ''}".encode()
+    return hashlib.blake2b(source, digest_size=8, key=VISITOR_SALT[:64]).hexdigest()
+
+
+def visitor_id(cookie: Optional[str], client_ip: Optional[str], user_agent: Optional[str]) -> str:
+    """
+    Идентификатор посетителя: значение first-party cookie, если оно корректно,
+    иначе отпечаток IP и User-Agent. Отпечаток же выдается в cookie при первом визите,
+    поэтому смена IP (мобильная сеть, VPN) не порождает нового посетителя.
+    """
+    if cookie and _VISITOR_ID.match(cookie):
+        return cookie
+    return fingerprint(client_ip, user_agent)
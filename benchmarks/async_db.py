@@ -0,0 +1,110 @@
+"""
+Сравнение синхронного и асинхронного слоя доступа к данным под конкурентной нагрузкой.
+
+Запуск из корня проекта:
+    python -m benchmarks.async_db --requests 2000 --concurrency 50
+
+Каждый "запрос" делает то же, что и аутентифицированный /api/stats:
+get_user + get_visit_statistics. Параллельно работает пульс цикла событий,
+который показывает, насколько запросы его блокируют.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+SOURCE_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "kko_site.db")
+
+
+async def _heartbeat(lags: list, stop: asyncio.Event, interval: float = 0.001):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - started - interval)
+
+
+async def _run(name: str, handler, total: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await handler()
+            latencies.append(time.perf_counter() - started)
+
+    lags = []
+    stop = asyncio.Event()
+    pulse = asyncio.create_task(_heartbeat(lags, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await pulse
+
+    latencies.sort()
+    return {
+        "variant": name,
+        "requests": total,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+        "heartbeats": len(lags),
+        "max_loop_lag_ms": round(max(lags, default=0) * 1000, 2),
+        "mean_loop_lag_ms": round(statistics.fmean(lags) * 1000, 3) if lags else None,
+    }
+
+
+async def main(total: int, concurrency: int):
+    from backend import async_crud, crud, rollups
+    from backend.async_database import ASYNC_READ_SESSIONLOCAL, dispose_async_engines
+    from backend.database import Base, ENGINE, SESSIONLOCAL, READ_SESSIONLOCAL
+
+    Base.metadata.create_all(bind=ENGINE)
+    db = SESSIONLOCAL()
+    rollups.ensure_rollups(db)
+    db.close()
+
+    async def sync_handler():
+        # Так endpoints работали раньше: синхронная сессия прямо в async def
+        db = READ_SESSIONLOCAL()
+        try:
+            crud.get_user(db, "admin")
+            crud.get_visit_statistics(db)
+        finally:
+            db.close()
+
+    async def async_handler():
+        async with ASYNC_READ_SESSIONLOCAL() as db:
+            await async_crud.get_user(db, "admin")
+            await async_crud.get_visit_statistics(db)
+
+    results = [
+        await _run("sync", sync_handler, total, concurrency),
+        await _run("async", async_handler, total, concurrency),
+    ]
+    await dispose_async_engines()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    # Работаем на копии базы, чтобы не трогать рабочую
+    workdir = tempfile.mkdtemp(prefix="kko_bench_")
+    os.environ["KKO_DB_PATH"] = os.path.join(workdir, "kko_site.db")
+    shutil.copy(SOURCE_DB, os.environ["KKO_DB_PATH"])
+    try:
+        print(json.dumps(asyncio.run(main(args.requests, args.concurrency)), indent=2))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
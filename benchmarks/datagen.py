@@ -0,0 +1,163 @@
+"""
+Генератор синтетических посещений для нагрузочных замеров.
+
+Запуск из корня проекта:
+    python -m benchmarks.datagen --db /tmp/kko_bench.db --rows 1000000
+
+Страницы распределены по закону Ципфа, время - по суточному профилю за --days дней,
+около 10% посещений делают боты. Генерация детерминирована (--seed).
+После вставки агрегаты пересчитываются так же, как rollups rebuild, а для
+сценариев с авторизацией создается администратор admin/admin123.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+
+BATCH_SIZE = 100000
+
+BROWSER_AGENTS = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36 Edg/120.0.0.0",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0.0.0 YaBrowser/23.11.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:121.0) Gecko/20100101 Firefox/121.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Safari/605.1.15",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Mobile Safari/537.36",
+    "Mozilla/5.0 (Linux; Android 13; SM-S918B) AppleWebKit/537.36 (KHTML, like Gecko) SamsungBrowser/23.0 Chrome/115.0.0.0 Mobile Safari/537.36",
+    "Mozilla/5.0 (iPad; CPU OS 17_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Mobile/15E148 Safari/604.1",
+)
+BOT_AGENTS = (
+    "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+    "Mozilla/5.0 (compatible; YandexBot/3.0; +http://yandex.com/bots)",
+    "Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)",
+    "curl/8.4.0",
+    "Unknown",
+)
+REFERRERS = (
+    "Unknown", "https://www.google.com/", "https://yandex.ru/", "https://www.bing.com/",
+    "https://t.me/", "https://vk.com/", "https://duckduckgo.com/",
+)
+# Доля посещений по часам суток (UTC)
+HOURLY_PROFILE = (1, 1, 1, 1, 1, 2, 3, 5, 7, 8, 8, 8, 7, 7, 8, 8, 8, 7, 7, 6, 5, 4, 3, 2)
+
+
+def _pages(count: int) -> list:
+    sections = ("", "/about", "/services", "/blog", "/contacts", "/video", "/news")
+    pages = ["/"]
+    while len(pages) < count:
+        section = sections[len(pages) % len(sections)] or "/page"
+        pages.append(f"{section}/{len(pages)}")
+    return pages
+
+
+def _intern(conn, table: str, values, attributes=None) -> list:
+    ids = []
+    for value in values:
+        extra = attributes(value) if attributes else {}
+        columns = ["value", *extra]
+        conn.execute(
+            f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            [value, *extra.values()],
+        )
+        ids.append(conn.execute(f"SELECT id FROM {table} WHERE value = ?", (value,)).fetchone()[0])
+    return ids
+
+
+def generate(db_path: str, rows: int, days: int, pages: int, seed: int) -> dict:
+    """
+    Добавляет rows посещений в visits базы db_path.
+    Returns:
+        dict: Количество строк и скорость вставки
+    """
+    from backend.user_agents import classify
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+
+    page_ids = _intern(conn, "page_urls", _pages(pages))
+    referrer_ids = _intern(conn, "referrers", REFERRERS)
+    agent_ids = _intern(
+        conn, "user_agents", BROWSER_AGENTS + BOT_AGENTS,
+        lambda value: classify(value)._asdict(),
+    )
+    conn.commit()
+
+    page_weights = list(accumulate(1 / (rank + 1) ** 1.1 for rank in range(pages)))
+    agent_weights = list(accumulate(
+        [9 / len(BROWSER_AGENTS)] * len(BROWSER_AGENTS) + [1 / len(BOT_AGENTS)] * len(BOT_AGENTS)
+    ))
+    hour_weights = list(accumulate(HOURLY_PROFILE))
+    start = datetime.now(timezone.utc).replace(tzinfo=None, minute=0, second=0, microsecond=0) - timedelta(days=days)
+
+    started = time.perf_counter()
+    written = 0
+    while written < rows:
+        size = min(BATCH_SIZE, rows - written)
+        # Трафик растет к концу периода: день берем как максимум из двух равномерных
+        day_offsets = [max(rng.randrange(days), rng.randrange(days)) for _ in range(size)]
+        hours = rng.choices(range(24), cum_weights=hour_weights, k=size)
+        batch = [
+            (
+                page_id,
+                referrer_id,
+                agent_id,
+                (start + timedelta(days=day, hours=hour, seconds=rng.randrange(3600))).strftime(
+                    "%Y-%m-%d %H:%M:%S.000000"
+                ),
+            )
+            for page_id, referrer_id, agent_id, day, hour in zip(
+                rng.choices(page_ids, cum_weights=page_weights, k=size),
+                rng.choices(referrer_ids, k=size),
+                rng.choices(agent_ids, cum_weights=agent_weights, k=size),
+                day_offsets,
+                hours,
+            )
+        ]
+        conn.executemany(
+            "INSERT INTO visits (page_url_id, referrer_id, user_agent_id, visit_time) VALUES (?, ?, ?, ?)",
+            batch,
+        )
+        conn.commit()
+        written += size
+        print(f"\r{written}/{rows} rows", end="", flush=True)
+    print()
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return {"rows": written, "seconds": round(elapsed, 2), "rows_per_second": round(written / elapsed)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", required=True, help="Путь к базе (будет создана при отсутствии)")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-rollups", action="store_true")
+    args = parser.parse_args()
+
+    os.environ["KKO_DB_PATH"] = os.path.abspath(args.db)
+    from backend import rollups
+    from backend.database import SESSIONLOCAL
+    from backend.init_db import create_admin, init_db
+
+    init_db()
+    create_admin(password="admin123")
+    result = generate(args.db, args.rows, args.days, args.pages, args.seed)
+    if not args.skip_rollups:
+        db = SESSIONLOCAL()
+        try:
+            rebuild_started = time.perf_counter()
+            rollups.rebuild_rollups(db)
+            result["rollup_rebuild_seconds"] = round(time.perf_counter() - rebuild_started, 2)
+        finally:
+            db.close()
+    print(json.dumps(result, indent=2))
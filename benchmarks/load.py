@@ -0,0 +1,265 @@
+"""
+Нагрузочный замер API: в процессе через ASGI-транспорт или против запущенного uvicorn.
+
+Запуск из каталога, где импортируется пакет kko_pwa_app:
+    python -m kko_pwa_app.benchmarks.load --mode asgi --concurrency 20 --requests 500 --output run.json
+    python -m kko_pwa_app.benchmarks.load --mode uvicorn --workers 1 --output run.json
+    python -m kko_pwa_app.benchmarks.load compare run.json baseline.json --tolerance 0.15
+
+База по умолчанию - копия kko_site.db; для замеров на объеме укажите --db,
+подготовленную benchmarks/datagen.py. Сравнение отмечает сценарии, где p95
+выросла или RPS упали больше допуска, и завершается с кодом 1.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_DB = os.path.join(PROJECT_ROOT, "kko_site.db")
+DEFAULT_APP = "kko_pwa_app.backend.main:app"
+SCENARIOS = ("token", "users_me", "users_list", "stats", "page", "static")
+ADMIN = {"username": "admin", "password": "admin123"}
+
+
+def _percentile(values: list, fraction: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def _scenario_request(client, name: str, token: str, asset: str):
+    """
+    Возвращает функцию, создающую корутину одного запроса сценария.
+    """
+    auth = {"Authorization": f"Bearer {token}"}
+    requests = {
+        "token": lambda: client.post("/api/token", data=ADMIN),
+        "users_me": lambda: client.get("/api/users/me", headers=auth),
+        "users_list": lambda: client.get("/api/users/", headers=auth),
+        "stats": lambda: client.get("/api/stats"),
+        "page": lambda: client.get("/"),
+        "static": lambda: client.get(asset, headers={"Accept-Encoding": "br, gzip"}),
+    }
+    return requests[name]
+
+
+async def run_scenario(client, name: str, total: int, concurrency: int, token: str, asset: str) -> dict:
+    request = _scenario_request(client, name, token, asset)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            response = await request()
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "scenario": name,
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(_percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+async def _drive(client, scenarios: list, total: int, concurrency: int) -> list:
+    response = await client.post("/api/token", data=ADMIN)
+    response.raise_for_status()
+    token = response.json()["access_token"]
+
+    # Для сценария static берем первый js-файл из манифеста сборки
+    asset = "/favicon.ico"
+    manifest = await client.get("/asset-manifest.json")
+    if manifest.status_code == 200:
+        files = manifest.json().get("files", {})
+        asset = files.get("main.js", asset)
+
+    results = []
+    for name in scenarios:
+        # Прогрев: кэши, пулы соединений, ленивые импорты
+        await run_scenario(client, name, min(total, concurrency * 2), concurrency, token, asset)
+        results.append(await run_scenario(client, name, total, concurrency, token, asset))
+        print(json.dumps(results[-1]), file=sys.stderr)
+    return results
+
+
+async def run_asgi(app_path: str, scenarios: list, total: int, concurrency: int) -> list:
+    import httpx
+
+    module_name, _, attribute = app_path.partition(":")
+    app = getattr(importlib.import_module(module_name), attribute)
+    # ASGITransport не вызывает lifespan - запускаем его сами (очередь посещений и т.д.)
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            return await _drive(client, scenarios, total, concurrency)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_uvicorn(app_path: str, scenarios: list, total: int, concurrency: int, workers: int) -> list:
+    import httpx
+
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app_path, "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        env=os.environ.copy(),
+    )
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+            for _ in range(300):
+                try:
+                    if (await client.get("/metrics")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if server.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with code {server.returncode}")
+                await asyncio.sleep(0.1)
+            return await _drive(client, scenarios, total, concurrency)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Сравнивает прогон с базовым.
+    Returns:
+        list: Регрессии - сценарии, где p95 выше или RPS ниже базовых больше чем на tolerance
+    """
+    base = {result["scenario"]: result for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        reference = base.get(result["scenario"])
+        if reference is None:
+            continue
+        p95_change = result["p95_ms"] / reference["p95_ms"] - 1 if reference["p95_ms"] else 0.0
+        rps_change = result["rps"] / reference["rps"] - 1 if reference["rps"] else 0.0
+        regressed = p95_change > tolerance or rps_change < -tolerance or result["errors"] > reference["errors"]
+        print(
+            f"{result['scenario']:<12} p95 {reference['p95_ms']:>9.2f} -> {result['p95_ms']:>9.2f} ms "
+            f"({p95_change:+.0%})  rps {reference['rps']:>9.1f} -> {result['rps']:>9.1f} ({rps_change:+.0%})"
+            f"{'  REGRESSION' if regressed else ''}"
+        )
+        if regressed:
+            regressions.append(result["scenario"])
+    return regressions
+
+
+def _prepare_environment(args) -> str:
+    # Работаем на копии базы, чтобы замер не менял рабочие данные
+    workdir = tempfile.mkdtemp(prefix="kko_bench_")
+    db_path = os.path.join(workdir, "kko_site.db")
+    shutil.copy(args.db or SOURCE_DB, db_path)
+    os.environ["KKO_DB_PATH"] = db_path
+    os.environ["KKO_LOG_DIR"] = workdir
+    os.environ["KKO_ARCHIVE_DIR"] = os.path.join(workdir, "archive")
+    # Архивирование синтетических старых данных во время замера исказит результаты
+    os.environ.setdefault("KKO_VISIT_HOT_DAYS", "36500")
+    os.environ.setdefault("KKO_ACCESS_LOG_RATE_LIMIT", "10")
+    sys.path.insert(0, os.path.dirname(PROJECT_ROOT))
+    return workdir
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command")
+    compare_parser = subparsers.add_parser("compare", help="Сравнить два сохраненных прогона")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("--tolerance", type=float, default=0.15)
+
+    parser.add_argument("--mode", choices=["asgi", "uvicorn"], default="asgi")
+    parser.add_argument("--app", default=DEFAULT_APP)
+    parser.add_argument("--db", help="База для замера (по умолчанию kko_site.db); используется копия")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=500, help="Запросов на сценарий")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=1, help="Процессы uvicorn (режим uvicorn)")
+    parser.add_argument("--output", help="Файл для результатов JSON")
+    parser.add_argument("--baseline", help="Сразу сравнить с базовым прогоном")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.current, encoding="utf-8") as current, open(args.baseline, encoding="utf-8") as baseline:
+            sys.exit(1 if compare(json.load(current), json.load(baseline), args.tolerance) else 0)
+
+    scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    workdir = _prepare_environment(args)
+    try:
+        if args.mode == "asgi":
+            results = asyncio.run(run_asgi(args.app, scenarios, args.requests, args.concurrency))
+        else:
+            results = asyncio.run(
+                run_uvicorn(args.app, scenarios, args.requests, args.concurrency, args.workers)
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "mode": args.mode,
+            "workers": args.workers if args.mode == "uvicorn" else None,
+            "database": args.db or SOURCE_DB,
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output)
+    print(output)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline:
+            sys.exit(1 if compare(report, json.load(baseline), args.tolerance) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Стоимость логирования одного HTTP-запроса для вызывающего потока (цикла событий).
+
+Запуск из корня проекта:
+    python -m benchmarks.logging_overhead --requests 20000
+
+before - прежняя схема: две строки INFO на запрос, синхронные RotatingFileHandler и консоль.
+after - одна строка access_logger через очередь; файл пишет поток QueueListener.
+Консоль в обоих вариантах направлена в /dev/null.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from logging.handlers import RotatingFileHandler
+
+
+def _legacy_logger(directory: str, stream) -> logging.Logger:
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    file_handler = RotatingFileHandler(
+        os.path.join(directory, "legacy.log"), maxBytes=10485760, backupCount=5
+    )
+    file_handler.setFormatter(formatter)
+    console_handler = logging.StreamHandler(stream)
+    console_handler.setFormatter(formatter)
+    legacy = logging.getLogger("kko_bench_legacy")
+    legacy.setLevel(logging.INFO)
+    legacy.addHandler(file_handler)
+    legacy.addHandler(console_handler)
+    legacy.propagate = False
+    return legacy
+
+
+def _measure(name: str, emit, total: int, drain=None) -> dict:
+    started = time.perf_counter()
+    for i in range(total):
+        emit(i)
+    elapsed = time.perf_counter() - started
+    drain_started = time.perf_counter()
+    if drain is not None:
+        drain()
+    return {
+        "variant": name,
+        "requests": total,
+        "per_request_us": round(elapsed / total * 1e6, 2),
+        "caller_seconds": round(elapsed, 3),
+        "drain_seconds": round(time.perf_counter() - drain_started, 3),
+    }
+
+
+def main(total: int) -> list:
+    from backend import logger as log_module
+
+    devnull = open(os.devnull, "w")
+    log_module.console_handler.setStream(devnull)
+    legacy = _legacy_logger(log_module.log_directory, devnull)
+
+    def before(i):
+        legacy.info("Request: %s %s", "GET", f"http://127.0.0.1:8000/page/{i}")
+        legacy.info("Response Status: %s", 200)
+
+    def after(i):
+        log_module.access_logger.info(
+            "%s %s %s", "GET", f"/page/{i}", 200,
+            extra={"method": "GET", "path": f"/page/{i}", "status": 200, "duration_ms": 1.0},
+        )
+
+    def drain():
+        # Ждем, пока поток QueueListener допишет очередь
+        while not log_module.log_queue.empty():
+            time.sleep(0.01)
+
+    results = [
+        _measure("before", before, total),
+        _measure("after", after, total, drain),
+        {"variant": "after", **log_module.log_stats()},
+    ]
+    devnull.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    # Логи пишем во временный каталог; выборку и лимит отключаем, чтобы сравнивать одинаковый объем
+    workdir = tempfile.mkdtemp(prefix="kko_bench_")
+    os.environ["KKO_LOG_DIR"] = workdir
+    os.environ["KKO_ACCESS_LOG_SAMPLE_RATE"] = "1.0"
+    os.environ["KKO_ACCESS_LOG_RATE_LIMIT"] = "0"
+    os.environ["KKO_LOG_QUEUE_SIZE"] = str(args.requests + 1)
+    try:
+        print(json.dumps(main(args.requests), indent=2))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
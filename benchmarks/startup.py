@@ -0,0 +1,74 @@
+"""
+Время холодного старта воркера: импорт приложения и lifespan, в отдельных процессах.
+
+Запуск из каталога, где импортируется пакет kko_pwa_app:
+    python -m kko_pwa_app.benchmarks.startup --runs 5
+
+Первый прогон идет на непромигрированной копии базы, остальные - на уже
+промигрированной, как при перезапуске или старте очередного воркера.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_DB = os.path.join(PROJECT_ROOT, "kko_site.db")
+
+CHILD = """
+import asyncio, json, time
+started = time.perf_counter()
+from kko_pwa_app.backend.main import app, startup_report
+imported = time.perf_counter() - started
+
+async def boot():
+    async with app.router.lifespan_context(app):
+        pass
+
+asyncio.run(boot())
+print(json.dumps({"import_total": round(imported, 4), **startup_report}))
+"""
+
+
+def run_once(env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD], env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--db", help="База для замера (по умолчанию kko_site.db); используется копия")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="kko_bench_")
+    env = os.environ.copy()
+    env.update({
+        "KKO_DB_PATH": os.path.join(workdir, "kko_site.db"),
+        "KKO_LOG_DIR": workdir,
+        "KKO_ARCHIVE_DIR": os.path.join(workdir, "archive"),
+        "KKO_STATIC_CACHE_DIR": os.path.join(workdir, "static_cache"),
+        "PYTHONPATH": os.pathsep.join(filter(None, [os.path.dirname(PROJECT_ROOT), env.get("PYTHONPATH")])),
+    })
+    shutil.copy(args.db or SOURCE_DB, env["KKO_DB_PATH"])
+    try:
+        runs = [run_once(env) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    warm = runs[1:] or runs
+    report = {
+        "first_run": runs[0],
+        "warm_median": {key: round(statistics.median(run[key] for run in warm), 4) for key in warm[0]},
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
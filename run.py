@@ -14,6 +14,7 @@ def signal_handler(_, __):
     sys.exit(0)
 
 if __name__ == "__main__":
+    # Режим разработки; для продакшена: python -m backend.server --workers N
     # Регистрируем обработчик сигнала SIGINT (Ctrl+C)
     signal.signal(signal.SIGINT, signal_handler)
 
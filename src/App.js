@@ -4,6 +4,7 @@ import Login from './components/Login';
 import axios from 'axios';
 import { BrowserRouter as Router, Route, Link, Routes } from "react-router-dom";
 import Dashboard from "./components/Dashboard";
+import { PageViewTracker } from './pageViews';
 
 function App() {
   // Состояние для отслеживания аутентификации пользователя
@@ -14,7 +15,23 @@ function App() {
   const [showLogin, setShowLogin] = useState(false);
   const [deferredPrompt, setDeferredPrompt] = useState(null);
 
-  const checkAuth = useCallback(async () => {
+  // Access-токен живет недолго: при 401 один раз обновляем пару по refresh-токену
+  const refreshTokens = useCallback(async () => {
+    const refreshToken = localStorage.getItem('refreshToken');
+    if (!refreshToken) {
+      return false;
+    }
+    try {
+      const response = await axios.post('/api/token/refresh', { refresh_token: refreshToken });
+      localStorage.setItem('token', response.data.access_token);
+      localStorage.setItem('refreshToken', response.data.refresh_token);
+      return true;
+    } catch (error) {
+      return false;
+    }
+  }, []);
+
+  const checkAuth = useCallback(async (retry = true) => {
     try {
       const response = await axios.get('/api/users/me', {
         headers: {
@@ -24,10 +41,14 @@ function App() {
       setUser(response.data);
       setIsAuthenticated(true);
     } catch (error) {
+      if (retry && error.response?.status === 401 && await refreshTokens()) {
+        return checkAuth(false);
+      }
       localStorage.removeItem('token');
+      localStorage.removeItem('refreshToken');
       setIsAuthenticated(false);
     }
-  }, []);
+  }, [refreshTokens]);
 
   useEffect(() => {
     const token = localStorage.getItem('token');
@@ -60,10 +81,15 @@ function App() {
 
   /**
    * Обработчик выхода из системы
-   * Удаляет токен и очищает данные пользователя
+   * Отзывает токены на сервере, удаляет их и очищает данные пользователя
    */
   const handleLogout = () => {
+    const refreshToken = localStorage.getItem('refreshToken');
+    if (refreshToken) {
+      axios.post('/api/token/revoke', { refresh_token: refreshToken }).catch(() => {});
+    }
     localStorage.removeItem('token');
+    localStorage.removeItem('refreshToken');
     setIsAuthenticated(false);
     setUser(null);
   };
@@ -87,6 +113,8 @@ function App() {
 
   return (
     <Router>
+      {/* Учет просмотров при каждой навигации */}
+      <PageViewTracker />
       <div className="App">
         <div className="App-header">
           <h1 className="title">
@@ -127,7 +155,7 @@ function App() {
 
         <Routes>
           {/* Отдельный маршрут для дашборда */}
-          <Route path="/dashboard" element={<Dashboard />} />
+          <Route path="/dashboard" element={<Dashboard user={user} />} />
         </Routes>
 
         {/* Кнопка для установки на главный экран */}
@@ -1,15 +1,32 @@
-import React, { useEffect, useState } from "react";
+import React, { useCallback, useEffect, useState } from "react";
 import axios from "axios";
+import { applyStatsDelta, subscribeLiveStats } from "./liveStats";
 
-const Dashboard = () => {
+const Dashboard = ({ user }) => {
   const [stats, setStats] = useState(null);
+  // Поток приращений доступен только администраторам
+  const isAdmin = user?.role === "admin";
 
-  useEffect(() => {
+  const loadStats = useCallback(() => {
     axios.get("http://127.0.0.1:8000/api/stats")
       .then((response) => setStats(response.data))
       .catch((error) => console.error("Error fetching stats:", error));
   }, []);
 
+  useEffect(() => {
+    loadStats();
+    if (!isAdmin) {
+      return undefined;
+    }
+    return subscribeLiveStats((message) => {
+      if (message.type === "resync") {
+        loadStats();
+      } else if (message.type === "delta") {
+        setStats((current) => (current ? applyStatsDelta(current, message) : current));
+      }
+    });
+  }, [loadStats, isAdmin]);
+
   if (!stats) {
     return <div>Loading...</div>;
   }
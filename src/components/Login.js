@@ -26,6 +26,7 @@ const Login = ({ onLogin, onClose }) => {
       console.log('Login response:', response.data);
       
       localStorage.setItem('token', response.data.access_token);
+      localStorage.setItem('refreshToken', response.data.refresh_token);
       onLogin();
     } catch (err) {
       console.error('Login error:', {
@@ -1,18 +1,72 @@
-import React, { useEffect, useState } from "react";
+import React, { useCallback, useEffect, useState } from "react";
 import axios from "axios";
+import { subscribeLiveStats } from "./liveStats";
 
-const SEOStats = () => {
+const SEOStats = ({ user }) => {
   const [visits, setVisits] = useState([]);
+  const isAdmin = user?.role === "admin";
+  // Новые посещения по страницам с момента загрузки списка
+  const [liveCounts, setLiveCounts] = useState({});
 
-  useEffect(() => {
-    axios.get("http://127.0.0.1:8000/api/visits")
-      .then((response) => setVisits(response.data))
+  const loadVisits = useCallback(() => {
+    axios.get("http://127.0.0.1:8000/api/visits", {
+      headers: { Authorization: `Bearer ${localStorage.getItem("token")}` },
+    })
+      .then((response) => {
+        setVisits(response.data.visits);
+        setLiveCounts({});
+      })
       .catch((error) => console.error("Error fetching visits:", error));
   }, []);
 
+  useEffect(() => {
+    // Список посещений и поток приращений доступны только администраторам
+    if (!isAdmin) {
+      return undefined;
+    }
+    loadVisits();
+    return subscribeLiveStats((message) => {
+      if (message.type === "resync") {
+        loadVisits();
+      } else if (message.type === "delta") {
+        setLiveCounts((current) => {
+          const next = { ...current };
+          message.by_page.forEach(({ page_url, count }) => {
+            next[page_url] = (next[page_url] || 0) + count;
+          });
+          return next;
+        });
+      }
+    });
+  }, [loadVisits, isAdmin]);
+
+  const livePages = Object.entries(liveCounts).sort((a, b) => b[1] - a[1]);
+
   return (
     <div>
       <h1>SEO Статистика</h1>
+      {livePages.length > 0 && (
+        <div>
+          <h2>Новые посещения</h2>
+          <button onClick={loadVisits}>Обновить список</button>
+          <table>
+            <thead>
+              <tr>
+                <th>URL страницы</th>
+                <th>Посещений</th>
+              </tr>
+            </thead>
+            <tbody>
+              {livePages.map(([pageUrl, count]) => (
+                <tr key={pageUrl}>
+                  <td>{pageUrl}</td>
+                  <td>{count}</td>
+                </tr>
+              ))}
+            </tbody>
+          </table>
+        </div>
+      )}
       <table>
         <thead>
           <tr>
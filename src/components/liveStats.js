@@ -0,0 +1,78 @@
+// Подписка на приращения статистики (/api/live) с переподключением.
+// Возвращает функцию отписки для useEffect.
+// Поток только для администраторов; WebSocket не передает заголовок Authorization,
+// поэтому access-токен идет параметром запроса
+const RECONNECT_DELAY_MS = 3000;
+// Сервер отказывает до accept: браузер видит неудачное рукопожатие (код 1006),
+// поэтому после нескольких отказов подряд переподключения прекращаются
+const MAX_HANDSHAKE_FAILURES = 3;
+const POLICY_VIOLATION = 1008;
+
+// Адрес потока - тот же хост, с которого загружено приложение
+const liveUrl = () => {
+  const protocol = window.location.protocol === "https:" ? "wss:" : "ws:";
+  return `${protocol}//${window.location.host}/api/live`;
+};
+
+export const subscribeLiveStats = (onMessage) => {
+  let socket = null;
+  let timer = null;
+  let closed = false;
+  let failures = 0;
+  let connectedBefore = false;
+
+  const connect = () => {
+    // Токен читается при каждом подключении: за время разрыва его могли обновить
+    const token = localStorage.getItem("token") || "";
+    let opened = false;
+    socket = new WebSocket(`${liveUrl()}?token=${encodeURIComponent(token)}`);
+    socket.onopen = () => {
+      opened = true;
+      failures = 0;
+      // После переподключения пропущенные приращения не восстановить - перечитываем целиком
+      if (connectedBefore) {
+        onMessage({ type: "resync" });
+      }
+      connectedBefore = true;
+    };
+    socket.onmessage = (event) => {
+      const message = JSON.parse(event.data);
+      if (message.type !== "ping") {
+        onMessage(message);
+      }
+    };
+    socket.onclose = (event) => {
+      if (closed || event.code === POLICY_VIOLATION) {
+        return;
+      }
+      if (!opened) {
+        failures += 1;
+        if (failures >= MAX_HANDSHAKE_FAILURES) {
+          return;
+        }
+      }
+      timer = setTimeout(connect, RECONNECT_DELAY_MS);
+    };
+  };
+
+  connect();
+  return () => {
+    closed = true;
+    clearTimeout(timer);
+    socket.close();
+  };
+};
+
+// Добавляет приращение delta к ответу /api/stats (ряд по дням)
+export const applyStatsDelta = (stats, delta) => {
+  const byDate = stats.visits_by_date.map((entry) => ({ ...entry }));
+  delta.by_date.forEach(({ date, count }) => {
+    const entry = byDate.find((item) => item.date === date);
+    if (entry) {
+      entry.count += count;
+    } else {
+      byDate.push({ date, count });
+    }
+  });
+  return { ...stats, total_visits: stats.total_visits + delta.total, visits_by_date: byDate };
+};
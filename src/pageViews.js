@@ -0,0 +1,59 @@
+import { useEffect, useRef } from 'react';
+import { useLocation } from 'react-router-dom';
+
+// Просмотры считаются на клиенте: после первой загрузки SPA почти не обращается к серверу.
+// Просмотр передается service worker'у, который копит их (и офлайн тоже)
+// и отправляет в /api/collect пачками
+const COLLECT_URL = '/api/collect';
+
+const newEventId = () =>
+  window.crypto && window.crypto.randomUUID
+    ? window.crypto.randomUUID()
+    : `${Date.now().toString(16)}-${Math.random().toString(16).slice(2)}`;
+
+export function trackPageView(pageUrl = window.location.pathname, referrer = document.referrer) {
+  const event = {
+    id: newEventId(),
+    page_url: pageUrl,
+    referrer: referrer || null,
+    ts: new Date().toISOString(),
+  };
+
+  const controller = navigator.serviceWorker && navigator.serviceWorker.controller;
+  if (controller) {
+    controller.postMessage({ type: 'PAGE_VIEW', event });
+    return;
+  }
+
+  // Service worker еще не управляет страницей (первая загрузка) - отправляем сразу
+  const body = JSON.stringify({ events: [event] });
+  if (!(navigator.sendBeacon && navigator.sendBeacon(COLLECT_URL, body))) {
+    fetch(COLLECT_URL, { method: 'POST', body, keepalive: true }).catch(() => {});
+  }
+}
+
+/**
+ * Хук учета просмотров: один просмотр на каждую навигацию роутера.
+ * Первый просмотр получает document.referrer, следующие - адрес предыдущей страницы
+ */
+export function usePageViews() {
+  const location = useLocation();
+  const previous = useRef(null);
+
+  useEffect(() => {
+    // StrictMode повторно запускает эффекты - ту же навигацию не считаем дважды
+    if (previous.current && previous.current.key === location.key) {
+      return;
+    }
+    const referrer = previous.current
+      ? window.location.origin + previous.current.pathname
+      : document.referrer;
+    previous.current = location;
+    trackPageView(location.pathname, referrer);
+  }, [location]);
+}
+
+export function PageViewTracker() {
+  usePageViews();
+  return null;
+}
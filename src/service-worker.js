@@ -7,6 +7,7 @@
 // You can also remove this file if you'd prefer not to use a
 // service worker, and the Workbox build step will be skipped.
 
+import { Queue } from 'workbox-background-sync';
 import { clientsClaim } from 'workbox-core';
 import { ExpirationPlugin } from 'workbox-expiration';
 import { precacheAndRoute, createHandlerBoundToURL } from 'workbox-precaching';
@@ -69,4 +70,61 @@ self.addEventListener('message', (event) => {
   }
 });
 
+// Page views from open tabs (see src/pageViews.js) are buffered here and sent
+// to /api/collect in one request. Batches that fail while offline are kept in
+// IndexedDB by the background sync queue and replayed when the network is back;
+// every event carries an id, so the server drops replays it has already stored.
+const COLLECT_URL = '/api/collect';
+const COLLECT_FLUSH_DELAY_MS = 5000;
+const COLLECT_MAX_EVENTS = 500;
+const collectQueue = new Queue('page-views', { maxRetentionTime: 7 * 24 * 60 });
+let pendingViews = [];
+let scheduledFlush = null;
+
+function sendPageViews(events) {
+  const request = new Request(COLLECT_URL, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ events }),
+    credentials: 'same-origin',
+  });
+  return fetch(request.clone())
+    .then((response) => {
+      // A 4xx answer will not change on retry, so only server errors are queued
+      if (response.status >= 500) {
+        throw new Error(`collect failed: ${response.status}`);
+      }
+    })
+    .catch(() => collectQueue.pushRequest({ request }));
+}
+
+function flushPageViews() {
+  const batches = [];
+  while (pendingViews.length) {
+    batches.push(sendPageViews(pendingViews.splice(0, COLLECT_MAX_EVENTS)));
+  }
+  return Promise.all(batches);
+}
+
+function scheduleFlush() {
+  if (pendingViews.length >= COLLECT_MAX_EVENTS) {
+    return flushPageViews();
+  }
+  if (!scheduledFlush) {
+    scheduledFlush = new Promise((resolve) => setTimeout(resolve, COLLECT_FLUSH_DELAY_MS)).then(() => {
+      scheduledFlush = null;
+      return flushPageViews();
+    });
+  }
+  return scheduledFlush;
+}
+
+self.addEventListener('message', (event) => {
+  if (event.data && event.data.type === 'PAGE_VIEW') {
+    pendingViews.push(event.data.event);
+    // Keep the service worker alive until the batch is sent
+    event.waitUntil(scheduleFlush());
+  }
+});
+
 // Any other custom service worker logic can go here.
@@ -0,0 +1,75 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_DB = os.path.join(PROJECT_ROOT, "kko_site.db")
+
+# Настройки backend читаются при импорте модулей, поэтому окружение задается до первого
+# импорта: тесты работают с копией базы во временном каталоге и не трогают kko_site.db
+WORKDIR = tempfile.mkdtemp(prefix="kko_tests_")
+TEST_ENV = {
+    "KKO_DB_PATH": os.path.join(WORKDIR, "kko_site.db"),
+    "KKO_LOG_DIR": os.path.join(WORKDIR, "logs"),
+    "KKO_ARCHIVE_DIR": os.path.join(WORKDIR, "archive"),
+    "KKO_STATIC_DIR": os.path.join(WORKDIR, "build"),
+    "KKO_STATIC_CACHE_DIR": os.path.join(WORKDIR, "static_cache"),
+    "KKO_VIDEO_DIR": os.path.join(WORKDIR, "videos"),
+    # Каталог видео перечитывается на каждый запрос: тесты создают файлы по ходу
+    "KKO_VIDEO_RESCAN_INTERVAL": "0",
+}
+os.environ.update(TEST_ENV)
+os.makedirs(TEST_ENV["KKO_VIDEO_DIR"])
+# Сборка PWA тестам не нужна, но каталог статики должен существовать
+os.makedirs(TEST_ENV["KKO_STATIC_DIR"])
+shutil.copy(SOURCE_DB, TEST_ENV["KKO_DB_PATH"])
+sys.path.insert(0, PROJECT_ROOT)
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    from backend.main import app
+    from backend.password_utils import pwd_context
+
+    # Минимальная стоимость bcrypt: тесты проверяют логику, а не стойкость хеша
+    pwd_context.update(bcrypt__rounds=4)
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(scope="session")
+def admin_headers(client):
+    from backend.auth import create_access_token
+
+    return {"Authorization": "Bearer " + create_access_token({"sub": "admin"})}
+
+
+@pytest.fixture
+def make_user(client, admin_headers):
+    """
+    Создает пользователя через API и возвращает (username, password).
+    """
+    created = []
+
+    def factory(role: str = "manager"):
+        username = f"user{len(created)}_{os.urandom(4).hex()}"
+        password = "secret-" + username
+        response = client.post(
+            "/api/users/",
+            json={"username": username, "email": f"{username}@example.com", "role": role, "password": password},
+            headers=admin_headers,
+        )
+        assert response.status_code == 200, response.text
+        created.append(username)
+        return username, password
+
+    return factory
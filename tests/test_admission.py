@@ -0,0 +1,70 @@
+import asyncio
+
+import httpx
+import pytest
+
+from backend.admission import AdmissionClass, AdmissionController, AdmissionMiddleware, admission
+
+
+@pytest.mark.parametrize("path, expected", [
+    ("/api/token", "auth"),
+    ("/api/token/refresh", "interactive"),
+    ("/api/token/revoke", "interactive"),
+    ("/api/videos/clip.mp4", "video"),
+    ("/api/videos", "interactive"),
+    ("/api/users/bulk", "analytics"),
+    ("/api/users/me", "interactive"),
+    ("/static/js/main.js", "static"),
+])
+def test_paths_are_classified(path, expected):
+    assert admission.classify(path).name == expected
+
+
+def test_streams_and_metrics_bypass_admission():
+    assert admission.classify("/api/live") is None
+    assert admission.classify("/metrics") is None
+
+
+def run_overloaded(status_code):
+    """
+    Место одно, очередь на один запрос: первый запрос держит место, пока не открыт gate.
+    Returns:
+        list: Ответы трех одновременных запросов в порядке отправки
+    """
+    admission_class = AdmissionClass("test", limit=1, queue_size=1, deadline=0.2, status_code=status_code)
+    gate = asyncio.Event()
+
+    async def app(scope, receive, send):
+        await gate.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    middleware = AdmissionMiddleware(app, AdmissionController([admission_class], (("/", "test"),)))
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=middleware)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            running = asyncio.create_task(client.get("/"))
+            await asyncio.sleep(0.05)
+            queued = asyncio.create_task(client.get("/"))
+            await asyncio.sleep(0.05)
+            # Очередь полна: отказ сразу, без ожидания
+            overflow = await client.get("/")
+            # Место не освободилось за deadline: ждущий тоже получает отказ
+            expired = await queued
+            gate.set()
+            return [await running, expired, overflow], admission_class
+
+    return asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("status_code", [503, 429])
+def test_overload_is_shed_with_retry_after(status_code):
+    (running, expired, overflow), admission_class = run_overloaded(status_code)
+
+    assert running.status_code == 200
+    for response in (expired, overflow):
+        assert response.status_code == status_code
+        assert response.headers["retry-after"] == "1"
+    assert admission_class.shed == {"queue_full": 1, "deadline": 1}
+    assert admission_class.active == 0
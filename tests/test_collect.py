@@ -0,0 +1,113 @@
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from backend.collect import COLLECT_CLOCK_SKEW_SECONDS, COLLECT_MAX_AGE_HOURS, COLLECT_MAX_BYTES, COLLECT_MAX_EVENTS
+from backend.visitors import VISITOR_COOKIE
+
+
+def event(page_url, ts=None, **fields):
+    return {
+        "id": str(uuid.uuid4()),
+        "page_url": page_url,
+        "ts": (ts or datetime.now(timezone.utc)).isoformat(),
+        **fields,
+    }
+
+
+@pytest.fixture
+def prefix():
+    # Свой префикс URL у каждого теста: посещения проверяются через /api/visits
+    return f"/tests/collect/{uuid.uuid4().hex[:8]}/"
+
+
+def visits_under(client, admin_headers, prefix):
+    response = client.get("/api/visits", params={"page_prefix": prefix, "limit": 1000}, headers=admin_headers)
+    assert response.status_code == 200
+    return response.json()["visits"]
+
+
+def test_valid_events_are_written(client, admin_headers, prefix):
+    events = [event(prefix + str(i), referrer="https://example.com/") for i in range(5)]
+
+    response = client.post("/api/collect", json={"events": events})
+
+    assert response.status_code == 200
+    assert response.json() == {"accepted": 5, "duplicates": 0, "rejected": []}
+    assert VISITOR_COOKIE in response.cookies
+    visits = visits_under(client, admin_headers, prefix)
+    assert sorted(visit["page_url"] for visit in visits) == sorted(item["page_url"] for item in events)
+
+
+def test_plain_list_and_text_plain_body(client, prefix):
+    # navigator.sendBeacon отправляет строку как text/plain
+    response = client.post(
+        "/api/collect", content=json.dumps([event(prefix)]), headers={"content-type": "text/plain"}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["accepted"] == 1
+
+
+def test_invalid_events_are_rejected_individually(client, admin_headers, prefix):
+    now = datetime.now(timezone.utc)
+    events = [
+        event(prefix + "ok"),
+        {**event(prefix), "id": "short"},
+        event("no-leading-slash"),
+        event(prefix + "old", now - timedelta(hours=COLLECT_MAX_AGE_HOURS + 1)),
+        event(prefix + "future", now + timedelta(seconds=COLLECT_CLOCK_SKEW_SECONDS + 60)),
+        {"id": str(uuid.uuid4()), "ts": now.isoformat()},
+        "not an object",
+    ]
+
+    response = client.post("/api/collect", json={"events": events})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["accepted"] == 1
+    assert [item["index"] for item in body["rejected"]] == [1, 2, 3, 4, 5, 6]
+    assert body["rejected"][0]["error"].startswith("id:")
+    assert body["rejected"][1]["error"].startswith("page_url:")
+    assert body["rejected"][2]["error"] == "ts: out of accepted range"
+    assert body["rejected"][4]["error"].startswith("page_url:")
+    assert [visit["page_url"] for visit in visits_under(client, admin_headers, prefix)] == [prefix + "ok"]
+
+
+def test_retried_batch_is_deduplicated(client, admin_headers, prefix):
+    events = [event(prefix + str(i)) for i in range(3)]
+    assert client.post("/api/collect", json={"events": events}).json()["accepted"] == 3
+
+    # Service worker повторяет пачку, ответ на которую не дошел, плюс новое событие
+    response = client.post("/api/collect", json={"events": events + [event(prefix + "new")]})
+
+    assert response.json() == {"accepted": 1, "duplicates": 3, "rejected": []}
+    assert len(visits_under(client, admin_headers, prefix)) == 4
+
+
+def test_repeat_inside_batch_is_written_once(client, admin_headers, prefix):
+    single = event(prefix)
+
+    response = client.post("/api/collect", json={"events": [single, single, single]})
+
+    assert response.json()["accepted"] == 1
+    assert len(visits_under(client, admin_headers, prefix)) == 1
+
+
+@pytest.mark.parametrize("body", [b"{not json", b'{"events": {}}', b'"events"'])
+def test_malformed_payload_is_422(client, body):
+    assert client.post("/api/collect", content=body).status_code == 422
+
+
+def test_too_many_events_is_422(client, prefix):
+    events = [event(prefix)] * (COLLECT_MAX_EVENTS + 1)
+
+    assert client.post("/api/collect", json={"events": events}).status_code == 422
+
+
+def test_oversized_body_is_413(client):
+    body = b" " * (COLLECT_MAX_BYTES + 1)
+
+    assert client.post("/api/collect", content=body).status_code == 413
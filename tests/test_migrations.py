@@ -0,0 +1,156 @@
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+from conftest import PROJECT_ROOT, SOURCE_DB
+
+# Миграции работают с базой из KKO_DB_PATH, прочитанной при импорте backend,
+# поэтому каждый шаг выполняется в отдельном процессе со своей копией базы
+STEP = """
+import json, sys
+from datetime import datetime
+from backend import migrations
+from backend.partitions import maintenance_lock, run_maintenance
+
+upto = int(sys.argv[1])
+migrations.MIGRATIONS = migrations.MIGRATIONS[:upto]
+migrations.SCHEMA_VERSION = upto
+result = migrations.run_migrations()
+if len(sys.argv) > 2:
+    with maintenance_lock:
+        result["maintenance"] = run_maintenance(now=datetime.fromisoformat(sys.argv[2]), hot_days=7)
+print(json.dumps(result))
+"""
+
+
+@pytest.fixture
+def old_db(tmp_path):
+    # kko_site.db из репозитория - исходная схема (user_version 0, строки в visits)
+    path = tmp_path / "old.db"
+    shutil.copy(SOURCE_DB, path)
+    return path
+
+
+def migrate(db_path, upto=None, archive_now=None):
+    from backend.migrations import SCHEMA_VERSION
+
+    workdir = os.path.dirname(db_path)
+    env = {
+        **os.environ,
+        "KKO_DB_PATH": str(db_path),
+        "KKO_ARCHIVE_DIR": os.path.join(workdir, "archive"),
+        "KKO_LOG_DIR": os.path.join(workdir, "logs"),
+        "PYTHONPATH": PROJECT_ROOT,
+    }
+    args = [sys.executable, "-c", STEP, str(upto or SCHEMA_VERSION)] + ([archive_now] if archive_now else [])
+    output = subprocess.run(args, env=env, capture_output=True, text=True, check=True, cwd=PROJECT_ROOT)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def query(db_path, sql):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(sql).fetchall()
+
+
+def columns(db_path, table):
+    return {row[1] for row in query(db_path, f"PRAGMA table_info({table})")}
+
+
+def test_original_schema_upgrades_to_latest(old_db):
+    from backend.migrations import SCHEMA_VERSION
+
+    visits = query(old_db, "SELECT count(*) FROM visits")[0][0]
+
+    result = migrate(old_db)
+
+    assert result["applied"] == list(range(1, SCHEMA_VERSION + 1))
+    assert query(old_db, "PRAGMA user_version")[0][0] == SCHEMA_VERSION
+    # Строки visits переведены на справочники без потерь
+    assert {"page_url_id", "referrer_id", "user_agent_id"} <= columns(old_db, "visits")
+    assert "page_url" not in columns(old_db, "visits")
+    assert query(old_db, "SELECT count(*) FROM visits")[0][0] == visits
+    assert query(old_db, "SELECT sum(visits) FROM visit_daily_rollups")[0][0] == visits
+    assert query(old_db, "SELECT username FROM users WHERE username = 'admin'") == [("admin",)]
+    for table in ("visit_daily_sketches", "collected_events", "revoked_tokens"):
+        assert query(old_db, f"SELECT count(*) FROM sqlite_master WHERE name = '{table}'")[0][0] == 1
+    assert {"min_id", "max_id"} <= columns(old_db, "visit_partitions")
+
+    # Повторный запуск ничего не применяет
+    assert migrate(old_db)["applied"] == []
+
+
+def test_v1_database_upgrades_to_latest(old_db):
+    from backend.migrations import SCHEMA_VERSION
+
+    assert migrate(old_db, upto=1)["applied"] == [1]
+    assert query(old_db, "SELECT count(*) FROM sqlite_master WHERE name = 'visit_daily_rollups'")[0][0] == 1
+    assert query(old_db, "SELECT count(*) FROM visit_daily_rollups")[0][0] == 0
+
+    result = migrate(old_db)
+
+    assert result["applied"] == list(range(2, SCHEMA_VERSION + 1))
+    assert (
+        query(old_db, "SELECT sum(visits) FROM visit_daily_rollups")[0][0]
+        == query(old_db, "SELECT count(*) FROM visits")[0][0]
+    )
+
+
+def test_partition_bounds_backfilled_from_archives(old_db):
+    # Посещения в базе - с 2024-12-24 по 2025-01-08: декабрьская секция уходит в архив
+    migrate(old_db, archive_now="2025-01-20")
+    expected = query(old_db, "SELECT key, min_id, max_id FROM visit_partitions WHERE state = 'archived'")
+    assert [key for key, _, _ in expected] == ["2024-12"]
+    # База версии 5 с теми же архивами: до шестой миграции каталог секций не хранил границы id
+    with sqlite3.connect(old_db) as conn:
+        conn.execute("ALTER TABLE visit_partitions DROP COLUMN min_id")
+        conn.execute("ALTER TABLE visit_partitions DROP COLUMN max_id")
+        conn.execute("PRAGMA user_version = 5")
+
+    assert migrate(old_db)["applied"] == [6]
+
+    assert query(old_db, "SELECT key, min_id, max_id FROM visit_partitions WHERE state = 'archived'") == expected
+
+
+def schema(db_path):
+    tables = [name for (name,) in query(db_path, "SELECT name FROM sqlite_master WHERE type = 'table'")]
+    # ALTER TABLE добавляет колонки в конец, поэтому порядок колонок не сравнивается
+    return {
+        table: (
+            sorted(row[1:] for row in query(db_path, f"PRAGMA table_info({table})")),
+            sorted(row[1:] for row in query(db_path, f"PRAGMA index_list({table})")),
+        )
+        for table in tables
+    }
+
+
+def test_migrated_schema_matches_models(tmp_path):
+    from sqlalchemy import create_engine
+
+    from backend.db_models import Base
+
+    models_db = tmp_path / "models.db"
+    engine = create_engine(f"sqlite:///{models_db}")
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+    migrated_db = tmp_path / "migrated.db"
+
+    migrate(migrated_db)
+
+    # Изменение модели без новой миграции здесь и обнаружится
+    assert schema(migrated_db) == schema(models_db)
+
+
+def test_baseline_does_not_follow_models(tmp_path):
+    fresh_db = tmp_path / "fresh.db"
+
+    migrate(fresh_db, upto=1)
+
+    # Таблицы и колонки следующих миграций миграция 1 не создает
+    tables = set(schema(fresh_db))
+    assert not {"visit_daily_sketches", "collected_events", "revoked_tokens"} & tables
+    assert not {"min_id", "max_id"} & columns(fresh_db, "visit_partitions")
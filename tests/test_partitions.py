@@ -0,0 +1,72 @@
+import tracemalloc
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend.partitions import (
+    LEGACY_ARCHIVE_MAGIC, ArchivedVisit, _pack_group, iter_archive, read_archive, write_archive,
+)
+
+ROWS = 60000
+GROUP_ROWS = 3000
+START = datetime(2025, 1, 1)
+
+
+def visits(count):
+    for i in range(count):
+        yield ArchivedVisit(
+            i + 1, f"/page/{i % 50}", None if i % 3 else "https://example.com/", "Mozilla/5.0",
+            START + timedelta(seconds=i),
+        )
+
+
+def make_archive(directory, count):
+    path = str(directory / f"visits_{count}.kkov")
+    # Строки передаются генератором: запись тоже не собирает секцию в список
+    assert write_archive(path, visits(count), group_rows=GROUP_ROWS) == (count, 1, count)
+    return path
+
+
+@pytest.fixture(scope="module")
+def archive(tmp_path_factory):
+    return make_archive(tmp_path_factory.mktemp("archive"), ROWS)
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def streamed_peak(path):
+    def consume():
+        for _ in iter_archive(path):
+            pass
+
+    return peak_memory(consume)
+
+
+def test_streaming_read_is_bounded_by_group_size(archive, tmp_path):
+    small = make_archive(tmp_path, 2 * GROUP_ROWS)
+
+    # В 10 раз больше групп, а пик памяти почти тот же: в памяти одна группа
+    # (плюс постоянный буфер словаря lzma), чтение целиком растет вместе с секцией
+    assert streamed_peak(archive) < 1.5 * streamed_peak(small)
+
+
+def test_groups_round_trip_in_both_directions(archive):
+    rows = list(iter_archive(archive))
+    assert rows == list(visits(ROWS))
+    assert list(iter_archive(archive, descending=True)) == rows[::-1]
+
+
+def test_legacy_single_group_archive_is_readable(tmp_path):
+    # Архив первой версии - заголовок и колонки всей секции одной группой
+    rows = list(visits(10))
+    path = tmp_path / "visits_2024-12.kkov"
+    path.write_bytes(LEGACY_ARCHIVE_MAGIC + _pack_group(rows))
+
+    assert read_archive(str(path)) == rows
@@ -0,0 +1,72 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from backend.password_utils import HashingPool, HashingPoolBusy
+
+
+def wait_idle(pool, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while pool.stats()["in_flight"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return pool.stats()["in_flight"]
+
+
+@pytest.fixture
+def blocked_pool():
+    """
+    Пул с одним потоком и местом в очереди на одну задачу; поток занят до gate.set().
+    """
+    pool = HashingPool(workers=1, queue_limit=1, name="bcrypt-test")
+    gate = threading.Event()
+    running = pool.submit("hash", gate.wait)
+    yield pool, gate
+    gate.set()
+    running.result(timeout=5)
+
+
+def test_saturated_pool_rejects_immediately(blocked_pool):
+    pool, gate = blocked_pool
+    queued = pool.submit("hash", str.upper, "a")
+
+    with pytest.raises(HashingPoolBusy):
+        pool.submit("hash", str.upper, "b")
+
+    assert pool.stats()["rejected"] == 1
+    gate.set()
+    assert queued.result(timeout=5) == "A"
+    assert wait_idle(pool) == 0
+
+
+def test_cancelled_waiting_job_releases_its_slot(blocked_pool):
+    pool, gate = blocked_pool
+
+    async def abandoned_request():
+        waiter = asyncio.ensure_future(asyncio.wrap_future(pool.submit("verify", str.upper, "x")))
+        await asyncio.sleep(0)
+        # Клиент отключился: ожидание отменяется вместе с еще не начатой задачей
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    asyncio.run(abandoned_request())
+    gate.set()
+
+    assert wait_idle(pool) == 0
+    # Освободившиеся места снова доступны
+    assert pool.submit("hash", str.upper, "y").result(timeout=5) == "Y"
+
+
+def test_batch_is_admitted_whole_or_not_at_all(blocked_pool):
+    pool, gate = blocked_pool
+
+    with pytest.raises(HashingPoolBusy):
+        pool.submit_batch("bulk_hash", str.upper, ["a", "b"])
+
+    assert pool.stats()["in_flight"] == 1
+    futures = pool.submit_batch("bulk_hash", str.upper, ["c"])
+    gate.set()
+    assert [future.result(timeout=5) for future in futures] == ["C"]
+    assert wait_idle(pool) == 0
@@ -0,0 +1,54 @@
+from jose import jwt
+
+from backend import db_models, schemas
+from backend.auth import ALGORITHM, SECRET_KEY
+from backend.database import run_write
+from backend.user_cache import token_cache
+
+from test_tokens import bearer, login, refresh
+
+
+def me(client, token):
+    return client.get("/api/users/me", headers=bearer(token))
+
+
+def test_rotation_keeps_cached_tokens(client, make_user):
+    first = login(client, *make_user())
+    second = login(client, *make_user())
+    assert me(client, first["access_token"]).status_code == 200
+    generation = token_cache.generation
+
+    # Ротация чужого семейства не сбрасывает кэш: токен продолжает проверяться без базы
+    assert refresh(client, second).status_code == 200
+    hits = token_cache.hits
+    assert me(client, first["access_token"]).status_code == 200
+
+    assert token_cache.generation == generation
+    assert token_cache.hits == hits + 1
+
+
+def test_role_change_invalidates_cached_user(client, make_user):
+    username, password = make_user("manager")
+    token = login(client, username, password)["access_token"]
+    assert me(client, token).json()["role"] == "manager"
+
+    def promote(db):
+        db.query(db_models.User).filter_by(username=username).one().role = db_models.UserRole.ADMIN
+        db.commit()
+
+    run_write(promote)
+
+    assert me(client, token).json()["role"] == "admin"
+
+
+def test_revoked_family_is_rejected_on_cache_hit(client, make_user):
+    tokens = login(client, *make_user())
+    token = tokens["access_token"]
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    user = schemas.User.model_validate(me(client, token).json())
+    assert client.post("/api/token/revoke", json={"refresh_token": tokens["refresh_token"]}).status_code == 204
+
+    # Запрос, начатый до отзыва, кладет в кэш уже отозванное семейство
+    token_cache.put(token, user, payload["exp"], payload["fam"])
+
+    assert me(client, token).status_code == 401
@@ -0,0 +1,68 @@
+def login(client, username, password):
+    response = client.post("/api/token", data={"username": username, "password": password})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def refresh(client, tokens):
+    return client.post("/api/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+
+
+def test_refresh_rotates_token_pair(client, make_user):
+    tokens = login(client, *make_user())
+
+    response = refresh(client, tokens)
+    assert response.status_code == 200
+    rotated = response.json()
+    assert rotated["refresh_token"] != tokens["refresh_token"]
+    assert client.get("/api/users/me", headers=bearer(rotated["access_token"])).status_code == 200
+
+
+def test_refresh_token_is_not_an_access_token(client, make_user):
+    tokens = login(client, *make_user())
+
+    assert client.get("/api/users/me", headers=bearer(tokens["refresh_token"])).status_code == 401
+    assert client.post("/api/token/refresh", json={"refresh_token": tokens["access_token"]}).status_code == 401
+
+
+def test_refresh_token_reuse_revokes_family(client, make_user):
+    tokens = login(client, *make_user())
+    rotated = refresh(client, tokens).json()
+    # Токен уже в кэше проверенных: отзыв семейства должен его сбросить
+    assert client.get("/api/users/me", headers=bearer(rotated["access_token"])).status_code == 200
+
+    # Повторное предъявление использованного refresh-токена - признак утечки
+    assert refresh(client, tokens).status_code == 401
+
+    assert client.get("/api/users/me", headers=bearer(tokens["access_token"])).status_code == 401
+    assert client.get("/api/users/me", headers=bearer(rotated["access_token"])).status_code == 401
+    assert refresh(client, rotated).status_code == 401
+
+
+def test_reuse_does_not_revoke_other_families(client, make_user):
+    username, password = make_user()
+    leaked = login(client, username, password)
+    other_device = login(client, username, password)
+    refresh(client, leaked)
+
+    assert refresh(client, leaked).status_code == 401
+
+    assert client.get("/api/users/me", headers=bearer(other_device["access_token"])).status_code == 200
+    assert refresh(client, other_device).status_code == 200
+
+
+def test_logout_revokes_family(client, make_user):
+    tokens = login(client, *make_user())
+    assert client.get("/api/users/me", headers=bearer(tokens["access_token"])).status_code == 200
+
+    response = client.post("/api/token/revoke", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 204
+
+    assert client.get("/api/users/me", headers=bearer(tokens["access_token"])).status_code == 401
+    assert refresh(client, tokens).status_code == 401
+    # Повторный выход не ошибка
+    assert client.post("/api/token/revoke", json={"refresh_token": tokens["refresh_token"]}).status_code == 204
@@ -0,0 +1,130 @@
+import os
+
+import pytest
+
+from backend.videos import VIDEO_DIR
+
+SIZE = 10240
+DATA = bytes(range(256)) * (SIZE // 256)
+URL = "/api/videos/clip.mp4"
+
+
+@pytest.fixture(scope="module", autouse=True)
+def video_file():
+    path = os.path.join(VIDEO_DIR, "clip.mp4")
+    with open(path, "wb") as file:
+        file.write(DATA)
+    yield path
+    os.remove(path)
+
+
+def get_range(client, value, **headers):
+    return client.get(URL, headers={"range": value, **headers})
+
+
+def test_full_file_advertises_ranges(client):
+    response = client.get(URL)
+
+    assert response.status_code == 200
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["content-length"] == str(SIZE)
+    assert response.content == DATA
+
+
+@pytest.mark.parametrize("value, start, end", [
+    ("bytes=100-199", 100, 199),
+    ("bytes=10000-", 10000, SIZE - 1),
+    ("bytes=10239-10239", SIZE - 1, SIZE - 1),
+    # Конец за пределами файла обрезается по размеру
+    ("bytes=10000-99999", 10000, SIZE - 1),
+])
+def test_single_range(client, value, start, end):
+    response = get_range(client, value)
+
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes {start}-{end}/{SIZE}"
+    assert response.content == DATA[start:end + 1]
+
+
+def test_suffix_range(client):
+    response = get_range(client, "bytes=-100")
+
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes {SIZE - 100}-{SIZE - 1}/{SIZE}"
+    assert response.content == DATA[-100:]
+
+
+def test_suffix_longer_than_file_selects_whole_file(client):
+    response = get_range(client, f"bytes=-{SIZE * 2}")
+
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 0-{SIZE - 1}/{SIZE}"
+    assert response.content == DATA
+
+
+@pytest.mark.parametrize("value", [f"bytes={SIZE}-", "bytes=20000-30000", "bytes=-0"])
+def test_unsatisfiable_range_is_416(client, value):
+    response = get_range(client, value)
+
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{SIZE}"
+
+
+def test_unsatisfiable_part_of_range_set_is_dropped(client):
+    response = get_range(client, "bytes=0-9, 20000-")
+
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 0-9/{SIZE}"
+    assert response.content == DATA[:10]
+
+
+@pytest.mark.parametrize("value", ["bytes=abc", "bytes=5-2"])
+def test_malformed_range_is_400(client, value):
+    assert get_range(client, value).status_code == 400
+
+
+def test_unknown_range_unit_is_ignored(client):
+    response = get_range(client, "items=0-1")
+
+    assert response.status_code == 200
+    assert response.content == DATA
+
+
+def test_multiple_ranges_are_multipart(client):
+    response = get_range(client, "bytes=0-9, 100-109")
+
+    assert response.status_code == 206
+    assert "content-range" not in response.headers
+    content_type, _, boundary = response.headers["content-type"].partition("; boundary=")
+    assert content_type == "multipart/byteranges"
+    expected = (
+        f"--{boundary}\r\nContent-Type: video/mp4\r\nContent-Range: bytes 0-9/{SIZE}\r\n\r\n".encode()
+        + DATA[:10]
+        + f"\r\n--{boundary}\r\nContent-Type: video/mp4\r\nContent-Range: bytes 100-109/{SIZE}\r\n\r\n".encode()
+        + DATA[100:110]
+        + f"\r\n--{boundary}--\r\n".encode()
+    )
+    assert response.content == expected
+    assert response.headers["content-length"] == str(len(expected))
+
+    head = client.head(URL, headers={"range": "bytes=0-9, 100-109"})
+    assert head.status_code == 206
+    assert head.headers["content-length"] == str(len(expected))
+    assert head.content == b""
+
+
+def test_overlapping_ranges_are_merged(client):
+    response = get_range(client, "bytes=0-9, 5-19")
+
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 0-19/{SIZE}"
+    assert response.content == DATA[:20]
+
+
+def test_if_range_with_stale_etag_returns_whole_file(client):
+    etag = client.get(URL).headers["etag"]
+
+    assert get_range(client, "bytes=0-9", **{"if-range": etag}).status_code == 206
+    stale = get_range(client, "bytes=0-9", **{"if-range": '"outdated"'})
+    assert stale.status_code == 200
+    assert stale.content == DATA
@@ -0,0 +1,20 @@
+import os
+import stat
+
+from backend.auth import SECRET_KEY
+from backend.visitors import VISITOR_SALT, load_salt
+
+
+def test_salt_is_generated_once_and_persisted(tmp_path):
+    path = str(tmp_path / "kko_site.visitor_salt")
+
+    salt = load_salt(path)
+
+    # Перезапуск и другие воркеры читают ту же соль
+    assert load_salt(path) == salt
+    assert len(salt) == 64
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+
+def test_salt_does_not_fall_back_to_secret_key():
+    assert VISITOR_SALT != SECRET_KEY.encode()